@@ -4,20 +4,22 @@
 import pandas as pd
 import numpy as np
 import datetime as dt
-import wrds
+from offline_wrds import connect
 from dateutil.relativedelta import *
 from pandas.tseries.offsets import *
 import pyarrow.feather as feather
 import sqlite3
+from instrument import stage, count
 
 ###################
 # Connect to WRDS #
 ###################
-conn = wrds.Connection()
+conn = connect()
 
 ###################
 # Compustat Block #
 ###################
+stage('fetch comp.fundq and ccm link')
 comp = conn.raw_sql("""
                     select gvkey, datadate, rdq, fyearq, fqtr
                     from comp.fundq
@@ -47,6 +49,9 @@ ccm['linkenddt'] = pd.to_datetime(ccm['linkenddt'])
 # if linkenddt is missing then set to today date
 ccm['linkenddt'] = ccm['linkenddt'].fillna(pd.to_datetime('today'))
 
+count(len(comp))
+
+stage('merge ccm')
 ccm1 = pd.merge(comp, ccm, how='left', on=['gvkey'])
 # extract month and year of rdq
 ccm1['rdq'] = pd.to_datetime(ccm1['rdq'])
@@ -60,6 +65,7 @@ ccm2 = ccm2[['gvkey', 'datadate', 'rdq', 'fyearq', 'fqtr', 'permno']]
 ###################
 
 # Report Date of Quarterly Earnings (rdq) may not be trading day, we need to get the first trading day on or after rdq
+stage('fetch crsp.dsf')
 crsp_dsi = conn.raw_sql("""
                         select distinct date
                         from crsp.dsi
@@ -136,6 +142,9 @@ crspsp500d = conn.raw_sql("""
 
 crspsp500d['date'] = pd.to_datetime(crspsp500d['date'])
 
+count(len(crsp_d))
+
+stage('abnormal return', rows=len(crsp_d))
 # abnormal return
 crsp_d = pd.merge(crsp_d, crspsp500d, how='left', on='date')
 crsp_d['abrd'] = crsp_d['retadj'] - crsp_d['sprtrn']
@@ -200,6 +209,8 @@ df = df[['gvkey', 'permno', 'datadate', 'rdq', 'rdq_plus_1d', 'abr']]
 
 print('='*10, 'start populate', '='*10)
 
+stage('populate to monthly', rows=len(df))
+
 # populate the quarterly abr to monthly
 crsp_msf = conn.raw_sql("""
                         select distinct date
@@ -235,5 +246,6 @@ df['rdq_plus_1d'] = pd.to_datetime(df['rdq_plus_1d'])
 df = df[['gvkey', 'permno', 'datadate', 'rdq', 'rdq_plus_1d', 'abr', 'date']]
 df = df.dropna(subset=['date'])  # some firm will have records that report date is far away from actual datadate
 
+stage('write')
 with open('abr.feather', 'wb') as f:
     feather.write_feather(df, f)
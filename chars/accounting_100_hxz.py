@@ -1,53 +1,21 @@
 import pandas as pd
 import numpy as np
-import wrds
+from offline_wrds import connect
 from pandas.tseries.offsets import *
 import pyarrow.feather as feather
 from functions import *
+from panel import *
+from instrument import stage, count
 
 ###################
 # Connect to WRDS #
 ###################
-conn = wrds.Connection()
+conn = connect()
 print(f"Connected to WRDS successfully!")
-#######################################################################################################################
-#                                                    TTM functions                                                    #
-#######################################################################################################################
-
-
-def ttm4(series, df):
-    """
-
-    :param series: variables' name
-    :param df: dataframe
-    :return: ttm4
-    """
-    lag = pd.DataFrame()
-    for i in range(1, 4):
-        lag['%(series)s%(lag)s' % {'series': series, 'lag': i}] = df.groupby('permno')['%s' % series].shift(i)
-    result = df['%s' % series] + lag['%s1' % series] + lag['%s2' % series] + lag['%s3' % series]
-    return result
-
-
-def ttm12(series, df):
-    """
-
-    :param series: variables' name
-    :param df: dataframe
-    :return: ttm12
-    """
-    lag = pd.DataFrame()
-    for i in range(1, 12):
-        lag['%(series)s%(lag)s' % {'series': series, 'lag': i}] = df.groupby('permno')['%s' % series].shift(i)
-    result = df['%s' % series] + lag['%s1' % series] + lag['%s2' % series] + lag['%s3' % series] + \
-             lag['%s4' % series] + lag['%s5' % series] + lag['%s6' % series] + lag['%s7' % series] + \
-             lag['%s8' % series] + lag['%s9' % series] + lag['%s10' % series] + lag['%s11' % series]
-    return result
-
-
 #######################################################################################################################
 #                                                  Compustat Block                                                    #
 #######################################################################################################################
+stage('fetch comp.funda')
 comp = conn.raw_sql("""
                     /*header info*/
                     select c.gvkey, f.cusip, f.datadate, f.fyear, c.cik, substr(c.sic,1,2) as sic2, c.sic, c.naics,
@@ -120,9 +88,12 @@ comp['ceq'] = np.where(comp['ceq'] == 0, np.nan, comp['ceq'])
 comp['at'] = np.where(comp['at'] == 0, np.nan, comp['at'])
 comp = comp.dropna(subset=['at']).reset_index(drop=True)
 
+count(len(comp))
+
 #######################################################################################################################
 #                                                       CRSP Block                                                    #
 #######################################################################################################################
+stage('fetch crsp.msf')
 # Create a CRSP Subsample with Monthly Stock and Event Variables
 # Restrictions will be applied later
 # Select variables from the CRSP monthly stock and event datasets
@@ -175,9 +146,12 @@ crsp2 = pd.merge(crsp1, crsp_summe, how='inner', on=['monthend', 'permco']).rese
 # sort by permno and date and also drop duplicates
 crsp2 = crsp2.sort_values(by=['permno', 'monthend']).drop_duplicates().reset_index(drop=True)
 
+count(len(crsp2))
+
 #######################################################################################################################
 #                                                        CCM Block                                                    #
 #######################################################################################################################
+stage('fetch ccm link and merge annual')
 # merge CRSP and Compustat
 # reference: https://wrds-www.wharton.upenn.edu/pages/support/applications/linking-databases/linking-crsp-and-compustat/
 ccm = conn.raw_sql("""
@@ -236,6 +210,9 @@ data_rawa = data_rawa[data_rawa['temp'].notna()].reset_index(drop=True)
 
 data_rawa = data_rawa.sort_values(by=['permno', 'jdate']).reset_index(drop=True)
 
+# firm boundaries of the annual panel for its lags (see panel.py)
+panel_a = Panel(data_rawa['permno'])
+
 # fama-french 49 industry
 data_rawa['sic'] = data_rawa['sic'].astype(int)
 data_rawa['ffi49'] = ffi49(data_rawa)
@@ -244,6 +221,7 @@ data_rawa['ffi49'] = data_rawa['ffi49'].astype(int)
 #######################################################################################################################
 #                                                  Annual Variables                                                   #
 #######################################################################################################################
+stage('annual variables', rows=len(data_rawa))
 # preferrerd stock
 data_rawa['ps'] = np.where(data_rawa['pstkrv'].isnull(), data_rawa['pstkl'], data_rawa['pstkrv'])
 data_rawa['ps'] = np.where(data_rawa['ps'].isnull(), data_rawa['pstk'], data_rawa['ps'])
@@ -256,9 +234,7 @@ data_rawa['be'] = data_rawa['seq'] + data_rawa['txditc'] - data_rawa['ps']
 data_rawa['be'] = np.where(data_rawa['be'] > 0, data_rawa['be'], np.nan)
 
 # acc
-data_rawa['act_l1'] = data_rawa.groupby(['permno'])['act'].shift(1)
-data_rawa['lct_l1'] = data_rawa.groupby(['permno'])['lct'].shift(1)
-data_rawa['at_l1'] = data_rawa.groupby(['permno'])['at'].shift(1)
+data_rawa[['act_l1', 'lct_l1', 'at_l1']] = panel_a.lag(data_rawa, ['act', 'lct', 'at'])
 
 # #################### Add np lag (also fixed row 272 below) on 2025.02.23 ####################
 # data_rawa['np_l1'] = data_rawa.groupby(['permno'])['np'].shift(1) 
@@ -273,9 +249,7 @@ data_rawa['at_l1'] = data_rawa.groupby(['permno'])['at'].shift(1)
 #                                       (data_rawa['act_l1'] - data_rawa['lct_l1'] + data_rawa['np_l1'])) / (data_rawa['be']))
 
 #################### Add Sloan(1996) or HXZ and GHZ operating accruals on 2025.02.28 ####################
-data_rawa['che_l1'] = data_rawa.groupby(['permno'])['che'].shift(1)
-data_rawa['dlc_l1'] = data_rawa.groupby(['permno'])['dlc'].shift(1)
-data_rawa['txp_l1'] = data_rawa.groupby(['permno'])['txp'].shift(1)
+data_rawa[['che_l1', 'dlc_l1', 'txp_l1']] = panel_a.lag(data_rawa, ['che', 'dlc', 'txp'])
 
 data_rawa['acc'] = np.where(data_rawa['oancf'].isnull(),
                             ((data_rawa['act'] - data_rawa['act_l1']) - (data_rawa['che'] - data_rawa['che_l1']) -
@@ -303,8 +277,7 @@ data_rawa['agr'] = (data_rawa['at'] - data_rawa['at_l1']) / data_rawa['at_l1']
 # data_rawa['ep'] = data_rawa['ib']/data_rawa['me']
 
 # ni
-data_rawa['csho_l1'] = data_rawa.groupby(['permno'])['csho'].shift(1)
-data_rawa['ajex_l1'] = data_rawa.groupby(['permno'])['ajex'].shift(1)
+data_rawa[['csho_l1', 'ajex_l1']] = panel_a.lag(data_rawa, ['csho', 'ajex'])
 data_rawa['ni'] = np.where(data_rawa['gvkey'] != data_rawa['gvkey'].shift(1),
                            np.nan,
                            np.log(data_rawa['csho'] * data_rawa['ajex']).replace(-np.inf, 0) -
@@ -321,7 +294,7 @@ data_rawa['op'] = np.select(condlist, choicelist,
                             default=(data_rawa['revt'] - data_rawa['cogs0'] - data_rawa['xsga0'] - data_rawa['xint0']) / data_rawa['be'])
 
 # rsup
-data_rawa['sale_l1'] = data_rawa.groupby(['permno'])['sale'].shift(1)
+data_rawa['sale_l1'] = panel_a.lag(data_rawa, 'sale')
 # data_rawa['rsup'] = (data_rawa['sale']-data_rawa['sale_l1'])/data_rawa['me']
 
 # cash
@@ -350,7 +323,7 @@ data_rawa['gma'] = (data_rawa['revt'] - data_rawa['cogs']) / data_rawa['at_l1']
 data_rawa['chcsho'] = (data_rawa['csho'] / data_rawa['csho_l1']) - 1
 
 # lgr
-data_rawa['lt_l1'] = data_rawa.groupby(['permno'])['lt'].shift(1)
+data_rawa['lt_l1'] = panel_a.lag(data_rawa, 'lt')
 data_rawa['lgr'] = (data_rawa['lt'] / data_rawa['lt_l1']) - 1
 
 #################### Follow Hafzalla, Lundholm, and Van Winkle (2011) and GHZ on 2025.02.28 ####################
@@ -372,12 +345,12 @@ data_rawa['pctacc'] = np.select(condlist, choicelist,
 data_rawa['sgr'] = (data_rawa['sale'] / data_rawa['sale_l1']) - 1
 
 # chato
-data_rawa['at_l2'] = data_rawa.groupby(['permno'])['at'].shift(2)
+data_rawa['at_l2'] = panel_a.lag(data_rawa, 'at', 2)
 data_rawa['chato'] = (data_rawa['sale'] / ((data_rawa['at'] + data_rawa['at_l1']) / 2)) - \
                      (data_rawa['sale_l1'] / ((data_rawa['at'] + data_rawa['at_l2']) / 2))
 
 # chtx
-data_rawa['txt_l1'] = data_rawa.groupby(['permno'])['txt'].shift(1)
+data_rawa['txt_l1'] = panel_a.lag(data_rawa, 'txt')
 data_rawa['chtx'] = (data_rawa['txt'] - data_rawa['txt_l1']) / data_rawa['at_l1']
 
 # noa
@@ -386,7 +359,7 @@ data_rawa['noa'] = ((data_rawa['at'] - data_rawa['che'] - data_rawa['ivao'].fill
                      - data_rawa['pstk'].fillna(0) - data_rawa['ceq']) / data_rawa['at_l1'])
 
 # rna
-data_rawa['noa_l1'] = data_rawa.groupby(['permno'])['noa'].shift(1)
+data_rawa['noa_l1'] = panel_a.lag(data_rawa, 'noa')
 data_rawa['rna'] = data_rawa['oiadp'] / data_rawa['noa_l1']
 
 # pm
@@ -399,15 +372,14 @@ data_rawa['ato'] = data_rawa['sale'] / data_rawa['noa_l1']
 data_rawa['depr'] = data_rawa['dp'] / data_rawa['ppent']
 
 # invest
-data_rawa['ppent_l1'] = data_rawa.groupby(['permno'])['ppent'].shift(1)
-data_rawa['invt_l1'] = data_rawa.groupby(['permno'])['invt'].shift(1)
+data_rawa[['ppent_l1', 'invt_l1']] = panel_a.lag(data_rawa, ['ppent', 'invt'])
 
 data_rawa['invest'] = np.where(data_rawa['ppegt'].isnull(), ((data_rawa['ppent'] - data_rawa['ppent_l1']) +
                                                              (data_rawa['invt'] - data_rawa['invt_l1'])) / data_rawa['at_l1'],
                                ((data_rawa['ppegt'] - data_rawa['ppent_l1']) + (data_rawa['invt'] - data_rawa['invt_l1'])) / data_rawa['at_l1'])
 
 # egr
-data_rawa['ceq_l1'] = data_rawa.groupby(['permno'])['ceq'].shift(1)
+data_rawa['ceq_l1'] = panel_a.lag(data_rawa, 'ceq')
 data_rawa['egr'] = ((data_rawa['ceq'] - data_rawa['ceq_l1']) / data_rawa['ceq_l1'])
 
 # cashdebt
@@ -416,7 +388,7 @@ data_rawa['cashdebt'] = (data_rawa['ib'] + data_rawa['dp']) / ((data_rawa['lt']
 # rd
 # if ((xrd/at)-(lag(xrd/lag(at))))/(lag(xrd/lag(at))) >.05 then rd=1 else rd=0
 data_rawa['xrd/at_l1'] = data_rawa['xrd0']/data_rawa['at_l1']
-data_rawa['xrd/at_l1_l1'] = data_rawa.groupby(['permno'])['xrd/at_l1'].shift(1)
+data_rawa['xrd/at_l1_l1'] = panel_a.lag(data_rawa, 'xrd/at_l1')
 data_rawa['rd'] = np.where(((data_rawa['xrd0']/data_rawa['at'])-
                             (data_rawa['xrd/at_l1_l1']))/data_rawa['xrd/at_l1_l1']>0.05, 1, 0)
 
@@ -442,41 +414,41 @@ data_rawa['pchsale_pchinvt'] = ((data_rawa['sale'] - data_rawa['sale_l1']) / dat
                                - ((data_rawa['invt'] - data_rawa['invt_l1']) / data_rawa['invt_l1'])
 
 # pchsale_pchrect
-data_rawa['rect_l1'] = data_rawa.groupby(['permno'])['rect'].shift(1)
+data_rawa['rect_l1'] = panel_a.lag(data_rawa, 'rect')
 data_rawa['pchsale_pchrect'] = ((data_rawa['sale'] - data_rawa['sale_l1']) / data_rawa['sale_l1']) \
                                - ((data_rawa['rect'] - data_rawa['rect_l1']) / data_rawa['rect_l1'])
 
 # pchgm_pchsale
-data_rawa['cogs_l1'] = data_rawa.groupby(['permno'])['cogs'].shift(1)
+data_rawa['cogs_l1'] = panel_a.lag(data_rawa, 'cogs')
 data_rawa['pchgm_pchsale'] = (((data_rawa['sale'] - data_rawa['cogs'])
                                - (data_rawa['sale_l1'] - data_rawa['cogs_l1'])) / (data_rawa['sale_l1'] - data_rawa['cogs_l1'])) \
                              - ((data_rawa['sale'] - data_rawa['sale_l1']) / data_rawa['sale'])
 
 # pchsale_pchxsga
-data_rawa['xsga_l1'] = data_rawa.groupby(['permno'])['xsga'].shift(1)
+data_rawa['xsga_l1'] = panel_a.lag(data_rawa, 'xsga')
 data_rawa['pchsale_pchxsga'] = ((data_rawa['sale'] - data_rawa['sale_l1']) / data_rawa['sale_l1']) \
                                - ((data_rawa['xsga'] - data_rawa['xsga_l1']) / data_rawa['xsga_l1'])
 
 # pchdepr
-data_rawa['dp_l1'] = data_rawa.groupby(['permno'])['dp'].shift(1)
+data_rawa['dp_l1'] = panel_a.lag(data_rawa, 'dp')
 data_rawa['pchdepr'] = ((data_rawa['dp'] / data_rawa['ppent']) - (data_rawa['dp_l1']
                                                                   / data_rawa['ppent_l1'])) \
                        / (data_rawa['dp_l1'] / data_rawa['ppent'])
 
 # chadv
-data_rawa['xad_l1'] = data_rawa.groupby(['permno'])['xad'].shift(1)
+data_rawa['xad_l1'] = panel_a.lag(data_rawa, 'xad')
 data_rawa['chadv'] = np.log(data_rawa['xad'] + 1) - np.log(data_rawa['xad_l1'] + 1)
 
 # pchcapx
-data_rawa['capx_l1'] = data_rawa.groupby(['permno'])['capx'].shift(1)
+data_rawa['capx_l1'] = panel_a.lag(data_rawa, 'capx')
 data_rawa['pchcapx'] = (data_rawa['capx'] - data_rawa['capx_l1']) / data_rawa['capx_l1']
 
 # grcapx
-data_rawa['capx_l2'] = data_rawa.groupby(['permno'])['capx'].shift(2)
+data_rawa['capx_l2'] = panel_a.lag(data_rawa, 'capx', 2)
 data_rawa['grcapx'] = (data_rawa['capx'] - data_rawa['capx_l2']) / data_rawa['capx_l2']
 
 # grGW
-data_rawa['gdwl_l1'] = data_rawa.groupby(['permno'])['gdwl'].shift(1)
+data_rawa['gdwl_l1'] = panel_a.lag(data_rawa, 'gdwl')
 data_rawa['grGW'] = (data_rawa['gdwl'] - data_rawa['gdwl_l1']) / data_rawa['gdwl']
 condlist = [(data_rawa['gdwl'] == 0) | (data_rawa['gdwl'].isnull()),
             (data_rawa['gdwl'].notna()) & (data_rawa['gdwl'] != 0) & (data_rawa['grGW'].isnull())]
@@ -520,17 +492,12 @@ data_rawa['realestate'] = np.where(data_rawa['ppegt'].isnull(),
 data_rawa['obklg'] = data_rawa['ob'] / ((data_rawa['at'] + data_rawa['at_l1']) / 2)
 
 # chobklg
-data_rawa['ob_l1'] = data_rawa.groupby(['permno'])['ob'].shift(1)
+data_rawa['ob_l1'] = panel_a.lag(data_rawa, 'ob')
 data_rawa['chobklg'] = (data_rawa['ob'] - data_rawa['ob_l1']) / ((data_rawa['at'] + data_rawa['at_l1']) / 2)
 
 # grltnoa
-data_rawa['aco_l1'] = data_rawa.groupby(['permno'])['aco'].shift(1)
-data_rawa['intan_l1'] = data_rawa.groupby(['permno'])['intan'].shift(1)
-data_rawa['ao_l1'] = data_rawa.groupby(['permno'])['ao'].shift(1)
-data_rawa['ap_l1'] = data_rawa.groupby(['permno'])['ap'].shift(1)
-data_rawa['lco_l1'] = data_rawa.groupby(['permno'])['lco'].shift(1)
-data_rawa['lo_l1'] = data_rawa.groupby(['permno'])['lo'].shift(1)
-data_rawa['rect_l1'] = data_rawa.groupby(['permno'])['rect'].shift(1)
+data_rawa[['aco_l1', 'intan_l1', 'ao_l1', 'ap_l1', 'lco_l1', 'lo_l1', 'rect_l1']] = \
+    panel_a.lag(data_rawa, ['aco', 'intan', 'ao', 'ap', 'lco', 'lo', 'rect'])
 
 data_rawa['grltnoa'] = ((data_rawa['rect']+data_rawa['invt']+data_rawa['ppent']+data_rawa['aco']+data_rawa['intan']+
                        data_rawa['ao']-data_rawa['ap']-data_rawa['lco']-data_rawa['lo'])
@@ -549,11 +516,11 @@ data_rawa['conv'] = data_rawa['dc']/data_rawa['dltt']
 data_rawa['convind'] = np.where(((data_rawa['dc'].notna()) & (data_rawa['dc'] != 0)) | ((data_rawa['cshrc'].notna()) & (data_rawa['cshrc'] != 0)), 1, 0)
 
 # chdrc
-data_rawa['dr_l1'] = data_rawa.groupby(['permno'])['dr'].shift(1)
+data_rawa['dr_l1'] = panel_a.lag(data_rawa, 'dr')
 data_rawa['chdrc'] = (data_rawa['dr']-data_rawa['dr_l1'])/((data_rawa['at']+data_rawa['at_l1'])/2)
 
 # rdbias
-data_rawa['xrd_l1'] = data_rawa.groupby(['permno'])['xrd0'].shift(1)
+data_rawa['xrd_l1'] = panel_a.lag(data_rawa, 'xrd0')
 data_rawa['rdbias'] = (data_rawa['xrd0']/data_rawa['xrd_l1'])-1-data_rawa['ib']/data_rawa['ceq_l1']
 
 # operprof
@@ -575,7 +542,7 @@ data_rawa['capxint'] = data_rawa['capx']/((data_rawa['at']+data_rawa['at_l1'])/2
 data_rawa['xadint'] = data_rawa['xad']/((data_rawa['at']+data_rawa['at_l1'])/2)
 
 # chpm
-data_rawa['ib_l1'] = data_rawa.groupby(['permno'])['ib'].shift(1)
+data_rawa['ib_l1'] = panel_a.lag(data_rawa, 'ib')
 data_rawa['chpm'] = (data_rawa['ib']/data_rawa['sale'])-(data_rawa['ib_l1']/data_rawa['sale_l1'])
 
 # ala
@@ -588,18 +555,30 @@ data_rawa['ala'] = data_rawa['che']+0.75*(data_rawa['act']-data_rawa['che'])-\
 data_rawa['alm'] = data_rawa['ala']/(data_rawa['at']+data_rawa['prcc_f']*data_rawa['csho']-data_rawa['ceq'])
 
 # hire
-data_rawa['emp_l1'] = data_rawa.groupby(['permno'])['emp'].shift(1)
+data_rawa['emp_l1'] = panel_a.lag(data_rawa, 'emp')
 data_rawa['hire'] = (data_rawa['emp'] - data_rawa['emp_l1'])/data_rawa['emp_l1']
 data_rawa['hire'] = np.where((data_rawa['emp'].isnull()) | (data_rawa['emp_l1'].isnull()), 0, data_rawa['hire'])
 
+# industry sums, means and medians used below (herf, chempia, chpmia, chatoia, Mohanram score, pchcapx_ia),
+# in one pass over the industries instead of a merge for every one of them (see group_stats in panel.py)
+# Note: the computed inputs of this block (hire, chpm, chato, pchcapx, roa, cfroa, xrdint, capxint, xadint) must be
+# set above it, a new characteristic with an industry statistic goes after its input
+ind_a = {'indsale': ('sale', ['datadate', 'ffi49'], 'sum'),
+         'hire_ind': ('hire', ['datadate', 'ffi49'], 'mean'),
+         'chpm_ind': ('chpm', ['datadate', 'ffi49'], 'mean'),
+         'chato_ind': ('chato', ['datadate', 'ffi49'], 'mean'),
+         'pchcapx_ind': ('pchcapx', ['datadate', 'ffi49'], 'mean'),
+         'md_roa': ('roa', ['fyear', 'ffi49'], 'median'),
+         'md_cfroa': ('cfroa', ['fyear', 'ffi49'], 'median'),
+         'md_oancf': ('oancf', ['fyear', 'ffi49'], 'median'),
+         'md_xrdint': ('xrdint', ['fyear', 'ffi49'], 'median'),
+         'md_capxint': ('capxint', ['fyear', 'ffi49'], 'median'),
+         'md_xadint': ('xadint', ['fyear', 'ffi49'], 'median')}
+data_rawa[list(ind_a)] = group_stats(data_rawa, ind_a)
+
 # herf
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['sale'].sum()
-df_temp = df_temp.rename(columns={'sale': 'indsale'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
 data_rawa['herf'] = (data_rawa['sale']/data_rawa['indsale'])*(data_rawa['sale']/data_rawa['indsale'])
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['herf'].sum()
-data_rawa = data_rawa.drop(['herf'], axis=1)
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
+data_rawa['herf'] = group_stats(data_rawa, {'herf': ('herf', ['datadate', 'ffi49'], 'sum')})['herf']
 
 ################## Added on 2022.09.06 ##################
 # age
@@ -609,49 +588,22 @@ data_rawa['age'] = data_rawa['count'].copy()
 # data_rawa['cashpr'] = ((data_rawa['me'] + data_rawa['dltt'] - data_rawa['at']) / data_rawa['che'])
 
 # chempia
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['hire'].mean()
-df_temp = df_temp.rename(columns={'hire': 'hire_ind'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
 data_rawa['chempia'] = data_rawa['hire'] - data_rawa['hire_ind']
 
 # chpmia
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['chpm'].mean()
-df_temp = df_temp.rename(columns={'chpm': 'chpm_ind'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
 data_rawa['chpmia'] = data_rawa['chpm'] - data_rawa['chpm_ind']
 
 # chatoia
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['chato'].mean()
-df_temp = df_temp.rename(columns={'chato': 'chato_ind'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
 data_rawa['chatoia'] = data_rawa['chato'] - data_rawa['chato_ind']
 
 # divi
-data_rawa['dvt_l1'] = data_rawa.groupby(['permno'])['dvt'].shift(1)
+data_rawa['dvt_l1'] = panel_a.lag(data_rawa, 'dvt')
 data_rawa['divi'] = np.where(((data_rawa['dvt'].notna()) & (data_rawa['dvt'] > 0) & ((data_rawa['dvt_l1'] == 0) | (data_rawa['dvt_l1'].isnull()))), 1, 0)
 
 # divo
 data_rawa['divo'] = np.where(((data_rawa['dvt'].isnull()) | (data_rawa['dvt'] == 0) & ((data_rawa['dvt_l1'] > 0) | (data_rawa['dvt_l1'].notna()))), 1, 0)
 
-# Mohanram (2005) score (Annual Related)
-df_temp = data_rawa.groupby(['fyear', 'ffi49'], as_index=False)['roa'].median().rename(columns={'roa': 'md_roa'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['fyear', 'ffi49']).reset_index(drop=True)
-
-df_temp = data_rawa.groupby(['fyear', 'ffi49'], as_index=False)['cfroa'].median().rename(columns={'cfroa': 'md_cfroa'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['fyear', 'ffi49']).reset_index(drop=True)
-
-df_temp = data_rawa.groupby(['fyear', 'ffi49'], as_index=False)['oancf'].median().rename(columns={'oancf': 'md_oancf'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['fyear', 'ffi49']).reset_index(drop=True)
-
-df_temp = data_rawa.groupby(['fyear', 'ffi49'], as_index=False)['xrdint'].median().rename(columns={'xrdint': 'md_xrdint'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['fyear', 'ffi49']).reset_index(drop=True)
-
-df_temp = data_rawa.groupby(['fyear', 'ffi49'], as_index=False)['capxint'].median().rename(columns={'capxint': 'md_capxint'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['fyear', 'ffi49']).reset_index(drop=True)
-
-df_temp = data_rawa.groupby(['fyear', 'ffi49'], as_index=False)['xadint'].median().rename(columns={'xadint': 'md_xadint'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['fyear', 'ffi49']).reset_index(drop=True)
-
+# Mohanram (2005) score (Annual Related), md_roa... above
 data_rawa['m1'] = np.where(data_rawa['roa'] > data_rawa['md_roa'], 1, 0)
 data_rawa['m2'] = np.where(data_rawa['cfroa'] > data_rawa['md_cfroa'], 1, 0)
 data_rawa['m3'] = np.where(data_rawa['oancf'] > data_rawa['md_oancf'], 1, 0)
@@ -660,9 +612,6 @@ data_rawa['m5'] = np.where(data_rawa['capxint'] > data_rawa['md_capxint'], 1, 0)
 data_rawa['m6'] = np.where(data_rawa['xadint'] > data_rawa['md_xadint'], 1, 0)
 
 # pchcapx_ia
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['pchcapx'].mean()
-df_temp = df_temp.rename(columns={'pchcapx': 'pchcapx_ind'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
 data_rawa['pchcapx_ia'] = data_rawa['pchcapx'] - data_rawa['pchcapx_ind']
 
 # secured
@@ -700,9 +649,7 @@ data_rawa['tb_1'] = np.where((data_rawa['txfo'].isnull()) | (data_rawa['txfed'].
                              data_rawa['tb_1'])
 data_rawa['tb_1'] = np.where((((data_rawa['txfo'] + data_rawa['txfed'] > 0) | (data_rawa['txt'] > data_rawa['txdi'])) & data_rawa['ib'] <= 0), 1, data_rawa['tb_1'])
 
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['tb_1'].mean()
-df_temp = df_temp.rename(columns={'tb_1': 'tb_1_ind'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49'])
+data_rawa['tb_1_ind'] = group_stats(data_rawa, {'tb_1_ind': ('tb_1', ['datadate', 'ffi49'], 'mean')})['tb_1_ind']
 data_rawa['tb'] = data_rawa['tb_1'] - data_rawa['tb_1_ind']
 
 print("Finish Annual Variables Calculation! \n")
@@ -715,8 +662,7 @@ data_rawa['opa'] = np.select(condlist, choicelist,
                           default=(data_rawa['revt'] - data_rawa['cogs0'] - data_rawa['xsga0'] + data_rawa['xrd0'])/data_rawa['at'])
 
 # cop from Ball el al. (2016)
-data_rawa['xpp_l1'] = data_rawa.groupby(['permno'])['xpp'].shift(1)
-data_rawa['xacc_l1'] = data_rawa.groupby(['permno'])['xacc'].shift(1)
+data_rawa[['xpp_l1', 'xacc_l1']] = panel_a.lag(data_rawa, ['xpp', 'xacc'])
 
 condlist = [data_rawa['revt'].isnull(), data_rawa['at'].isnull()]
 choicelist = [np.nan, np.nan]
@@ -732,6 +678,7 @@ data_rawa['cop'] = np.select(condlist, choicelist,
 #######################################################################################################################
 #                                              Compustat Quarterly Raw Info                                           #
 #######################################################################################################################
+stage('fetch comp.fundq')
 comp = conn.raw_sql("""
                     /*header info*/
                     select c.gvkey, f.cusip, f.datadate, f.fyearq,  substr(c.sic,1,2) as sic2, c.sic, f.fqtr, f.rdq,
@@ -835,9 +782,13 @@ data_rawq['sic'] = data_rawq['sic'].astype(int)
 data_rawq['ffi49'] = ffi49(data_rawq)
 data_rawq['ffi49'] = data_rawq['ffi49'].fillna(49)
 data_rawq['ffi49'] = data_rawq['ffi49'].astype(int)
+
+# firm boundaries of the quarterly panel for its lags (see panel.py)
+panel_q = Panel(data_rawq['permno'])
 #######################################################################################################################
 #                                                   Quarterly Variables                                               #
 #######################################################################################################################
+stage('quarterly variables', rows=len(data_rawq))
 # prepare be
 data_rawq['beq'] = np.where(data_rawq['seqq']>0, data_rawq['seqq']+data_rawq['txditcq']-data_rawq['pstkq'], np.nan)
 data_rawq['beq'] = np.where(data_rawq['beq']<=0, np.nan, data_rawq['beq'])
@@ -847,23 +798,21 @@ data_rawq['beq'] = np.where(data_rawq['beq']<=0, np.nan, data_rawq['beq'])
 # data_rawq['retdy'] = data_rawq['ret'] - data_rawq['retx']
 # data_rawq['mdivpay'] = data_rawq['retdy']*data_rawq['me_l1']
 #
-# data_rawq['dy'] = ttm12(series='mdivpay', df=data_rawq)/data_rawq['me']
+# data_rawq['dy'] = ttm(data_rawq, ['mdivpay'], 12)['mdivpay']/data_rawq['me']
 
 # chtx
-data_rawq['txtq_l4'] = data_rawq.groupby(['permno'])['txtq'].shift(4)
-data_rawq['atq_l4'] = data_rawq.groupby(['permno'])['atq'].shift(4)
+data_rawq[['txtq_l4', 'atq_l4']] = panel_q.lag(data_rawq, ['txtq', 'atq'], 4)
 data_rawq['chtx'] = (data_rawq['txtq']-data_rawq['txtq_l4'])/data_rawq['atq_l4']
 
 # roa
-data_rawq['atq_l1'] = data_rawq.groupby(['permno'])['atq'].shift(1)
+data_rawq['atq_l1'] = panel_q.lag(data_rawq, 'atq')
 data_rawq['roa'] = data_rawq['ibq']/data_rawq['atq_l1']
 
 # cash
 data_rawq['cash'] = data_rawq['cheq']/data_rawq['atq']
 
 # acc
-data_rawq['actq_l4'] = data_rawq.groupby(['permno'])['actq'].shift(4)
-data_rawq['lctq_l4'] = data_rawq.groupby(['permno'])['lctq'].shift(4)
+data_rawq[['actq_l4', 'lctq_l4']] = panel_q.lag(data_rawq, ['actq', 'lctq'], 4)
 
 # data_rawq['npq_l4'] = data_rawq.groupby(['permno'])['npq'].shift(4)
 # condlist = [data_rawq['npq'].isnull(),
@@ -875,9 +824,7 @@ data_rawq['lctq_l4'] = data_rawq.groupby(['permno'])['lctq'].shift(4)
 #                                    (data_rawq['actq_l4']-data_rawq['lctq_l4']+data_rawq['npq_l4']))/(data_rawq['beq']))
 
 #################### Added Sloan(1996) or HXZ and GHZ operating accruals on 2025.02.28 ####################
-data_rawq['cheq_l4'] = data_rawq.groupby(['permno'])['cheq'].shift(4)
-data_rawq['dlcq_l4'] = data_rawq.groupby(['permno'])['dlcq'].shift(4)
-data_rawq['txpq_l4'] = data_rawq.groupby(['permno'])['txpq'].shift(4)
+data_rawq[['cheq_l4', 'dlcq_l4', 'txpq_l4']] = panel_q.lag(data_rawq, ['cheq', 'dlcq', 'txpq'], 4)
 
 data_rawq['acc'] = np.where(data_rawq['oancfy'].isnull(),
                             ((data_rawq['actq'] - data_rawq['actq_l4']) - (data_rawq['cheq'] - data_rawq['cheq_l4']) -
@@ -891,9 +838,15 @@ data_rawq['absacc'] = abs(data_rawq['acc'])
 # bm
 # data_rawq['bm'] = data_rawq['beq']/data_rawq['me']
 
+# trailing 4 quarters sums of the quarterly items, all of them in one pass over the panel sorted by permno
+data_rawq['xintq0'] = np.where(data_rawq['xintq'].isnull(), 0, data_rawq['xintq'])
+data_rawq['xsgaq0'] = np.where(data_rawq['xsgaq'].isnull(), 0, data_rawq['xsgaq'])
+data_rawq['cogsq0'] = np.where(data_rawq['cogsq'].isnull(), 0, data_rawq['cogsq'])
+ttm4 = ttm(data_rawq, ['ibq', 'dpq', 'revtq', 'cogsq', 'cogsq0', 'xsgaq0', 'xintq0', 'xrdq', 'saleq', 'niq'], 4)
+
 # cfp
-data_rawq['ibq4'] = ttm4('ibq', data_rawq)
-data_rawq['dpq4'] = ttm4('dpq', data_rawq)
+data_rawq['ibq4'] = ttm4['ibq']
+data_rawq['dpq4'] = ttm4['dpq']
 # data_rawq['cfp'] = np.where(data_rawq['dpq'].isnull(),
 #                             data_rawq['ibq4']/data_rawq['me'],
 #                             (data_rawq['ibq4']+data_rawq['dpq4'])/data_rawq['me'])
@@ -905,32 +858,28 @@ data_rawq['dpq4'] = ttm4('dpq', data_rawq)
 data_rawq['agr'] = (data_rawq['atq']-data_rawq['atq_l4'])/data_rawq['atq_l4']
 
 # ni
-data_rawq['cshoq_l4'] = data_rawq.groupby(['permno'])['cshoq'].shift(4)
-data_rawq['ajexq_l4'] = data_rawq.groupby(['permno'])['ajexq'].shift(4)
+data_rawq[['cshoq_l4', 'ajexq_l4']] = panel_q.lag(data_rawq, ['cshoq', 'ajexq'], 4)
 data_rawq['ni'] = np.where(data_rawq['cshoq'].isnull(), np.nan,
                          np.log(data_rawq['cshoq']*data_rawq['ajexq']).replace(-np.inf, 0)-np.log(data_rawq['cshoq_l4']*data_rawq['ajexq_l4']))
 
 # ope
-data_rawq['xintq0'] = np.where(data_rawq['xintq'].isnull(), 0, data_rawq['xintq'])
-data_rawq['xsgaq0'] = np.where(data_rawq['xsgaq'].isnull(), 0, data_rawq['xsgaq'])
-data_rawq['cogsq0'] = np.where(data_rawq['cogsq'].isnull(), 0, data_rawq['cogsq'])
-data_rawq['beq_l4'] = data_rawq.groupby(['permno'])['beq'].shift(4)
+data_rawq['beq_l4'] = panel_q.lag(data_rawq, 'beq', 4)
 
-data_rawq['ope'] = (ttm4('revtq', data_rawq)-ttm4('cogsq0', data_rawq)-ttm4('xsgaq0', data_rawq)-ttm4('xintq0', data_rawq))/data_rawq['beq_l4']
+data_rawq['ope'] = (ttm4['revtq']-ttm4['cogsq0']-ttm4['xsgaq0']-ttm4['xintq0'])/data_rawq['beq_l4']
 
 # chcsho
 data_rawq['chcsho'] = (data_rawq['cshoq']/data_rawq['cshoq_l4'])-1
 
 # cashdebt
-data_rawq['ltq_l4'] = data_rawq.groupby(['permno'])['ltq'].shift(4)
-data_rawq['cashdebt'] = (ttm4('ibq', data_rawq) + ttm4('dpq', data_rawq))/((data_rawq['ltq']+data_rawq['ltq_l4'])/2)
+data_rawq['ltq_l4'] = panel_q.lag(data_rawq, 'ltq', 4)
+data_rawq['cashdebt'] = (ttm4['ibq'] + ttm4['dpq'])/((data_rawq['ltq']+data_rawq['ltq_l4'])/2)
 
 # rd
-data_rawq['xrdq4'] = ttm4('xrdq', data_rawq)
+data_rawq['xrdq4'] = ttm4['xrdq']
 data_rawq['xrdq4'] = np.where(data_rawq['xrdq4'].isnull(), data_rawq['xrdy'], data_rawq['xrdq4'])
 
 data_rawq['xrdq4/atq_l4'] = data_rawq['xrdq4']/data_rawq['atq_l4']
-data_rawq['xrdq4/atq_l4_l4'] = data_rawq.groupby(['permno'])['xrdq4/atq_l4'].shift(4)
+data_rawq['xrdq4/atq_l4_l4'] = panel_q.lag(data_rawq, 'xrdq4/atq_l4', 4)
 data_rawq['rd'] = np.where(((data_rawq['xrdq4']/data_rawq['atq'])-data_rawq['xrdq4/atq_l4_l4'])/data_rawq['xrdq4/atq_l4_l4']>0.05, 1, 0)
 
 #################### Follow Hafzalla, Lundholm, and Van Winkle (2011) and GHZ on 2025.02.28 ####################
@@ -938,10 +887,10 @@ data_rawq['rd'] = np.where(((data_rawq['xrdq4']/data_rawq['atq'])-data_rawq['xrd
 # # pctacc
 # condlist = [data_rawq['npq'].isnull(),
 #             data_rawq['actq'].isnull() | data_rawq['lctq'].isnull()]
-# choicelist = [((data_rawq['actq']-data_rawq['lctq'])-(data_rawq['actq_l4']-data_rawq['lctq_l4']))/abs(ttm4('ibq', data_rawq)), np.nan]
+# choicelist = [((data_rawq['actq']-data_rawq['lctq'])-(data_rawq['actq_l4']-data_rawq['lctq_l4']))/abs(ttm4['ibq']), np.nan]
 # data_rawq['pctacc'] = np.select(condlist, choicelist,
 #                               default=((data_rawq['actq']-data_rawq['lctq']+data_rawq['npq'])-(data_rawq['actq_l4']-data_rawq['lctq_l4']+data_rawq['npq_l4']))/
-#                                       abs(ttm4('ibq', data_rawq)))
+#                                       abs(ttm4['ibq']))
 
 condlist = [data_rawq['ibq'] == 0,
             data_rawq['oancfy'].isnull(),
@@ -957,8 +906,8 @@ data_rawq['pctacc'] = np.select(condlist, choicelist,
                                 default=(data_rawq['ibq'] - data_rawq['oancfy']) / data_rawq['ibq'].abs())
 
 # gma
-data_rawq['revtq4'] = ttm4('revtq', data_rawq)
-data_rawq['cogsq4'] = ttm4('cogsq', data_rawq)
+data_rawq['revtq4'] = ttm4['revtq']
+data_rawq['cogsq4'] = ttm4['cogsq']
 data_rawq['gma'] = (data_rawq['revtq4']-data_rawq['cogsq4'])/data_rawq['atq_l4']
 
 # lev
@@ -968,19 +917,17 @@ data_rawq['gma'] = (data_rawq['revtq4']-data_rawq['cogsq4'])/data_rawq['atq_l4']
 # data_rawq['rdm'] = data_rawq['xrdq4']/data_rawq['me']
 
 # sgr
-data_rawq['saleq4'] = ttm4('saleq', data_rawq)
+data_rawq['saleq4'] = ttm4['saleq']
 data_rawq['saleq4'] = np.where(data_rawq['saleq4'].isnull(), data_rawq['saley'], data_rawq['saleq4'])
 
-data_rawq['saleq4_l4'] = data_rawq.groupby(['permno'])['saleq4'].shift(4)
+data_rawq['saleq4_l4'] = panel_q.lag(data_rawq, 'saleq4', 4)
 data_rawq['sgr'] = (data_rawq['saleq4']/data_rawq['saleq4_l4'])-1
 
 # sp
 # data_rawq['sp'] = data_rawq['saleq4']/data_rawq['me']
 
 # invest
-data_rawq['ppentq_l4'] = data_rawq.groupby(['permno'])['ppentq'].shift(4)
-data_rawq['invtq_l4'] = data_rawq.groupby(['permno'])['invtq'].shift(4)
-data_rawq['ppegtq_l4'] = data_rawq.groupby(['permno'])['ppegtq'].shift(4)
+data_rawq[['ppentq_l4', 'invtq_l4', 'ppegtq_l4']] = panel_q.lag(data_rawq, ['ppentq', 'invtq', 'ppegtq'], 4)
 
 data_rawq['invest'] = np.where(data_rawq['ppegtq'].isnull(), ((data_rawq['ppentq']-data_rawq['ppentq_l4'])+
                                                             (data_rawq['invtq']-data_rawq['invtq_l4']))/data_rawq['atq_l4'],
@@ -993,26 +940,23 @@ data_rawq['rd_sale'] = data_rawq['xrdq4']/data_rawq['saleq4']
 data_rawq['lgr'] = (data_rawq['ltq']/data_rawq['ltq_l4'])-1
 
 # depr
-data_rawq['depr'] = ttm4('dpq', data_rawq)/data_rawq['ppentq']
+data_rawq['depr'] = ttm4['dpq']/data_rawq['ppentq']
 
 # egr
-data_rawq['ceqq_l4'] = data_rawq.groupby(['permno'])['ceqq'].shift(4)
+data_rawq['ceqq_l4'] = panel_q.lag(data_rawq, 'ceqq', 4)
 data_rawq['egr'] = (data_rawq['ceqq']-data_rawq['ceqq_l4'])/data_rawq['ceqq_l4']
 
 # chpm
-data_rawq['ibq4_l1'] = data_rawq.groupby(['permno'])['ibq4'].shift(1)
-data_rawq['saleq4_l1'] = data_rawq.groupby(['permno'])['saleq4'].shift(1)
+data_rawq[['ibq4_l1', 'saleq4_l1']] = panel_q.lag(data_rawq, ['ibq4', 'saleq4'])
 
 data_rawq['chpm'] = (data_rawq['ibq4']/data_rawq['saleq4'])-(data_rawq['ibq4_l1']/data_rawq['saleq4_l1'])
 
 # chato
-data_rawq['atq_l8'] = data_rawq.groupby(['permno'])['atq'].shift(8)
+data_rawq['atq_l8'] = panel_q.lag(data_rawq, 'atq', 8)
 data_rawq['chato'] = (data_rawq['saleq4']/((data_rawq['atq']+data_rawq['atq_l4'])/2))-(data_rawq['saleq4_l4']/((data_rawq['atq_l4']+data_rawq['atq_l8'])/2))
 
 # chatoia
-df_temp = data_rawq.groupby(['datadate', 'ffi49'], as_index=False)['chato'].mean()
-df_temp = df_temp.rename(columns={'chato': 'chato_ind'})
-data_rawq = pd.merge(data_rawq, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
+data_rawq['chato_ind'] = group_stats(data_rawq, {'chato_ind': ('chato', ['datadate', 'ffi49'], 'mean')})['chato_ind']
 data_rawq['chatoia'] = data_rawq['chato'] - data_rawq['chato_ind']
 
 # noa
@@ -1025,7 +969,7 @@ data_rawq['noa'] = (data_rawq['atq']-data_rawq['cheq']-data_rawq['ivaoq'])-\
                  (data_rawq['atq']-data_rawq['dlcq']-data_rawq['dlttq']-data_rawq['mibq']-data_rawq['pstkq']-data_rawq['ceqq'])/data_rawq['atq_l4']
 
 # rna
-data_rawq['noa_l4'] = data_rawq.groupby(['permno'])['noa'].shift(4)
+data_rawq['noa_l4'] = panel_q.lag(data_rawq, 'noa', 4)
 data_rawq['rna'] = data_rawq['oiadpq']/data_rawq['noa_l4']
 
 # pm
@@ -1035,27 +979,21 @@ data_rawq['pm'] = data_rawq['oiadpq']/data_rawq['saleq']
 data_rawq['ato'] = data_rawq['saleq']/data_rawq['noa_l4']
 
 # roe
-data_rawq['ceqq_l1'] = data_rawq.groupby(['permno'])['ceqq'].shift(1)
+data_rawq['ceqq_l1'] = panel_q.lag(data_rawq, 'ceqq')
 data_rawq['roe'] = data_rawq['ibq']/data_rawq['ceqq_l1']
 
 ################################## New Added ##################################
 
 # grltnoa
-data_rawq['rectq_l4'] = data_rawq.groupby(['permno'])['rectq'].shift(4)
-data_rawq['acoq_l4'] = data_rawq.groupby(['permno'])['acoq'].shift(4)
-data_rawq['apq_l4'] = data_rawq.groupby(['permno'])['apq'].shift(4)
-data_rawq['lcoq_l4'] = data_rawq.groupby(['permno'])['lcoq'].shift(4)
-data_rawq['loq_l4'] = data_rawq.groupby(['permno'])['loq'].shift(4)
-data_rawq['invtq_l4'] = data_rawq.groupby(['permno'])['invtq'].shift(4)
-data_rawq['ppentq_l4'] = data_rawq.groupby(['permno'])['ppentq'].shift(4)
-data_rawq['atq_l4'] = data_rawq.groupby(['permno'])['atq'].shift(4)
+data_rawq[['rectq_l4', 'acoq_l4', 'apq_l4', 'lcoq_l4', 'loq_l4', 'invtq_l4', 'ppentq_l4', 'atq_l4']] = \
+    panel_q.lag(data_rawq, ['rectq', 'acoq', 'apq', 'lcoq', 'loq', 'invtq', 'ppentq', 'atq'], 4)
 
 data_rawq['grltnoa'] = ((data_rawq['rectq']+data_rawq['invtq']+data_rawq['ppentq']+data_rawq['acoq']+data_rawq['intanq']+
                        data_rawq['aoq']-data_rawq['apq']-data_rawq['lcoq']-data_rawq['loq'])-
                       (data_rawq['rectq_l4']+data_rawq['invtq_l4']+data_rawq['ppentq_l4']+data_rawq['acoq_l4']-data_rawq['apq_l4']-data_rawq['lcoq_l4']-data_rawq['loq_l4'])-\
                      (data_rawq['rectq']-data_rawq['rectq_l4']+data_rawq['invtq']-data_rawq['invtq_l4']+data_rawq['acoq']-
                       (data_rawq['apq']-data_rawq['apq_l4']+data_rawq['lcoq']-data_rawq['lcoq_l4'])-
-                      ttm4('dpq', data_rawq)))/((data_rawq['atq']+data_rawq['atq_l4'])/2)
+                      ttm4['dpq']))/((data_rawq['atq']+data_rawq['atq_l4'])/2)
 
 # scal
 # condlist = [data_rawq['seqq'].isnull(),
@@ -1074,36 +1012,29 @@ data_rawq['ala'] = data_rawq['cheq'] + 0.75*(data_rawq['actq']-data_rawq['cheq']
 # data_rawq['alm'] = data_rawq['ala']/(data_rawq['atq']+data_rawq['me']-data_rawq['ceqq'])
 
 # rsup
-data_rawq['saleq_l4'] = data_rawq.groupby(['permno'])['saleq'].shift(4)
+data_rawq['saleq_l4'] = panel_q.lag(data_rawq, 'saleq', 4)
 # data_rawq['rsup'] = (data_rawq['saleq'] - data_rawq['saleq_l4'])/data_rawq['me']
 
 # stdsacc
-data_rawq['actq_l1'] = data_rawq.groupby(['permno'])['actq'].shift(1)
-data_rawq['cheq_l1'] = data_rawq.groupby(['permno'])['cheq'].shift(1)
-data_rawq['lctq_l1'] = data_rawq.groupby(['permno'])['lctq'].shift(1)
-data_rawq['dlcq_l1'] = data_rawq.groupby(['permno'])['dlcq'].shift(1)
+data_rawq[['actq_l1', 'cheq_l1', 'lctq_l1', 'dlcq_l1']] = panel_q.lag(data_rawq, ['actq', 'cheq', 'lctq', 'dlcq'])
 
 data_rawq['sacc'] = ((data_rawq['actq']-data_rawq['actq_l1'] - (data_rawq['cheq']-data_rawq['cheq_l1']))
                      -((data_rawq['lctq']-data_rawq['lctq_l1'])-(data_rawq['dlcq']-data_rawq['dlcq_l1'])))/data_rawq['saleq']
 data_rawq['sacc'] = np.where(data_rawq['saleq']<=0, ((data_rawq['actq']-data_rawq['actq_l1'] - (data_rawq['cheq']-data_rawq['cheq_l1']))
                      -((data_rawq['lctq']-data_rawq['lctq_l1'])-(data_rawq['dlcq']-data_rawq['dlcq_l1'])))/0.01, data_rawq['sacc'])
 
-def chars_std(start, end, df, chars):
+def chars_std(start, end, df, chars, min_obs=2):
     """
 
     :param start: Order of starting lag
     :param end: Order of ending lag
-    :param df: Dataframe
+    :param df: Dataframe sorted by permno
     :param chars: lag chars
+    :param min_obs: minimum number of non missing lags
     :return: std of factor
     """
-    lag = pd.DataFrame()
-    lag_list = []
-    for i in range(start, end):
-        lag['chars_l%s' % i] = df.groupby(['permno'])['%s' % chars].shift(i)
-        lag_list.append('chars_l%s' % i)
-    result = lag[lag_list].std(axis=1)
-    return result
+    result = trailing_std(df['permno'].to_numpy(), df[chars].to_numpy(dtype=float), end - start, min_obs, skip=start)
+    return pd.Series(result, index=df.index)
 
 data_rawq['stdacc'] = chars_std(0, 16, data_rawq, 'sacc')
 
@@ -1117,13 +1048,10 @@ data_rawq['scf'] = np.where(data_rawq['saleq']<=0, (data_rawq['ibq']/0.01) - dat
 data_rawq['stdcf'] = chars_std(0, 16, data_rawq, 'scf')
 
 # cinvest
-data_rawq['ppentq_l1'] = data_rawq.groupby(['permno'])['ppentq'].shift(1)
-data_rawq['ppentq_l2'] = data_rawq.groupby(['permno'])['ppentq'].shift(2)
-data_rawq['ppentq_l3'] = data_rawq.groupby(['permno'])['ppentq'].shift(3)
-data_rawq['ppentq_l4'] = data_rawq.groupby(['permno'])['ppentq'].shift(4)
-data_rawq['saleq_l1'] = data_rawq.groupby(['permno'])['saleq'].shift(1)
-data_rawq['saleq_l2'] = data_rawq.groupby(['permno'])['saleq'].shift(2)
-data_rawq['saleq_l3'] = data_rawq.groupby(['permno'])['saleq'].shift(3)
+data_rawq[['ppentq_l1', 'saleq_l1']] = panel_q.lag(data_rawq, ['ppentq', 'saleq'])
+data_rawq[['ppentq_l2', 'saleq_l2']] = panel_q.lag(data_rawq, ['ppentq', 'saleq'], 2)
+data_rawq[['ppentq_l3', 'saleq_l3']] = panel_q.lag(data_rawq, ['ppentq', 'saleq'], 3)
+data_rawq['ppentq_l4'] = panel_q.lag(data_rawq, 'ppentq', 4)
 
 data_rawq['c_temp1'] = (data_rawq['ppentq_l1'] - data_rawq['ppentq_l2']) / data_rawq['saleq_l1']
 data_rawq['c_temp2'] = (data_rawq['ppentq_l2'] - data_rawq['ppentq_l3']) / data_rawq['saleq_l2']
@@ -1142,14 +1070,8 @@ data_rawq['cinvest'] = np.where(data_rawq['saleq']<=0, ((data_rawq['ppentq'] - d
 data_rawq = data_rawq.drop(['c_temp1', 'c_temp2', 'c_temp3'], axis=1)
 
 # nincr
-data_rawq['ibq_l1'] = data_rawq.groupby(['permno'])['ibq'].shift(1)
-data_rawq['ibq_l2'] = data_rawq.groupby(['permno'])['ibq'].shift(2)
-data_rawq['ibq_l3'] = data_rawq.groupby(['permno'])['ibq'].shift(3)
-data_rawq['ibq_l4'] = data_rawq.groupby(['permno'])['ibq'].shift(4)
-data_rawq['ibq_l5'] = data_rawq.groupby(['permno'])['ibq'].shift(5)
-data_rawq['ibq_l6'] = data_rawq.groupby(['permno'])['ibq'].shift(6)
-data_rawq['ibq_l7'] = data_rawq.groupby(['permno'])['ibq'].shift(7)
-data_rawq['ibq_l8'] = data_rawq.groupby(['permno'])['ibq'].shift(8)
+for i in range(1, 9):
+    data_rawq['ibq_l%s' % i] = panel_q.lag(data_rawq, 'ibq', i)
 
 data_rawq['nincr_temp1'] = np.where(data_rawq['ibq'] > data_rawq['ibq_l1'], 1, 0)
 data_rawq['nincr_temp2'] = np.where(data_rawq['ibq_l1'] > data_rawq['ibq_l2'], 1, 0)
@@ -1174,16 +1096,15 @@ data_rawq = data_rawq.drop(['ibq_l1', 'ibq_l2', 'ibq_l3', 'ibq_l4', 'ibq_l5', 'i
                             'nincr_temp8'], axis=1)
 
 # performance score
-data_rawq['niq4'] = ttm4(series='niq', df=data_rawq)
-data_rawq['niq4_l4'] = data_rawq.groupby(['permno'])['niq4'].shift(4)
-data_rawq['dlttq_l4'] = data_rawq.groupby(['permno'])['dlttq'].shift(4)
+data_rawq['niq4'] = ttm4['niq']
+data_rawq[['niq4_l4', 'dlttq_l4']] = panel_q.lag(data_rawq, ['niq4', 'dlttq'], 4)
 data_rawq['p_temp1'] = np.where(data_rawq['niq4']>0, 1, 0)
 data_rawq['p_temp2'] = np.where(data_rawq['oancfy']>0, 1, 0)
 data_rawq['p_temp3'] = np.where(data_rawq['niq4']/data_rawq['atq']>data_rawq['niq4_l4']/data_rawq['atq_l4'], 1, 0)
 data_rawq['p_temp4'] = np.where(data_rawq['oancfy']>data_rawq['niq4'], 1, 0)
 data_rawq['p_temp5'] = np.where(data_rawq['dlttq']/data_rawq['atq']<data_rawq['dlttq_l4']/data_rawq['atq_l4'], 1, 0)
 data_rawq['p_temp6'] = np.where(data_rawq['actq']/data_rawq['lctq'] > data_rawq['actq_l4']/data_rawq['lctq_l4'], 1, 0)
-data_rawq['cogsq4_l4'] = data_rawq.groupby(['permno'])['cogsq4'].shift(4)
+data_rawq['cogsq4_l4'] = panel_q.lag(data_rawq, 'cogsq4', 4)
 data_rawq['p_temp7'] = np.where((data_rawq['saleq4']-data_rawq['cogsq4']/data_rawq['saleq4'])>(data_rawq['saleq4_l4']-data_rawq['cogsq4_l4']/data_rawq['saleq4_l4']), 1, 0)
 data_rawq['p_temp8'] = np.where(data_rawq['saleq4']/data_rawq['atq']>data_rawq['saleq4_l4']/data_rawq['atq_l4'], 1, 0)
 data_rawq['p_temp9'] = np.where(data_rawq['scstkcy']==0, 1, 0)
@@ -1201,7 +1122,7 @@ data_rawq = data_rawq.drop(['p_temp1', 'p_temp2', 'p_temp3', 'p_temp4', 'p_temp5
 # data_rawq['cashpr'] = ((data_rawq['me'] + data_rawq['dlttq'] - data_rawq['atq']) / data_rawq['cheq'])
 ################## Added on 2024.03.12 ##################
 # opa from Ball el al. (2016)
-data_rawq['opa'] = (ttm4('revtq', data_rawq)-ttm4('cogsq0', data_rawq)-ttm4('xsgaq0', data_rawq)+data_rawq['xrdq4'])/data_rawq['atq_l4']
+data_rawq['opa'] = (ttm4['revtq']-ttm4['cogsq0']-ttm4['xsgaq0']+data_rawq['xrdq4'])/data_rawq['atq_l4']
 
 # cop from Ball el al. (2016)
 # no quarterly xpp, borrow from annual data
@@ -1209,12 +1130,12 @@ data_rawq['year'] = data_rawq['jdate'].dt.year
 data_rawa['year'] = data_rawa['jdate'].dt.year
 data_rawa['jdate_a'] = data_rawa['jdate'].copy()
 data_rawq = pd.merge(data_rawq, data_rawa[['permno', 'year', 'jdate_a', 'xpp', 'xpp_l1']], how='left', on=['permno', 'year'])
+panel_q = Panel(data_rawq['permno'])  # the merge may add rows
 
 # if quarterly jdate is later than annual jdate, use the corresponding xpp, otherwise use the lag-1 xpp (from one year before)
 data_rawq['xpp'] = np.where(data_rawq['jdate'] > data_rawq['jdate_a'], data_rawq['xpp'], data_rawq['xpp_l1'])
 
-data_rawq['xpp_l4'] = data_rawq.groupby(['permno'])['xpp'].shift(4)
-data_rawq['xaccq_l4'] = data_rawq.groupby(['permno'])['xaccq'].shift(4)
+data_rawq[['xpp_l4', 'xaccq_l4']] = panel_q.lag(data_rawq, ['xpp', 'xaccq'], 4)
 
 data_rawq['cop'] = (data_rawq['opa'] - (data_rawq['rectq']-data_rawq['rectq_l4']) 
                                      - (data_rawq['invtq']-data_rawq['invtq_l4'])
@@ -1227,6 +1148,7 @@ data_rawq['cop'] = (data_rawq['opa'] - (data_rawq['rectq']-data_rawq['rectq_l4']
 #######################################################################################################################
 #                                                       Momentum                                                      #
 #######################################################################################################################
+stage('fetch crsp.msf and crsp.msedelist')
 crsp = conn.raw_sql("""
                     select a.prc, a.ret, a.retx, a.shrout, a.vol, a.date, a.permno, a.permco
                     from crsp.msf as a
@@ -1292,74 +1214,38 @@ dlret['jdate'] = dlret['dlstdt'] + MonthEnd(0)
 
 # merge delisting return to crsp return
 crsp_mom = pd.merge(crsp_mom, dlret, how='left', on=['permno', 'jdate']).reset_index(drop=True)
+
+# firm boundaries of the monthly panel for its lags (see panel.py)
+panel_m = Panel(crsp_mom['permno'])
+count(len(crsp_mom))
+
+stage('momentum', rows=len(crsp_mom))
 crsp_mom['dlret'] = crsp_mom['dlret'].fillna(0)
 crsp_mom['ret'] = crsp_mom['ret'].fillna(0)
 crsp_mom['retadj'] = (1 + crsp_mom['ret']) * (1 + crsp_mom['dlret']) - 1
 
+# compounded returns over the months start to end - 1 before every month, all the windows in one pass over the
+# log returns (see momentum in panel.py), chmom is the change from the months 7 to 17 to the months 1 to 11
+moms = momentum(crsp_mom, {'mom60m': (12, 60), 'mom12m': (1, 12), 'mom6m': (1, 6), 'mom36m': (12, 36),
+                           'mom_7_18': (7, 18)})
+crsp_mom['chmom'] = moms['mom12m'] - moms['mom_7_18']
 
-def mom(start, end, df):
-    """
-
-    :param start: Order of starting lag
-    :param end: Order of ending lag
-    :param df: Dataframe
-    :return: Momentum factor
-    """
-    lag = pd.DataFrame()
-    result = 1
-    for i in range(start, end):
-        lag['mom%s' % i] = df.groupby(['permno'])['ret'].shift(i)
-        result = result * (1+lag['mom%s' % i])
-    result = result - 1
-    return result
-
-
-def chmom(start, end, df):
-    """
-
-    :param start: Order of starting lag
-    :param end: Order of ending lag
-    :param df: Dataframe
-    :return: Momentum factor
-    """
-    lag = pd.DataFrame()
-    result_first_half = 1
-    result_second_half = 1
-    for i in range(start, end):
-        lag['mom%s' % i] = df.groupby(['permno'])['ret'].shift(i)
-        result_first_half = result_first_half * (1+lag['mom%s' % i])
-    lag = pd.DataFrame()
-    for i in range(start + 6, end + 6):
-        lag['mom%s' % i] = df.groupby(['permno'])['ret'].shift(i)
-        result_second_half = result_second_half * (1 + lag['mom%s' % i])
-    result_first_half = result_first_half - 1
-    result_second_half = result_second_half - 1
-    result = result_first_half - result_second_half
-    return result
-
-
-crsp_mom['chmom'] = chmom(1, 12, crsp_mom)
-
-crsp_mom['mom60m'] = mom(12, 60, crsp_mom)
-crsp_mom['mom12m'] = mom(1, 12, crsp_mom)
+crsp_mom[['mom60m', 'mom12m', 'mom6m', 'mom36m']] = moms[['mom60m', 'mom12m', 'mom6m', 'mom36m']]
 crsp_mom['mom1m'] = crsp_mom['ret']
-crsp_mom['mom6m'] = mom(1, 6, crsp_mom)
-crsp_mom['mom36m'] = mom(12, 36, crsp_mom)
-crsp_mom['seas1a'] = crsp_mom.groupby(['permno'])['ret'].shift(11)
-
-crsp_mom['vol_l1'] = crsp_mom.groupby(['permno'])['vol'].shift(1)
-crsp_mom['vol_l2'] = crsp_mom.groupby(['permno'])['vol'].shift(2)
-crsp_mom['vol_l3'] = crsp_mom.groupby(['permno'])['vol'].shift(3)
-crsp_mom['prc_l2'] = crsp_mom.groupby(['permno'])['prc'].shift(2)
+crsp_mom['seas1a'] = panel_m.lag(crsp_mom, 'ret', 11)
+
+crsp_mom['vol_l1'] = panel_m.lag(crsp_mom, 'vol')
+crsp_mom[['vol_l2', 'prc_l2']] = panel_m.lag(crsp_mom, ['vol', 'prc'], 2)
+crsp_mom['vol_l3'] = panel_m.lag(crsp_mom, 'vol', 3)
 crsp_mom['dolvol'] = np.log((crsp_mom['vol_l2']*100)*crsp_mom['prc_l2']).replace([np.inf, -np.inf], np.nan) ##### Added "*100" on 2025.02.23 (change "vol" unit from hundreds to one unit) #####
 crsp_mom['turn'] = ((crsp_mom['vol_l1']+crsp_mom['vol_l2']+crsp_mom['vol_l3'])/3/10)/crsp_mom['shrout'] ##### Added "/10" on 2025.02.23 (change "vol" unit from hundreds to thousand unit, same as shrout) #####
 
 # dy
-crsp_mom['me_l1'] = crsp_mom.groupby(['permno'])['me'].shift(1)
+crsp_mom['me_l1'] = panel_m.lag(crsp_mom, 'me')
 crsp_mom['retdy'] = crsp_mom['ret'] - crsp_mom['retx']
 crsp_mom['mdivpay'] = crsp_mom['retdy']*crsp_mom['me_l1']
 
-crsp_mom['dy'] = ttm12(series='mdivpay', df=crsp_mom)/crsp_mom['me']
+crsp_mom['dy'] = ttm(crsp_mom, ['mdivpay'], 12)['mdivpay']/crsp_mom['me']
 
 # def moms(start, end, df):
 #     """
@@ -1406,6 +1292,7 @@ data_rawq = data_rawq[((data_rawq['exchcd'] == 1) | (data_rawq['exchcd'] == 2) |
 #                                                    Monthly ME                                                       #
 #######################################################################################################################
 
+stage('merge monthly me annual', rows=len(data_rawa))
 ########################################
 #                Annual                #
 ########################################
@@ -1413,18 +1300,6 @@ data_rawq = data_rawq[((data_rawq['exchcd'] == 1) | (data_rawq['exchcd'] == 2) |
 # bm
 data_rawa['bm'] = data_rawa['be'] / data_rawa['me']
 
-# bm_ia
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['bm'].mean()
-df_temp = df_temp.rename(columns={'bm': 'bm_ind'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
-data_rawa['bm_ia'] = data_rawa['bm'] - data_rawa['bm_ind']
-
-# me_ia
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['me'].mean()
-df_temp = df_temp.rename(columns={'me': 'me_ind'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
-data_rawa['me_ia'] = data_rawa['me'] - data_rawa['me_ind']
-
 # cfp
 condlist = [data_rawa['dp'].isnull(),
             data_rawa['ib'].isnull()]
@@ -1432,10 +1307,20 @@ choicelist = [data_rawa['ib']/data_rawa['me'],
               np.nan]
 data_rawa['cfp'] = np.select(condlist, choicelist, default=(data_rawa['ib']+data_rawa['dp'])/data_rawa['me'])
 
+# industry means of bm, me, cfp and mom12m in one pass (bm_ia, me_ia, cfp_ia, indmom)
+ind_a = {'bm_ind': ('bm', ['datadate', 'ffi49'], 'mean'),
+         'me_ind': ('me', ['datadate', 'ffi49'], 'mean'),
+         'cfp_ind': ('cfp', ['datadate', 'ffi49'], 'mean'),
+         'indmom': ('mom12m', ['date', 'ffi49'], 'mean')}
+data_rawa[list(ind_a)] = group_stats(data_rawa, ind_a)
+
+# bm_ia
+data_rawa['bm_ia'] = data_rawa['bm'] - data_rawa['bm_ind']
+
+# me_ia
+data_rawa['me_ia'] = data_rawa['me'] - data_rawa['me_ind']
+
 # cfp_ia
-df_temp = data_rawa.groupby(['datadate', 'ffi49'], as_index=False)['cfp'].mean()
-df_temp = df_temp.rename(columns={'cfp': 'cfp_ind'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
 data_rawa['cfp_ia'] = data_rawa['cfp'] - data_rawa['cfp_ind']
 
 # ep
@@ -1463,10 +1348,6 @@ data_rawa['dy'] = data_rawa['dvt']/data_rawa['me']
 # cashpr
 data_rawa['cashpr'] = ((data_rawa['me'] + data_rawa['dltt'] - data_rawa['at']) / data_rawa['che'])
 
-# indmom
-df_temp = data_rawa.groupby(['date', 'ffi49'], as_index=False)['mom12m'].mean().rename(columns={'mom12m': 'indmom'})
-data_rawa = pd.merge(data_rawa, df_temp, how='left', on=['date', 'ffi49']).reset_index(drop=True)
-
 # Annual Accounting Variables
 chars_a = data_rawa[['cusip', 'ncusip', 'gvkey', 'permno', 'exchcd', 'shrcd', 'datadate', 'jdate', 'ticker', 'conm', 'comnam', 'prc', 'shrout',
                      'sic', 'ret', 'retx', 'retadj', 'acc', 'agr', 'bm', 'cfp', 'ep', 'ni', 'op',
@@ -1483,33 +1364,32 @@ chars_a = data_rawa[['cusip', 'ncusip', 'gvkey', 'permno', 'exchcd', 'shrcd', 'd
                      'tang', 'tb', 'm1', 'm2', 'm3', 'm4', 'm5', 'm6']]
 chars_a.reset_index(drop=True, inplace=True)
 
+stage('merge monthly me quarterly', rows=len(data_rawq))
 ########################################
 #               Quarterly              #
 ########################################
 # bm
 data_rawq['bm'] = data_rawq['beq']/data_rawq['me']
 
+# cfp
+data_rawq['cfp'] = np.where(data_rawq['dpq'].isnull(),
+                            data_rawq['ibq4']/data_rawq['me'],
+                            (data_rawq['ibq4']+data_rawq['dpq4'])/data_rawq['me'])
+
+# industry means of bm, me, cfp and mom12m in one pass (bm_ia, me_ia, cfp_ia, indmom)
+ind_q = {'bm_ind': ('bm', ['datadate', 'ffi49'], 'mean'),
+         'me_ind': ('me', ['datadate', 'ffi49'], 'mean'),
+         'cfp_ind': ('cfp', ['datadate', 'ffi49'], 'mean'),
+         'indmom': ('mom12m', ['date', 'ffi49'], 'mean')}
+data_rawq[list(ind_q)] = group_stats(data_rawq, ind_q)
+
 # bm_ia
-df_temp = data_rawq.groupby(['datadate', 'ffi49'], as_index=False)['bm'].mean()
-df_temp = df_temp.rename(columns={'bm': 'bm_ind'})
-data_rawq = pd.merge(data_rawq, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
 data_rawq['bm_ia'] = data_rawq['bm'] - data_rawq['bm_ind']
 
 # me_ia
-df_temp = data_rawq.groupby(['datadate', 'ffi49'], as_index=False)['me'].mean()
-df_temp = df_temp.rename(columns={'me': 'me_ind'})
-data_rawq = pd.merge(data_rawq, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
 data_rawq['me_ia'] = data_rawq['me'] - data_rawq['me_ind']
 
-# cfp
-data_rawq['cfp'] = np.where(data_rawq['dpq'].isnull(),
-                            data_rawq['ibq4']/data_rawq['me'],
-                            (data_rawq['ibq4']+data_rawq['dpq4'])/data_rawq['me'])
-
 # cfp_ia
-df_temp = data_rawq.groupby(['datadate', 'ffi49'], as_index=False)['cfp'].mean()
-df_temp = df_temp.rename(columns={'cfp': 'cfp_ind'})
-data_rawq = pd.merge(data_rawq, df_temp, how='left', on=['datadate', 'ffi49']).reset_index(drop=True)
 data_rawq['cfp_ia'] = data_rawq['cfp'] - data_rawq['cfp_ind']
 
 # ep
@@ -1537,16 +1417,10 @@ data_rawq['sgrvol'] = chars_std(0, 15, data_rawq, 'rsup')
 # cashpr
 data_rawq['cashpr'] = ((data_rawq['me'] + data_rawq['dlttq'] - data_rawq['atq']) / data_rawq['cheq'])
 
-# indmom
-df_temp = data_rawq.groupby(['date', 'ffi49'], as_index=False)['mom12m'].mean().rename(columns={'mom12m': 'indmom'})
-data_rawq = pd.merge(data_rawq, df_temp, how='left', on=['date', 'ffi49']).reset_index(drop=True)
-
 # Mohanram (2005) score (Quarterly Related)
-df_temp = data_rawq.groupby(['fyearq', 'fqtr', 'ffi49'], as_index=False)['roavol'].median().rename(columns={'roavol': 'md_roavol'})
-data_rawq = pd.merge(data_rawq, df_temp, how='left', on=['fyearq', 'fqtr', 'ffi49']).reset_index(drop=True)
-
-df_temp = data_rawq.groupby(['fyearq', 'fqtr', 'ffi49'], as_index=False)['sgrvol'].median().rename(columns={'sgrvol': 'md_sgrvol'})
-data_rawq = pd.merge(data_rawq, df_temp, how='left', on=['fyearq', 'fqtr', 'ffi49']).reset_index(drop=True)
+md_q = {'md_roavol': ('roavol', ['fyearq', 'fqtr', 'ffi49'], 'median'),
+        'md_sgrvol': ('sgrvol', ['fyearq', 'fqtr', 'ffi49'], 'median')}
+data_rawq[list(md_q)] = group_stats(data_rawq, md_q)
 
 data_rawq['m7'] = np.where(data_rawq['roavol'] < data_rawq['md_roavol'], 1, 0)
 data_rawq['m8'] = np.where(data_rawq['sgrvol'] < data_rawq['md_sgrvol'], 1, 0)
@@ -1563,6 +1437,7 @@ chars_q = data_rawq[['gvkey', 'permno', 'datadate', 'jdate', 'sic', 'exchcd', 's
                      'turn', 'dolvol', 'cashpr', 'indmom', 'm7', 'm8']]
 chars_q.reset_index(drop=True, inplace=True)
 
+stage('write')
 with open('chars_a_accounting.feather', 'wb') as f:
     feather.write_feather(chars_a, f)
 
@@ -0,0 +1,96 @@
+# CAPM beta, alpha, residual variance and R^2
+# beta.py and rvar_capm.py run the same market regression separately, here we run it once for every window and
+# write all the outputs to capm.feather
+# Note: Please use the latest version of pandas, this version should support returning to pd.Series after rolling
+# To get a faster speed, we split the big dataframe into small ones
+# Then using different process to calculate the variance
+# We use all the CPUs to calculate variance by default, you can change the number of process with --processes
+
+import pandas as pd
+import numpy as np
+import datetime as dt
+from offline_wrds import connect
+from dateutil.relativedelta import *
+from pandas.tseries.offsets import *
+import datetime
+import pickle as pkl
+import pyarrow.feather as feather
+import multiprocessing as mp
+from rolling import *
+from crsp_cache import load_dsf, load_delist, delist_returns, universe_rows
+from instrument import stage, count
+
+###################
+# Connect to WRDS #
+###################
+conn = connect()
+
+# with --update, only the months from the last month in capm.feather on are computed again
+# and appended to it (see update_from in rolling.py)
+args = daily_args()
+old, first_date, start = update_from('capm.feather', args.update)
+
+stage('fetch crsp.dsf')
+# CRSP Block, read from the local cache of crsp.dsf and ff.factors_daily (see crsp_cache.py)
+crsp = load_dsf(conn, ['ret', 'vol'], factors=['rf', 'mktrf'], start=start, universe=args.universe)
+
+# add delisting return
+dlret = load_delist(conn)
+
+# merge delisting return to crsp return, the daily panel is not copied
+crsp['dlret'] = delist_returns(crsp, dlret)
+crsp['dlret'] = crsp['dlret'].fillna(0)
+crsp['ret'] = crsp['ret'].fillna(0)
+crsp['retadj'] = (1 + crsp['ret']) * (1 + crsp['dlret']) - 1
+crsp['exret'] = crsp['retadj'] - crsp['rf']
+
+count(len(crsp))
+
+stage('month end index', rows=len(crsp))
+# label the months of every firm (0, 1, 2, ...), the last trading day of a month is its month end row,
+# and create a firm list with the number of months of every firm
+crsp['month_count'], month_end, df_firm = month_index(crsp['permno'].to_numpy(), crsp['date'].to_numpy())
+
+######################
+# Calculate residual #
+######################
+
+
+def get_capm(df, firm_list):
+    """
+
+    :param df: stock dataframe
+    :param firm_list: list of firms matching stock dataframe
+    :return: month end rows of df and the beta, alpha, variance of residual and R^2 of CAPM at these rows
+    """
+    return rolling_chars(df, ['beta', 'alpha_capm', 'rvar_capm', 'r2_capm'], capm, ['exret', 'mktrf'])
+
+
+def main(processes):
+    """
+
+    :param processes: number of processes, we split the firms into 4 times as many ranges of rows
+    :return: a dataframe with calculated beta, alpha, variance of residual and R^2
+    """
+    return run_shared(crsp, df_firm, get_capm, ['exret', 'mktrf'], ['beta', 'alpha_capm', 'rvar_capm', 'r2_capm'],
+                      processes, checkpoint=args.checkpoint)
+
+
+# calculate variance of residual through rolling window
+# Note: the number of processes is all the CPUs by default, you can change it with --processes, e.g.
+# python capm.py --processes 20
+stage('window compute', rows=len(crsp))
+if __name__ == '__main__':
+    crsp = main(args.processes)
+
+stage('write')
+# process dataframe
+crsp = crsp.dropna(subset=['rvar_capm'])  # drop NA due to rolling
+crsp = crsp.reset_index(drop=True)
+crsp = crsp[['permno', 'date', 'beta', 'alpha_capm', 'rvar_capm', 'r2_capm']]
+
+crsp = universe_rows(conn, crsp, args.universe)  # without the lookback rows of load_dsf
+crsp = append_update(old, crsp, first_date)
+
+with open('capm.feather', 'wb') as f:
+    feather.write_feather(crsp, f)
\ No newline at end of file
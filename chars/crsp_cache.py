@@ -0,0 +1,310 @@
+# Local cache of CRSP daily data
+# All the daily characteristic scripts read crsp.dsf from 1959 onward, that is about 100M rows downloaded from WRDS by
+# every script. Here we keep crsp.dsf (the columns used by the scripts), crsp.dsedelist and ff.factors_daily as
+# Parquet files on local disk, crsp.dsf partitioned by year, and only download the new days when WRDS is updated.
+# The scripts read only the columns they need from the cache.
+# Build the cache once before running the daily scripts in parallel:
+# python crsp_cache.py
+# Every script brings the cache up to date when it starts, under the lock file crsp_cache/.lock, so scripts started
+# together do not write the same files: the first one downloads the new days and the others wait and read them.
+# The cache is in ./crsp_cache, you can change it with the environment variable CRSP_CACHE
+# Downloads are read in chunks (see fetch.py) and the cache keeps them as downloaded, with 64 bits columns, the scripts
+# get the compact dtypes of fetch.COMPACT when they read it
+# The scripts only read the securities of the final panel (see EXCHCD and SHRCD), the other securities are dropped
+# while the cache is read, before any rolling work
+
+import os
+import contextlib
+import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from fetch import COMPACT, compact, fetch, footprint
+
+CACHE_DIR = os.environ.get('CRSP_CACHE', 'crsp_cache')
+START = '1959-01-01'
+
+# universe of the final panel, NYSE, AMEX and NASDAQ common stocks (accounting_100_hxz.py and merge_chars.py)
+EXCHCD = [1, 2, 3]
+SHRCD = [10, 11]
+
+# dtypes of the downloads written to the cache, COMPACT with the 64 bits width
+WIDE = {col: {'int32': 'int64', 'float32': 'float64'}.get(dtype, dtype) for col, dtype in COMPACT.items()}
+
+# columns of crsp.dsf kept in the cache
+DSF_SCHEMA = pa.schema([('permno', pa.int64()), ('date', pa.timestamp('ns')), ('ret', pa.float64()),
+                        ('vol', pa.float64()), ('prc', pa.float64()), ('shrout', pa.float64()),
+                        ('askhi', pa.float64()), ('bidlo', pa.float64())])
+
+
+def _write(df, path, schema=None):
+    # write to a temporary file first, so a script reading the cache never sees half a file, the temporary file is
+    # hidden (the datasets of load_dsf skip the files starting with a dot) and has the pid of the writer
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    tmp = os.path.join(os.path.dirname(path), '.%s.%s.tmp' % (os.path.basename(path), os.getpid()))
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+
+@contextlib.contextmanager
+def _lock():
+    # lock file of the cache, the daily scripts run in parallel refresh the cache one after the other, and the ones
+    # waiting find it up to date (no lock where fcntl is missing, e.g. Windows: build the cache first there)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(os.path.join(CACHE_DIR, '.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _compact_schema(schema):
+    # arrow schema with the compact dtypes of fetch.COMPACT, categorical columns are kept as they are
+    return pa.schema([pa.field(f.name, pa.from_numpy_dtype(np.dtype(COMPACT[f.name])))
+                      if COMPACT.get(f.name, 'category') != 'category' else f for f in schema])
+
+
+def cached_until():
+    """
+
+    :return: the last date in the cached crsp.dsf, None if there is no cache yet
+    """
+    path = os.path.join(CACHE_DIR, 'dsf')
+    if not os.path.exists(path):
+        return None
+    years = sorted(int(d.split('=')[1]) for d in os.listdir(path) if d.startswith('year='))
+    if len(years) == 0:
+        return None
+    date = ds.dataset(os.path.join(path, 'year=%s' % years[-1]), format='parquet').to_table(columns=['date'])
+    return pd.Timestamp(pc.max(date.column('date')).as_py())
+
+
+def refresh(conn):
+    """
+    Append the days of crsp.dsf after the last cached date, year by year, and download crsp.dsedelist and
+    ff.factors_daily again if there is anything new. Only one process refreshes the cache at a time (see _lock).
+
+    :param conn: WRDS connection
+    :return: number of new rows of crsp.dsf
+    """
+    with _lock():
+        return _refresh(conn)
+
+
+def _refresh(conn):
+    # refresh of the cache, under its lock
+    last = cached_until()
+    first_year = int(START[:4]) if last is None else last.year
+    new_rows = 0
+    for year in range(first_year, datetime.date.today().year + 1):
+        lower = "date >= '%s'" % START if last is None else "date > '%s'" % last.strftime('%Y-%m-%d')
+        print('processing crsp.dsf cache', year)
+        dsf = fetch(conn, """
+                           select %s
+                           from crsp.dsf
+                           where %s
+                           and date between '%s-01-01' and '%s-12-31'
+                           """ % (', '.join(DSF_SCHEMA.names), lower, year, year), dtypes=WIDE)
+        if len(dsf) == 0:
+            continue
+        # every download is a new file in the partition of its year, named by its last date
+        name = 'part-%s.parquet' % dsf['date'].max().strftime('%Y%m%d')
+        _write(dsf, os.path.join(CACHE_DIR, 'dsf', 'year=%s' % year, name), DSF_SCHEMA)
+        new_rows += len(dsf)
+    if new_rows > 0 or not os.path.exists(os.path.join(CACHE_DIR, 'dsedelist.parquet')):
+        dlret = fetch(conn, """
+                             select permno, dlret, dlstdt
+                             from crsp.dsedelist
+                             """, dtypes=WIDE)
+        _write(dlret, os.path.join(CACHE_DIR, 'dsedelist.parquet'))
+    if new_rows > 0 or not os.path.exists(os.path.join(CACHE_DIR, 'dsenames.parquet')):
+        names = fetch(conn, """
+                             select permno, namedt, nameendt, exchcd, shrcd
+                             from crsp.dsenames
+                             """, dtypes={**WIDE, 'exchcd': 'float64', 'shrcd': 'float64'})
+        _write(names, os.path.join(CACHE_DIR, 'dsenames.parquet'))
+    if new_rows > 0 or not os.path.exists(os.path.join(CACHE_DIR, 'factors_daily.parquet')):
+        factors = fetch(conn, """
+                               select date, rf, mktrf, smb, hml
+                               from ff.factors_daily
+                               """, dtypes=WIDE)
+        _write(factors, os.path.join(CACHE_DIR, 'factors_daily.parquet'))
+    return new_rows
+
+
+def _key(permno, date):
+    # permno and date in one sorted int64 key, dates are days since 1900 which fit in 5 digits
+    days = (np.asarray(date, dtype='datetime64[D]') - np.datetime64('1900-01-01', 'D')).astype(np.int64)
+    return np.asarray(permno, dtype=np.int64) * 100000 + days
+
+
+def universe_intervals(conn, lookback=12, update=True):
+    """
+    Date ranges of crsp.dsenames where a security is in the universe (EXCHCD and SHRCD).
+    Every range starts lookback months earlier, so the windows of the first months in the universe keep their
+    daily data from before.
+
+    :param conn: WRDS connection, used to bring the cache up to date
+    :param lookback: number of months of daily data kept before a security enters the universe
+    :param update: download crsp.dsenames if it is not in the cache yet
+    :return: first and last keys (see _key) of the ranges, sorted by the first key
+    """
+    if update and not os.path.exists(os.path.join(CACHE_DIR, 'dsenames.parquet')):
+        refresh(conn)
+    names = pd.read_parquet(os.path.join(CACHE_DIR, 'dsenames.parquet'))
+    names = names[names['exchcd'].isin(EXCHCD) & names['shrcd'].isin(SHRCD)].dropna(subset=['namedt'])
+    first = _key(names['permno'].to_numpy(), (names['namedt'] - pd.DateOffset(months=lookback)).to_numpy())
+    last = _key(names['permno'].to_numpy(), names['nameendt'].fillna(pd.Timestamp('2099-12-31')).to_numpy())
+    order = np.argsort(first, kind='stable')
+    # ranges of a security may overlap once moved back, keep the furthest end of the ranges started so far
+    # (the keys of a permno are all below the keys of the next permno)
+    return first[order], np.maximum.accumulate(last[order]) if len(order) > 0 else last
+
+
+def in_universe(permno, date, intervals):
+    """
+
+    :param permno: permno of every row
+    :param date: date of every row
+    :param intervals: ranges from universe_intervals
+    :return: True for the rows in the universe
+    """
+    first, last = intervals
+    key = _key(permno, date)
+    if len(first) == 0:
+        return np.zeros(len(key), dtype=bool)
+    pos = np.searchsorted(first, key, side='right') - 1
+    return (pos >= 0) & (key <= last[np.maximum(pos, 0)])
+
+
+def universe_rows(conn, df, universe=True, update=False):
+    """
+    Rows of an output in the universe at their date. load_dsf keeps the lookback months before a security enters the
+    universe for the windows of its first months in it, the windows ending in these months are cut short by the filter
+    and their rows are dropped here.
+
+    :param conn: WRDS connection, used to bring the cache up to date
+    :param df: output with permno and date
+    :param universe: False for the outputs of all the securities (--all-securities), df is kept as it is
+    :param update: download crsp.dsenames if it is not in the cache yet
+    :return: rows of df in the universe
+    """
+    if not universe:
+        return df
+    keep = in_universe(df['permno'].to_numpy(), df['date'].to_numpy(), universe_intervals(conn, 0, update))
+    return df[keep].reset_index(drop=True)
+
+
+def load_dsf(conn, columns, factors=None, start=START, update=True, universe=True):
+    """
+    Read crsp.dsf from the cache, like select permno, date, columns from crsp.dsf left join ff.factors_daily.
+    The cache is read in batches and every batch gets the compact dtypes of fetch.COMPACT (int32 permno, float32
+    returns, prices and volumes), so the 64 bits data is never in memory at once.
+
+    :param conn: WRDS connection, used to bring the cache up to date
+    :param columns: columns of crsp.dsf besides permno and date
+    :param factors: columns of ff.factors_daily merged on date
+    :param start: first date, None for START
+    :param update: append the new days from WRDS before reading
+    :param universe: keep only the rows of the securities in the universe at that date (see universe_intervals),
+                     the other rows are dropped batch by batch. The lookback rows are kept too, the outputs drop them
+                     with universe_rows
+    :return: dataframe sorted by permno and date
+    """
+    if update:
+        refresh(conn)
+    intervals = universe_intervals(conn, update=update) if universe else None
+    dataset = ds.dataset(os.path.join(CACHE_DIR, 'dsf'), format='parquet', partitioning='hive')
+    start = pd.Timestamp(START if start is None else start)
+    # one file and a few batches are read ahead, so only a few 64 bits batches are in memory at any time
+    scanner = dataset.scanner(columns=['permno', 'date'] + list(columns),
+                              filter=(ds.field('year') >= start.year) & (ds.field('date') >= start),
+                              batch_readahead=2, fragment_readahead=1)
+    schema = _compact_schema(scanner.projected_schema)
+
+    def read(batch):
+        if intervals is not None:
+            batch = batch.filter(in_universe(batch.column('permno').to_numpy(),
+                                             batch.column('date').to_numpy(zero_copy_only=False), intervals))
+        return batch.cast(schema)
+
+    table = pa.Table.from_batches([read(batch) for batch in scanner.to_batches()], schema)
+    crsp = table.to_pandas(self_destruct=True, split_blocks=True)
+    del table
+    # give the memory of the 64 bits batches back to the system
+    pa.default_memory_pool().release_unused()
+    # the cache is partitioned by year and appended by day, sort it once here
+    order = np.lexsort((crsp['date'].to_numpy(), crsp['permno'].to_numpy()))
+    if np.any(order[1:] < order[:-1]):
+        crsp = crsp.take(order)
+    crsp = crsp.reset_index(drop=True)
+    # and the memory of the unsorted columns, which were arrow buffers
+    pa.default_memory_pool().release_unused()
+    if factors:
+        # left merge on date by looking up the sorted factor dates, the panel is not copied
+        factors_daily = compact(pd.read_parquet(os.path.join(CACHE_DIR, 'factors_daily.parquet'),
+                                                columns=['date'] + list(factors)))
+        factors_daily = factors_daily.sort_values('date').drop_duplicates('date', keep='last')
+        crsp_date = crsp['date'].to_numpy()
+        factor_date = factors_daily['date'].to_numpy()
+        pos = np.minimum(np.searchsorted(factor_date, crsp_date), max(len(factor_date) - 1, 0))
+        found = factor_date[pos] == crsp_date if len(factor_date) > 0 else np.zeros(len(crsp), dtype=bool)
+        for col in factors:
+            crsp[col] = np.where(found, factors_daily[col].to_numpy()[pos], np.nan).astype(COMPACT.get(col, float))
+    footprint(crsp, 'crsp.dsf')
+    return crsp
+
+
+def load_delist(conn, update=True):
+    """
+    Read crsp.dsedelist from the cache.
+
+    :param conn: WRDS connection, used to bring the cache up to date
+    :param update: append the new days from WRDS before reading
+    :return: dataframe with permno, dlret and dlstdt
+    """
+    if update and not os.path.exists(os.path.join(CACHE_DIR, 'dsedelist.parquet')):
+        refresh(conn)
+    return compact(pd.read_parquet(os.path.join(CACHE_DIR, 'dsedelist.parquet')))
+
+
+def delist_returns(crsp, dlret):
+    """
+    dlret of every row of crsp, like a left merge of crsp.dsedelist on permno and date = dlstdt, without copying crsp.
+
+    :param crsp: dataframe sorted by permno and date
+    :param dlret: crsp.dsedelist from load_delist
+    :return: array of dlret, NaN when the stock is not delisted on that day
+    """
+    dlret = dlret.dropna(subset=['dlstdt'])
+    dlret_key = _key(dlret['permno'].to_numpy(), dlret['dlstdt'].to_numpy())
+    order = np.argsort(dlret_key, kind='stable')
+    dlret_key = dlret_key[order]
+    crsp_key = _key(crsp['permno'].to_numpy(), crsp['date'].to_numpy())
+    res = np.full(len(crsp), np.nan, dtype=np.float32)
+    if len(dlret_key) == 0:
+        return res
+    # the last delisting record of a day is kept if there are several
+    pos = np.searchsorted(dlret_key, crsp_key, side='right') - 1
+    found = (pos >= 0) & (dlret_key[np.maximum(pos, 0)] == crsp_key)
+    res[found] = dlret['dlret'].to_numpy()[order][pos[found]]
+    return res
+
+
+if __name__ == '__main__':
+    from offline_wrds import connect
+    from instrument import stage, count
+    stage('refresh cache')
+    new = refresh(connect())
+    count(new)
+    print('new rows of crsp.dsf:', new)
@@ -0,0 +1,166 @@
+# All the daily characteristics in one pass
+# The single characteristic files (capm.py, rvar_ff3.py, rvar_mean.py, ill.py, maxret_d.py, std_dolvol.py,
+# std_turn.py, bid_ask_spread.py, zerotrade.py) each read crsp.dsf, label the months, split the firms and build the
+# same 3 months windows. Here we read crsp.dsf once with all the columns, build the windows once for every range of
+# firms and compute all the characteristics over them.
+# The output is daily_chars.feather with all the characteristics, and the files of the single characteristic files
+# used by merge_chars.py (capm.feather, rvar_mean.feather...) cut from it, so merge_chars.py works the same.
+# The single characteristic files still work on their own.
+# We use all the CPUs by default, you can change the number of process with --processes
+# --windows adds other windows computed in the same pass, e.g. --windows 1,6,12 adds beta_1m, beta_6m, beta_12m...
+# to daily_chars.feather (7 days per month at least by default, see window_specs in rolling.py), the files of the
+# single characteristic files keep the 3 months window
+# --daily computes the characteristics at every trading day over the last 63 trading days instead (--days to change
+# it), with the same window functions, and writes them to daily_chars_daily/year=YYYY/*.parquet. The month_end column
+# marks the last trading day of every month of the firm, the month end rows of this panel are a month end version
+# of the characteristics over 63 days (the month end files above use the 3 calendar months windows)
+
+import sys
+import pandas as pd
+import numpy as np
+import pyarrow.feather as feather
+from offline_wrds import connect
+from rolling import *
+from crsp_cache import load_dsf, load_delist, delist_returns, universe_intervals, in_universe, universe_rows
+from instrument import stage, count
+
+# characteristics computed in the pass: name(s), window function (see rolling.py) and columns
+STATS = [(['beta', 'alpha_capm', 'rvar_capm', 'r2_capm'], capm, ['exret', 'mktrf']),
+         ('rvar_ff3', window_res_var, ['exret', 'mktrf', 'smb', 'hml']),
+         ('rvar_mean', rvar_mean, ['ret']),
+         ('ill', ill, ['retadj', 'prc', 'vol']),
+         (['maxret', 'maxret5'], maxret, ['ret']),
+         ('std_dolvol', std_dolvol, ['vol', 'prc']),
+         ('std_turn', std_turn, ['vol', 'shrout']),
+         ('baspread', baspread, ['askhi', 'bidlo']),
+         ('zerotrade', zerotrade, ['vol', 'shrout'])]
+
+# files of the single characteristic files: column whose missing rows are dropped, and columns of the file
+OUTPUTS = {'capm.feather': ('rvar_capm', ['beta', 'alpha_capm', 'rvar_capm', 'r2_capm']),
+           'rvar_ff3.feather': ('rvar_ff3', ['rvar_ff3']),
+           'rvar_mean.feather': ('rvar_mean', ['rvar_mean']),
+           'ill.feather': ('ill', ['ill']),
+           'maxret.feather': ('maxret', ['maxret', 'maxret5']),
+           'std_dolvol.feather': ('std_dolvol', ['std_dolvol']),
+           'std_turn.feather': ('std_turn', ['std_turn']),
+           'baspread.feather': ('baspread', ['baspread']),
+           'zerotrade.feather': ('zerotrade', ['zerotrade'])}
+
+NAMES = [name for names, stat, columns in STATS for name in ([names] if isinstance(names, str) else names)]
+COLUMNS = list(dict.fromkeys(col for names, stat, columns in STATS for col in columns))
+
+###################
+# Connect to WRDS #
+###################
+conn = connect()
+
+# with --update, only the months from the last month in daily_chars.feather on are computed again
+# and appended to it (see update_from in rolling.py)
+args = daily_args()
+HORIZONS = [('', 3, 21, 21)] + window_specs(args.windows)
+ALL_NAMES = [name + suffix for suffix, months, min_obs, min_vol in HORIZONS for name in NAMES]
+# (--daily always computes the whole daily panel)
+old, first_date, start = update_from('daily_chars.feather', args.update and not args.daily,
+                                     window=max(months for suffix, months, min_obs, min_vol in HORIZONS))
+
+stage('fetch crsp.dsf')
+# CRSP Block, read from the local cache of crsp.dsf and ff.factors_daily (see crsp_cache.py)
+crsp = load_dsf(conn, ['ret', 'vol', 'prc', 'shrout', 'askhi', 'bidlo'], factors=['rf', 'mktrf', 'smb', 'hml'],
+                start=start, universe=args.universe)
+
+# add delisting return, ret keeps its missing values for maxret and rvar_mean
+crsp['dlret'] = delist_returns(crsp, load_delist(conn))
+crsp['retadj'] = (1 + crsp['ret'].fillna(0)) * (1 + crsp['dlret'].fillna(0)) - 1
+crsp['exret'] = crsp['retadj'] - crsp['rf']
+
+# make sure same unit for vol and shrout
+crsp['shrout'] = crsp['shrout'] * 1000  # from thousands to 1 unit
+
+count(len(crsp))
+# date ranges of the securities in the universe, without the lookback months
+UNIVERSE = universe_intervals(conn, 0, update=False) if args.universe else None
+
+stage('month end index', rows=len(crsp))
+# label the months of every firm (0, 1, 2, ...), the last trading day of a month is its month end row,
+# and create a firm list with the number of months of every firm
+crsp['month_count'], month_end, df_firm = month_index(crsp['permno'].to_numpy(), crsp['date'].to_numpy())
+
+
+def get_daily_chars(df, firm_list):
+    """
+
+    :param df: stock dataframe
+    :param firm_list: list of firms matching stock dataframe
+    :return: month end rows of df and all the characteristics of every window at these rows
+    """
+    return rolling_many(df, STATS, horizons=HORIZONS)
+
+
+def get_daily_chars_daily(df, firm_list):
+    """
+
+    :param df: stock dataframe
+    :param firm_list: list of firms matching stock dataframe
+    :return: every row of df, all the characteristics over the last days trading days at every row and the month end
+             flag of every row
+    """
+    rows, result = rolling_many(df, STATS, args.days, daily=True)
+    permno = df['permno'].to_numpy()
+    month_count = df['month_count'].to_numpy()
+    result['month_end'] = np.append((permno[1:] != permno[:-1]) | (month_count[1:] != month_count[:-1]), True)
+    if args.universe:
+        # without the lookback rows of load_dsf, see universe_rows
+        keep = in_universe(permno[rows], df['date'].to_numpy()[rows], UNIVERSE)
+        rows, result = rows[keep], {name: value[keep] for name, value in result.items()}
+    return rows, result
+
+
+def main_daily(processes, out_dir='daily_chars_daily'):
+    """
+
+    :param processes: number of processes
+    :param out_dir: directory of the Parquet files, partitioned by year
+    """
+    # every row gets a window, smaller ranges of rows keep the window arrays of a task small
+    # out_dir is its own checkpoint, a run stopped on the way goes on with the ranges not written yet
+    tasks = max(4, int(np.ceil(len(crsp) / (processes * 250000))))
+    run_shared(crsp, df_firm, get_daily_chars_daily, COLUMNS, NAMES, processes, tasks=tasks, out_dir=out_dir,
+               checkpoint=out_dir, tag=('daily', args.days))
+
+
+def main(processes):
+    """
+
+    :param processes: number of processes, we split the firms into 4 times as many ranges of rows
+    :return: a dataframe with all the characteristics of the month end rows
+    """
+    return run_shared(crsp, df_firm, get_daily_chars, COLUMNS, ALL_NAMES, processes, rows=month_end,
+                      checkpoint=args.checkpoint, tag=HORIZONS)
+
+
+# Note: the number of processes is all the CPUs by default, you can change it with --processes, e.g.
+# python daily_chars.py --processes 20
+stage('window compute', rows=len(crsp))
+if __name__ == '__main__':
+    if args.daily:
+        main_daily(args.processes)
+        sys.exit(0)
+    crsp = main(args.processes)
+
+stage('write')
+# process dataframe
+crsp = crsp.dropna(subset=ALL_NAMES, how='all')  # drop NA due to rolling
+crsp = crsp.reset_index(drop=True)
+crsp = crsp[['permno', 'date'] + ALL_NAMES]
+
+crsp = universe_rows(conn, crsp, args.universe)  # without the lookback rows of load_dsf
+crsp = append_update(old, crsp, first_date)
+
+with open('daily_chars.feather', 'wb') as f:
+    feather.write_feather(crsp, f)
+
+# the files of the single characteristic files, for merge_chars.py
+for file, (key, names) in OUTPUTS.items():
+    output = crsp.dropna(subset=[key]).reset_index(drop=True)[['permno', 'date'] + names]
+    with open(file, 'wb') as f:
+        feather.write_feather(output, f)
@@ -0,0 +1,169 @@
+# Daily characteristics as window queries in DuckDB
+# rvar_mean, ill, std_turn, std_dolvol, maxret and zerotrade are plain aggregates over the 3 months window of a firm,
+# so they can be written as SQL window functions over the Parquet cache of crsp.dsf (see crsp_cache.py). DuckDB runs
+# the query on all the CPUs and spills to disk when the data does not fit in memory, the daily panel is never loaded in
+# Python and only the month end rows come back.
+# This is an optional backend, it needs duckdb (pip install duckdb). It writes the same files as rvar_mean.py, ill.py,
+# std_turn.py, std_dolvol.py, maxret_d.py and zerotrade.py, so it can replace them before merge_chars.py:
+# python duckdb_chars.py
+# The number of threads is all the CPUs by default, you can change it with --processes, and --update works as in the
+# other daily scripts. DuckDB takes 80% of the memory by default, you can change it with the environment variable
+# DUCKDB_MEMORY_LIMIT (e.g. 8GB).
+
+import os
+import pandas as pd
+import pyarrow.feather as feather
+from offline_wrds import connect
+from rolling import daily_args, update_from, append_update
+from crsp_cache import CACHE_DIR, START, EXCHCD, SHRCD, refresh
+from instrument import stage, count
+
+
+def _var(x):
+    # variance of x over the window from the monthly counts, sums and sums of squares of x
+    n, s, q = ['sum(%s_%s) over w' % (x, part) for part in 'nsq']
+    return 'if(%s > 1, greatest((%s - %s * %s / %s) / (%s - 1), 0), null)' % (n, q, s, s, n, n)
+
+
+# characteristics of the query and their SQL expression over the window w of monthly aggregates
+# the expressions follow the window functions of rolling.py: missing values are skipped, ill keeps inf, the variances
+# of windows with inf are missing, and the turnover of a zero trading day is inf in zerotrade
+CHARS = {'rvar_mean': _var('ret0'),
+         'ill': "if(sum(ill_inf) over w > 0, 'inf'::double, sum(ill_s) over w / nullif(sum(ill_n) over w, 0))",
+         'std_turn': 'if(sum(turn_inf) over w > 0, null, sqrt(%s))' % _var('turn'),
+         'std_dolvol': 'sqrt(%s)' % _var('dolvol'),
+         'maxret': 'max(maxret) over w',
+         'maxret5': "list_avg(list_sort(flatten(list(top5) over w), 'DESC')[1:5])",
+         'zerotrade': '(sum(zero) over w'
+                      ' + if(sum(turn_zero) over w > 0, 0, 1 / coalesce(sum(turn_s) over w, 0)) / 11000)'
+                      ' * (21 * 3) / sum(n) over w'}
+
+# files written, as in the single characteristic files
+OUTPUTS = {'rvar_mean.feather': ['rvar_mean'],
+           'ill.feather': ['ill'],
+           'std_turn.feather': ['std_turn'],
+           'std_dolvol.feather': ['std_dolvol'],
+           'maxret.feather': ['maxret', 'maxret5'],
+           'zerotrade.feather': ['zerotrade']}
+
+# the daily rows are first aggregated by firm and month (counts, sums, sums of squares, max and 5 largest returns),
+# then every window is the last 3 monthly rows of the firm, that is the last 3 months with trading days as in
+# month_windows of rolling.py, and the monthly aggregates are added up over the window
+QUERY = """
+        with dlret as (
+            select permno, dlstdt, arg_max(dlret, file_row_number) as dlret
+            from read_parquet('{cache}/dsedelist.parquet', file_row_number = true)
+            group by permno, dlstdt
+        ),
+        universe as (
+            -- date ranges of the securities in the universe, moved back by the lookback months (universe_intervals)
+            select permno, namedt - to_months({lookback}) as first, namedt as entry,
+                   coalesce(nameendt, date '2099-12-31') as last
+            from read_parquet('{cache}/dsenames.parquet')
+            where exchcd in ({exchcd}) and shrcd in ({shrcd})
+        ),
+        daily as (
+            select d.permno, d.date, d.ret, d.vol, date_trunc('month', d.date) as month,
+                   coalesce(d.ret, 0) as ret0,
+                   -- absolute return over dollar volume, 0 / 0 is missing and x / 0 is inf as in numpy
+                   abs((1 + coalesce(d.ret, 0)) * (1 + coalesce(l.dlret, 0)) - 1) / (abs(d.prc) * d.vol) as ill,
+                   if(d.shrout = 0, null, d.vol / (d.shrout * 1000)) as turn,
+                   coalesce(d.vol <> 0 and d.shrout = 0, false) as turn_inf,
+                   ln(nullif(abs(d.vol * d.prc), 0)) as dolvol
+            from read_parquet('{cache}/dsf/*/*.parquet', hive_partitioning = true) d
+            left join dlret l on d.permno = l.permno and d.date = l.dlstdt
+            where d.year >= {year} and d.date >= '{start}'
+            and ({all} or exists (select 1 from universe u
+                                  where u.permno = d.permno and d.date between u.first and u.last))
+        ),
+        monthly as (
+            select permno, month, max(date) as date, count(*) as n, count(vol) as n_vol,
+                   count(ret0) as ret0_n, sum(ret0) as ret0_s, sum(ret0 * ret0) as ret0_q,
+                   count(ill) filter (where not isnan(ill) and not isinf(ill)) as ill_n,
+                   sum(ill) filter (where not isnan(ill) and not isinf(ill)) as ill_s,
+                   count_if(isinf(ill)) as ill_inf,
+                   count(turn) as turn_n, sum(turn) as turn_s, sum(turn * turn) as turn_q,
+                   count_if(turn_inf) as turn_inf, count_if(turn = 0 or turn_inf) as turn_zero,
+                   count(dolvol) as dolvol_n, sum(dolvol) as dolvol_s, sum(dolvol * dolvol) as dolvol_q,
+                   count_if(vol = 0) as zero, max(ret) as maxret, max(ret, 5) as top5
+            from daily
+            group by permno, month
+        ),
+        windows as (
+            select permno, date, sum(n) over w as n, sum(n_vol) over w as n_vol, {chars}
+            from monthly
+            window w as (partition by permno order by month rows between {preceding} preceding and current row)
+        )
+        -- without the lookback rows, their windows are cut short by the universe filter (see universe_rows)
+        select * from windows o
+        where {all} or exists (select 1 from universe u
+                               where u.permno = o.permno and o.date between u.entry and u.last)
+        order by permno, date
+        """
+
+
+def duckdb_chars(start=None, names=None, window=3, min_obs=21, min_vol=21, threads=None, cache=CACHE_DIR,
+                 universe=True, lookback=12):
+    """
+    Compute the characteristics of CHARS over the window ending at every month end row of the cached crsp.dsf.
+
+    :param start: first date of daily data, None for START
+    :param names: characteristics of CHARS, all of them by default
+    :param window: number of months in a window
+    :param min_obs: we drop the window if observations in it are less than min_obs
+    :param min_vol: we drop the window if non-missing vol in it are less than min_vol
+    :param threads: number of DuckDB threads, all the CPUs by default
+    :param cache: directory of the cache of crsp_cache.py
+    :param universe: keep only the rows of the securities in the universe at that date, as load_dsf in crsp_cache.py
+    :param lookback: number of months of daily data kept before a security enters the universe
+    :return: dataframe with permno, date and the characteristics of every month end row
+    """
+    import duckdb
+
+    names = list(CHARS) if names is None else names
+    start = pd.Timestamp(START if start is None else start)
+    db = duckdb.connect()
+    try:
+        if threads is not None:
+            db.execute('set threads = %d' % threads)
+        if os.environ.get('DUCKDB_MEMORY_LIMIT'):
+            db.execute("set memory_limit = '%s'" % os.environ['DUCKDB_MEMORY_LIMIT'])
+        # the output is sorted anyway
+        db.execute('set preserve_insertion_order = false')
+        db.execute('set enable_progress_bar = false')
+        sql = QUERY.format(cache=cache.replace("'", "''"), year=start.year, start=start.strftime('%Y-%m-%d'),
+                           preceding=window - 1, lookback=lookback, all='false' if universe else 'true',
+                           exchcd=', '.join(map(str, EXCHCD)), shrcd=', '.join(map(str, SHRCD)),
+                           chars=', '.join('%s as %s' % (CHARS[name], name) for name in names))
+        crsp = db.execute(sql).df()
+    finally:
+        db.close()
+    # windows with too few observations
+    drop = (crsp['n'] < min_obs) | (crsp['n_vol'] < min_vol)
+    crsp.loc[drop, names] = float('nan')
+    crsp['permno'] = crsp['permno'].astype(int)
+    crsp['date'] = crsp['date'].astype('datetime64[ns]')
+    return crsp[['permno', 'date'] + names]
+
+
+if __name__ == '__main__':
+    args = daily_args()
+    # with --update, every file keeps its rows before its last month, the daily data is loaded from the earliest start
+    updates = {file: update_from(file, args.update) for file in OUTPUTS}
+    starts = [start for old, first_date, start in updates.values()]
+    start = None if any(s is None for s in starts) else min(starts)
+
+    # bring the cache of crsp.dsf and crsp.dsedelist up to date
+    stage('refresh cache')
+    count(refresh(connect()))
+    stage('window query')
+    crsp = duckdb_chars(start, threads=args.processes, universe=args.universe)
+    count(len(crsp))
+
+    stage('write')
+    for file, names in OUTPUTS.items():
+        old, first_date, start = updates[file]
+        output = crsp.dropna(subset=[names[0]]).reset_index(drop=True)[['permno', 'date'] + names]
+        output = append_update(old, output, first_date)
+        with open(file, 'wb') as f:
+            feather.write_feather(output, f)
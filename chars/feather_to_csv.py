@@ -1,15 +1,20 @@
 import pickle as pkl
 import pyarrow.feather as feather
 import pandas as pd
+from instrument import stage, count
 
 # with open('chars60_raw_imputed.feather', 'rb') as f:
 #     chars = feather.read_feather(f)
 
+stage('read chars')
 with open('chars60_rank_imputed.feather', 'rb') as f:
     chars = feather.read_feather(f)
 
 print(chars.columns.values)
 
+count(len(chars))
+
+stage('split by decade', rows=len(chars))
 chars['date'] = pd.to_datetime(chars['date'])
 chars['year'] = chars['date'].dt.year
 chars_1970s = chars[chars['year'] < 1980]
@@ -19,6 +24,7 @@ chars_2000s = chars[(chars['year'] >= 2000) & (chars['year'] < 2010)]
 chars_2010s = chars[(chars['year'] >= 2010) & (chars['year'] < 2020)]
 chars_2020s = chars[(chars['year'] >= 2020) & (chars['year'] < 2030)]
 
+stage('write csv', rows=len(chars))
 # raw
 # chars_1970s.to_csv('chars60_raw_1970s.csv', index=0)
 # chars_1980s.to_csv('chars60_raw_1980s.csv', index=0)
@@ -0,0 +1,82 @@
+# Typed and chunked download from WRDS
+# raw_sql returns float64 and object columns, and the scripts then fix them with astype(int) and pd.to_datetime,
+# keeping the full width data in memory. Here we read the query in chunks and give every chunk compact dtypes as it
+# arrives: int32 identifiers, float32 returns, prices and volumes, categorical exchcd/shrcd and datetime64 dates.
+# float32 keeps 7 significant digits, more than the 6 decimals of CRSP returns. It is not exact for volumes above 2^24
+# (about 16.8M) shares, they are rounded to 7 significant digits (relative error below 6e-8), far below what dolvol,
+# turnover and ill need, and zero volumes (zerotrade) stay exact. The rolling kernels (rolling.py) compute in float64
+# anyway, so only the storage is smaller. crsp_cache.py keeps its Parquet files in 64 bits and compacts on read.
+
+import numpy as np
+import pandas as pd
+
+# compact dtype of every column the scripts use, the other columns are kept as they are
+COMPACT = {'permno': 'int32', 'permco': 'int32', 'lpermno': 'int32',
+           'ret': 'float32', 'retx': 'float32', 'dlret': 'float32', 'retadj': 'float32', 'exret': 'float32',
+           'prc': 'float32', 'vol': 'float32', 'shrout': 'float32', 'askhi': 'float32', 'bidlo': 'float32',
+           'cfacpr': 'float32', 'cfacshr': 'float32', 'rf': 'float32', 'mktrf': 'float32', 'smb': 'float32',
+           'hml': 'float32', 'sprtrn': 'float32',
+           'exchcd': 'category', 'shrcd': 'category',
+           'date': 'datetime64[ns]', 'dlstdt': 'datetime64[ns]', 'namedt': 'datetime64[ns]',
+           'nameendt': 'datetime64[ns]', 'linkdt': 'datetime64[ns]', 'linkenddt': 'datetime64[ns]',
+           'datadate': 'datetime64[ns]', 'rdq': 'datetime64[ns]'}
+
+
+def compact(df, dtypes=None):
+    """
+    Give the columns of df compact dtypes, in place.
+
+    :param df: dataframe
+    :param dtypes: dtype of each column, default is COMPACT
+    :return: df
+    """
+    dtypes = COMPACT if dtypes is None else dtypes
+    for col in df.columns:
+        dtype = dtypes.get(col)
+        if dtype is None or df[col].dtype == dtype:
+            continue
+        if dtype.startswith('datetime'):
+            df[col] = pd.to_datetime(df[col]).astype(dtype)
+        elif dtype.startswith('int') and df[col].isna().any():
+            # identifiers with missing values (from left joins) stay floats, float32 is exact below 2^24
+            df[col] = df[col].astype('float32')
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def fetch(conn, sql, dtypes=None, chunksize=500000):
+    """
+    conn.raw_sql in chunks of rows, every chunk gets compact dtypes before the next one is read.
+
+    :param conn: WRDS connection
+    :param sql: query
+    :param dtypes: dtype of each column, default is COMPACT
+    :param chunksize: number of rows of each chunk
+    :return: dataframe
+    """
+    dtypes = COMPACT if dtypes is None else dtypes
+    # categories are only set after concatenating, the chunks may not have the same categories
+    chunk_dtypes = {col: ('float32' if dtype == 'category' else dtype) for col, dtype in dtypes.items()}
+    chunks = [compact(chunk, chunk_dtypes) for chunk in conn.raw_sql(sql, chunksize=chunksize, return_iter=True)]
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 0 else pd.DataFrame()
+    del chunks
+    for col in df.columns:
+        if dtypes.get(col) == 'category':
+            df[col] = df[col].astype('category')
+    return df
+
+
+def footprint(df, name):
+    """
+    Print the memory used by df, and the memory it would use with float64/int64 columns.
+
+    :param df: dataframe
+    :param name: name printed
+    :return: memory in bytes
+    """
+    memory = df.memory_usage(deep=True).sum()
+    wide = sum(len(df) * 8 if df[col].dtype.kind in 'fiuMb' or isinstance(df[col].dtype, pd.CategoricalDtype)
+               else df[col].memory_usage(deep=True, index=False) for col in df.columns)
+    print('%s: %s rows, %.1f MB (%.1f MB with 64 bits columns)' % (name, len(df), memory / 2 ** 20, wide / 2 ** 20))
+    return memory
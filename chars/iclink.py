@@ -1,12 +1,13 @@
 import pandas as pd
 import numpy as np
 import datetime as dt
-import wrds
+from offline_wrds import connect
 from dateutil.relativedelta import *
 from pandas.tseries.offsets import *
 from pandasql import *
 from fuzzywuzzy import fuzz
 import pyarrow.feather as feather
+from instrument import stage
 
 # reference: https://wrds-www.wharton.upenn.edu/pages/support/applications/python-replications/linking-ibes-and-crsp-data-python/
 #####################################
@@ -33,12 +34,13 @@ import pyarrow.feather as feather
 ###################
 # Connect to WRDS #
 ###################
-conn = wrds.Connection()
+conn = connect()
 
 #########################
 # Step 1: Link by CUSIP #
 #########################
 
+stage('link by cusip')
 # 1.1 IBES: Get the list of IBES Tickers for US firms in IBES
 _ibes1 = conn.raw_sql("""
                       select ticker, cusip, cname, sdates from ibes.id
@@ -150,6 +152,7 @@ _link1_2 = _link1_2.drop_duplicates()
 _nomatch1 = pd.merge(_ibes2[['ticker']], _link1_2[['permno','ticker']], on='ticker', how='left')
 _nomatch1 = _nomatch1.loc[_nomatch1.permno.isnull()].drop(['permno'], axis=1).drop_duplicates()
 
+stage('link by ticker')
 # Add IBES identifying information
 
 ibesid = conn.raw_sql(""" select ticker, cname, oftic, sdates, cusip from ibes.id """)
@@ -235,6 +238,7 @@ _link2_3 = _link2_3[['ticker','permno','cname','comnam','score']].drop_duplicate
 
 iclink = _link1_2.append(_link2_3)
 
+stage('write', rows=len(iclink))
 # Storing iclink for other program usage
 import pickle as pkl
 
@@ -1,178 +1,93 @@
-# Fama & French 3 factors residual variance
+# Illiquidity
 # Note: Please use the latest version of pandas, this version should support returning to pd.Series after rolling
 # To get a faster speed, we split the big dataframe into small ones
-# Then using different process to calculate the variance
-# We use 20 process to calculate variance, you can change the number of process according to your CPU situation
-# You can use the following code to check your CPU situation
-# import multiprocessing
-# multiprocessing.cpu_count()
+# Then using different process to calculate the illiquidity
+# We use all the CPUs by default, you can change the number of process with --processes
 
 import pandas as pd
 import numpy as np
 import datetime as dt
-import wrds
+from offline_wrds import connect
 from dateutil.relativedelta import *
 from pandas.tseries.offsets import *
 import datetime
 import pickle as pkl
 import pyarrow.feather as feather
 import multiprocessing as mp
+from rolling import *
+from crsp_cache import load_dsf, load_delist, delist_returns, universe_rows
+from instrument import stage, count
 
 ###################
 # Connect to WRDS #
 ###################
-conn = wrds.Connection()
+conn = connect()
 
-# CRSP Block
-crsp = conn.raw_sql("""
-                    select a.permno, a.date, a.ret, a.vol, a.prc
-                    from crsp.dsf as a
-                    where a.date > '01/01/1959'
-                    """)
+# with --update, only the months from the last month in ill.feather on are computed again
+# and appended to it (see update_from in rolling.py)
+args = daily_args()
+old, first_date, start = update_from('ill.feather', args.update)
 
-# sort variables by permno and date
-crsp = crsp.sort_values(by=['permno', 'date'])
-
-# change variable format to int
-crsp['permno'] = crsp['permno'].astype(int)
-
-# Line up date to be end of month
-crsp['date'] = pd.to_datetime(crsp['date'])
+stage('fetch crsp.dsf')
+# CRSP Block, read from the local cache of crsp.dsf and ff.factors_daily (see crsp_cache.py)
+crsp = load_dsf(conn, ['ret', 'vol', 'prc'], start=start, universe=args.universe)
 
 # add delisting return
-dlret = conn.raw_sql("""
-                     select permno, dlret, dlstdt 
-                     from crsp.dsedelist
-                     """)
-
-dlret.permno = dlret.permno.astype(int)
-dlret['dlstdt'] = pd.to_datetime(dlret['dlstdt'])
-dlret['date'] = dlret['dlstdt']
+dlret = load_delist(conn)
 
-# merge delisting return to crsp return
-crsp = pd.merge(crsp, dlret, how='left', on=['permno', 'date'])
+# merge delisting return to crsp return, the daily panel is not copied
+crsp['dlret'] = delist_returns(crsp, dlret)
 crsp['dlret'] = crsp['dlret'].fillna(0)
 crsp['ret'] = crsp['ret'].fillna(0)
 crsp['retadj'] = (1 + crsp['ret']) * (1 + crsp['dlret']) - 1
 
-# find the closest trading day to the end of the month
-crsp['monthend'] = crsp['date'] + MonthEnd(0)
-crsp['date_diff'] = crsp['monthend'] - crsp['date']
-date_temp = crsp.groupby(['permno', 'monthend'])['date_diff'].min()
-date_temp = pd.DataFrame(date_temp)  # convert Series to DataFrame
-date_temp.reset_index(inplace=True)
-date_temp.rename(columns={'date_diff': 'min_diff'}, inplace=True)
-crsp = pd.merge(crsp, date_temp, how='left', on=['permno', 'monthend'])
-crsp['sig'] = np.where(crsp['date_diff'] == crsp['min_diff'], 1, np.nan)
-
-# label every date of month end
-crsp['month_count'] = crsp[crsp['sig'] == 1].groupby(['permno']).cumcount()
-
-# label numbers of months for a firm
-month_num = crsp[crsp['sig'] == 1].groupby(['permno'])['month_count'].tail(1)
-month_num = month_num.astype(int)
-month_num = month_num.reset_index(drop=True)
-
-# mark the number of each month to each day of this month
-crsp['month_count'] = crsp.groupby(['permno'])['month_count'].fillna(method='bfill')
-
-# crate a firm list
-df_firm = crsp.drop_duplicates(['permno'])
-df_firm = df_firm[['permno']]
-df_firm['permno'] = df_firm['permno'].astype(int)
-df_firm = df_firm.reset_index(drop=True)
-df_firm = df_firm.reset_index()
-df_firm = df_firm.rename(columns={'index': 'count'})
-df_firm['month_num'] = month_num
+count(len(crsp))
+
+stage('month end index', rows=len(crsp))
+# label the months of every firm (0, 1, 2, ...), the last trading day of a month is its month end row,
+# and create a firm list with the number of months of every firm
+crsp['month_count'], month_end, df_firm = month_index(crsp['permno'].to_numpy(), crsp['date'].to_numpy())
 
 ######################
 # Calculate residual #
 ######################
 
 
-def get_baspread(df, firm_list):
+def get_ill(df, firm_list):
     """
 
     :param df: stock dataframe
     :param firm_list: list of firms matching stock dataframe
-    :return: dataframe with variance of residual
-    """
-    for firm, count, prog in zip(firm_list['permno'], firm_list['month_num'], range(firm_list['permno'].count()+1)):
-        prog = prog + 1
-        print('processing permno %s' % firm, '/', 'finished', '%.2f%%' % ((prog/firm_list['permno'].count())*100))
-        for i in range(count + 1):
-            # if you want to change the rolling window, please change here: i - 2 means 3 months is a window.
-            temp = df[(df['permno'] == firm) & (i - 2 <= df['month_count']) & (df['month_count'] <= i)]
-            if temp['permno'].count() < 21:
-                pass
-            else:
-                if temp['vol'].notna().sum() < 21:
-                    pass
-                else:
-                    index = temp.tail(1).index
-                    X = pd.DataFrame()
-                    X[['vol', 'prc', 'retadj']] = temp[['vol', 'prc', 'retadj']]
-                    ill = ( abs(X['retadj']) / (abs(X['prc']) * X['vol']) ).mean() ##### Fixed bug on 2025.02.21 #####
-                    df.loc[index, 'ill'] = ill
-    return df
-
-
-def sub_df(start, end, step):
+    :return: month end rows of df and the illiquidity at these rows
     """
+    return rolling_chars(df, 'ill', ill, ['retadj', 'prc', 'vol'])
 
-    :param start: the quantile to start cutting, usually it should be 0
-    :param end: the quantile to end cutting, usually it should be 1
-    :param step: quantile step
-    :return: a dictionary including all the 'firm_list' dataframe and 'stock data' dataframe
-    """
-    # we use dict to store different sub dataframe
-    temp = {}
-    for i, h in zip(np.arange(start, end, step), range(int((end-start)/step))):
-        print('processing splitting dataframe:', round(i, 2), 'to', round(i + step, 2))
-        if i == 0:  # to get the left point
-            temp['firm' + str(h)] = df_firm[df_firm['count'] <= df_firm['count'].quantile(i + step)]
-            temp['crsp' + str(h)] = pd.merge(crsp, temp['firm' + str(h)], how='left',
-                                             on='permno').dropna(subset=['count'])
-        else:
-            temp['firm' + str(h)] = df_firm[(df_firm['count'].quantile(i) < df_firm['count']) & (
-                    df_firm['count'] <= df_firm['count'].quantile(i + step))]
-            temp['crsp' + str(h)] = pd.merge(crsp, temp['firm' + str(h)], how='left',
-                                             on='permno').dropna(subset=['count'])
-    return temp
-
-
-def main(start, end, step):
+
+def main(processes):
     """
 
-    :param start: the quantile to start cutting, usually it should be 0
-    :param end: the quantile to end cutting, usually it should be 1
-    :param step: quantile step
-    :return: a dataframe with calculated variance of residual
+    :param processes: number of processes, we split the firms into 4 times as many ranges of rows
+    :return: a dataframe with calculated illiquidity
     """
-    df = sub_df(start, end, step)
-    pool = mp.Pool()
-    p_dict = {}
-    for i in range(int((end-start)/step)):
-        p_dict['p' + str(i)] = pool.apply_async(get_baspread, (df['crsp%s' % i], df['firm%s' % i],))
-    pool.close()
-    pool.join()
-    result = pd.DataFrame()
-    print('processing pd.concat')
-    for h in range(int((end-start)/step)):
-        result = pd.concat([result, p_dict['p%s' % h].get()])
-    return result
-
-
-# calculate variance of residual through rolling window
-# Note: please split dataframe according to your CPU situation. For example, we split dataframe to (1-0)/0.05 = 20 sub
-# dataframes here, so the function will use 20 cores to calculate variance of residual.
+    return run_shared(crsp, df_firm, get_ill, ['retadj', 'prc'], ['ill'], processes,
+                      checkpoint=args.checkpoint)
+
+
+# calculate illiquidity through rolling window
+# Note: the number of processes is all the CPUs by default, you can change it with --processes, e.g.
+# python ill.py --processes 20
+stage('window compute', rows=len(crsp))
 if __name__ == '__main__':
-    crsp = main(0, 1, 0.05)
+    crsp = main(args.processes)
 
+stage('write')
 # process dataframe
 crsp = crsp.dropna(subset=['ill'])  # drop NA due to rolling
 crsp = crsp.reset_index(drop=True)
 crsp = crsp[['permno', 'date', 'ill']]
 
+crsp = universe_rows(conn, crsp, args.universe)  # without the lookback rows of load_dsf
+crsp = append_update(old, crsp, first_date)
+
 with open('ill.feather', 'wb') as f:
     feather.write_feather(crsp, f)
\ No newline at end of file
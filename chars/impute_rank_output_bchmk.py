@@ -4,10 +4,12 @@ import pyarrow.feather as feather
 import numpy as np
 from tqdm import tqdm
 from functions import *
+from instrument import stage, count
 
 ####################
 #    All Stocks    #
 ####################
+stage('read chars')
 with open('chars_q_raw.feather', 'rb') as f:
     chars_q = feather.read_feather(f)
 
@@ -24,6 +26,9 @@ chars_a['permno'] = chars_a['permno'].astype(int)
 chars_a['jdate'] = pd.to_datetime(chars_a['jdate'])
 chars_a = chars_a.drop_duplicates(['permno', 'jdate'])
 
+count(len(chars_q) + len(chars_a))
+
+stage('merge annual and quarterly', rows=len(chars_a))
 # information list
 obs_var_list = ['gvkey', 'permno', 'jdate', 'ticker', 'conm', 'comnam', 'sic', 'ret', 'retx', 'retadj', 'exchcd', 'shrcd', 'prc', 'shrout']
 # characteristics with quarterly and annual frequency at the same time
@@ -107,10 +112,12 @@ df['sic'] = df.groupby(['permno'])['sic'].fillna(method='ffill')
 df['sic'] = df['sic'].fillna(0)  # na in sic will be converted to 'other' in industry label
 df['sic'] = df['sic'].astype(int)
 
+stage('write raw', rows=len(df))
 # save raw data
 with open('chars_raw_no_impute.feather', 'wb') as f:
     feather.write_feather(df, f)
 
+stage('impute', rows=len(df))
 # impute missing values, you can choose different func form functions.py, such as ffi49/ffi10
 df_impute = df.copy()
 df_impute['date'] = pd.to_datetime(df_impute['date'])
@@ -131,9 +138,11 @@ df_impute['re'] = df_impute['re'].fillna(0)  # re use IBES database, there are l
 # df_impute = df_impute[df_impute['year'] >= 1972]
 # df_impute = df_impute.drop(['year'], axis=1)
 
+stage('write imputed', rows=len(df_impute))
 with open('chars_raw_imputed.feather', 'wb') as f:
     feather.write_feather(df_impute, f)
 
+stage('standardize', rows=len(df))
 # standardize raw data
 df_rank = df.copy()
 df_rank['lag_me'] = df_rank['me']
@@ -145,6 +154,7 @@ df_rank = standardize(df_rank)
 df_rank['log_me'] = np.log(df_rank['lag_me'])
 df_rank.replace([-np.inf, np.inf], 0, inplace=True)  # some firm does not have me
 
+stage('write ranks', rows=len(df_rank))
 with open('chars_rank_no_impute.feather', 'wb') as f:
     feather.write_feather(df_rank, f)
 
@@ -0,0 +1,135 @@
+# Timing and memory of the stages of a script
+# A script marks where every stage starts (SQL fetch, month end indexing, window compute, merge, write...):
+# stage('fetch crsp.dsf')
+# ...
+# stage('window compute', rows=len(crsp))
+# A stage ends where the next one starts, or at the end of the script. Every stage gets its wall and CPU time, its
+# rows per second when it has rows, the memory of the process at its end and the peak memory so far (of the script and
+# of its finished worker processes). The stages are printed as they end, and the run report is written to
+# run_reports/<script>.json at the end of the script, you can change the directory with the environment variable
+# CHARS_REPORT_DIR. Set CHARS_PROFILE=1 to also profile the main process with cProfile, the profile is written to
+# run_reports/<script>.prof (python -m pstats run_reports/<script>.prof to read it).
+
+import atexit
+import cProfile
+import datetime
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+
+REPORT_DIR = os.environ.get('CHARS_REPORT_DIR', 'run_reports')
+
+# report of the run, the stage being timed and the profiler
+_run = {}
+_current = {}
+_profiler = []
+
+
+def _script():
+    return os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'python'
+
+
+def _rss_mb():
+    # memory of the process now, from /proc where there is one
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_mb(who):
+    # peak memory, ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10, 1)
+
+
+def _start():
+    # first stage of the run
+    _run.update({'script': _script(), 'argv': sys.argv[1:], 'pid': os.getpid(),
+                 'start': datetime.datetime.now().isoformat(timespec='seconds'), 'stages': [],
+                 'wall': time.perf_counter(), 'cpu': time.process_time()})
+    if os.environ.get('CHARS_PROFILE', '') not in ('', '0'):
+        _profiler.append(cProfile.Profile())
+        _profiler[0].enable()
+    atexit.register(report)
+
+
+def _end_stage():
+    # close the current stage and add it to the report
+    if not _current:
+        return
+    record = {'name': _current['name'],
+              'seconds': round(time.perf_counter() - _current['wall'], 3),
+              'cpu_seconds': round(time.process_time() - _current['cpu'], 3),
+              'rows': _current['rows'],
+              'rows_per_second': None,
+              'rss_mb': _rss_mb(),
+              'peak_rss_mb': _peak_mb(resource.RUSAGE_SELF),
+              'children_peak_rss_mb': _peak_mb(resource.RUSAGE_CHILDREN)}
+    if record['rows'] is not None and record['seconds'] > 0:
+        record['rows_per_second'] = round(record['rows'] / record['seconds'], 1)
+    _run['stages'].append(record)
+    _current.clear()
+    print('stage %s: %.1f s%s, peak memory %.0f MB' % (
+        record['name'], record['seconds'],
+        '' if record['rows'] is None else ', %s rows (%.0f rows/s)' % (record['rows'], record['rows_per_second'] or 0),
+        record['peak_rss_mb']))
+
+
+def stage(name, rows=None):
+    """
+    End the current stage of the script and start a new one.
+
+    :param name: name of the stage
+    :param rows: number of rows processed by the stage, if known when it starts (see count otherwise)
+    """
+    # worker processes started with spawn import the script again, only the main process is timed
+    if mp.parent_process() is not None:
+        return
+    if _current:
+        _end_stage()
+    elif not _run:
+        _start()
+    _current.update({'name': name, 'rows': rows, 'wall': time.perf_counter(), 'cpu': time.process_time()})
+
+
+def count(rows):
+    """
+    Add rows to the rows processed by the current stage, e.g. the rows of a query once it is fetched.
+
+    :param rows: number of rows
+    """
+    if _current:
+        _current['rows'] = (_current['rows'] or 0) + rows
+
+
+def report(path=None):
+    """
+    End the current stage and write the run report, called at the end of the script.
+
+    :param path: JSON file, default is REPORT_DIR/<script>.json
+    :return: the report
+    """
+    if not _run:
+        return None
+    _end_stage()
+    if _profiler:
+        _profiler[0].disable()
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        _profiler[0].dump_stats(os.path.join(REPORT_DIR, '%s.prof' % _run['script']))
+        _profiler.clear()
+    result = {key: value for key, value in _run.items() if key not in ('wall', 'cpu')}
+    result.update({'end': datetime.datetime.now().isoformat(timespec='seconds'),
+                   'seconds': round(time.perf_counter() - _run['wall'], 3),
+                   'cpu_seconds': round(time.process_time() - _run['cpu'], 3),
+                   'peak_rss_mb': _peak_mb(resource.RUSAGE_SELF),
+                   'children_peak_rss_mb': _peak_mb(resource.RUSAGE_CHILDREN)})
+    path = os.path.join(REPORT_DIR, '%s.json' % _run['script']) if path is None else path
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    return result
@@ -8,12 +8,14 @@ import pickle as pkl
 import pyarrow.feather as feather
 from pandas.tseries.offsets import *
 import numpy as np
-import wrds
+from offline_wrds import connect
+from instrument import stage, count
 
 ######################################################################
 # read return data and fill the missing value in accounting files
-conn = wrds.Connection()
+conn = connect()
 print(f"Connected to WRDS successfully!")
+stage('fetch crsp.msf')
 crsp = conn.raw_sql("""
                     select a.prc, a.ret, a.retx, a.shrout, a.vol, a.date, a.permno, a.permco,
                     b.shrcd, b.exchcd
@@ -26,6 +28,7 @@ crsp = conn.raw_sql("""
                     and b.exchcd between 1 and 3
                     """)
 
+count(len(crsp))
 crsp = crsp.dropna(subset=['ret', 'retx', 'prc'])
 
 # change variable format to int
@@ -38,6 +41,7 @@ crsp['jdate'] = crsp['date'] + MonthEnd(0)  # set all the date to the standard e
 crsp = crsp.dropna(subset=['prc'])
 crsp['me'] = crsp['prc'].abs() * crsp['shrout']  # calculate market equity
 
+stage('market cap', rows=len(crsp))
 # Aggregate Market Cap
 '''
 There are cases when the same firm (permco) has two or more securities (permno) at same date.
@@ -63,6 +67,7 @@ crsp2['me'] = crsp2['me']/1000 # Change from thousand to million
 crsp = crsp2.copy()
 crsp = crsp.sort_values(by=['permno', 'date'])
 
+stage('fetch crsp.msedelist')
 # add delisting return
 dlret = conn.raw_sql("""
                      select permno, dlret, dlstdt 
@@ -84,6 +89,7 @@ crsp = crsp[['permno', 'jdate', 'ret', 'retx', 'retadj', 'me', 'shrcd', 'exchcd'
 crsp.columns = ['permno', 'jdate', 'ret_fill', 'retx_fill', 'retadj_fill', 'me_fill', 'shrcd_fill', 'exchcd_fill']
 ######################################################################
 
+stage('merge annual')
 with open('chars_a_accounting.feather', 'rb') as f:
     chars_a = feather.read_feather(f)
 
@@ -92,25 +98,15 @@ chars_a[['permno', 'gvkey']] = chars_a[['permno', 'gvkey']].astype(int)
 chars_a['jdate'] = pd.to_datetime(chars_a['jdate'])
 chars_a = chars_a.drop_duplicates(['permno', 'jdate'])
 
-with open('beta.feather', 'rb') as f:
-    beta = feather.read_feather(f)
+with open('capm.feather', 'rb') as f:
+    capm = feather.read_feather(f)
 
-beta['permno'] = beta['permno'].astype(int)
-beta['jdate'] = pd.to_datetime(beta['date']) + MonthEnd(0)
-beta = beta[['permno', 'jdate', 'beta']]
-beta = beta.drop_duplicates(['permno', 'jdate'])
+capm['permno'] = capm['permno'].astype(int)
+capm['jdate'] = pd.to_datetime(capm['date']) + MonthEnd(0)
+capm = capm[['permno', 'jdate', 'beta', 'rvar_capm']]
+capm = capm.drop_duplicates(['permno', 'jdate'])
 
-chars_a = pd.merge(chars_a, beta, how='left', on=['permno', 'jdate'])
-
-with open('rvar_capm.feather', 'rb') as f:
-    rvar_capm = feather.read_feather(f)
-
-rvar_capm['permno'] = rvar_capm['permno'].astype(int)
-rvar_capm['jdate'] = pd.to_datetime(rvar_capm['date']) + MonthEnd(0)
-rvar_capm = rvar_capm[['permno', 'jdate', 'rvar_capm']]
-rvar_capm = rvar_capm.drop_duplicates(['permno', 'jdate'])
-
-chars_a = pd.merge(chars_a, rvar_capm, how='left', on=['permno', 'jdate'])
+chars_a = pd.merge(chars_a, capm, how='left', on=['permno', 'jdate'])
 
 with open('rvar_mean.feather', 'rb') as f:
     rvar_mean = feather.read_feather(f)
@@ -235,6 +231,7 @@ chars_a = chars_a.dropna(subset=['permno', 'jdate', 'ret', 'retx', 'retadj'])
 chars_a = chars_a[((chars_a['exchcd'] == 1) | (chars_a['exchcd'] == 2) | (chars_a['exchcd'] == 3)) &
                    ((chars_a['shrcd'] == 10) | (chars_a['shrcd'] == 11))]
 
+stage('write annual', rows=len(chars_a))
 # save data
 with open('chars_a_raw.feather', 'wb') as f:
     feather.write_feather(chars_a, f)
@@ -243,6 +240,7 @@ with open('chars_a_raw.feather', 'wb') as f:
 #     In order to keep the naming tidy, we need to make another chars_q_raw, which is just a temporary dataframe       #
 ########################################################################################################################
 
+stage('merge quarterly')
 with open('chars_q_accounting.feather', 'rb') as f:
     chars_q = feather.read_feather(f)
 
@@ -251,25 +249,15 @@ chars_q[['permno', 'gvkey']] = chars_q[['permno', 'gvkey']].astype(int)
 chars_q['jdate'] = pd.to_datetime(chars_q['jdate'])
 chars_q = chars_q.drop_duplicates(['permno', 'jdate'])
 
-with open('beta.feather', 'rb') as f:
-    beta = feather.read_feather(f)
-
-beta['permno'] = beta['permno'].astype(int)
-beta['jdate'] = pd.to_datetime(beta['date']) + MonthEnd(0)
-beta = beta[['permno', 'jdate', 'beta']]
-beta = beta.drop_duplicates(['permno', 'jdate'])
-
-chars_q = pd.merge(chars_q, beta, how='left', on=['permno', 'jdate'])
-
-with open('rvar_capm.feather', 'rb') as f:
-    rvar_capm = feather.read_feather(f)
+with open('capm.feather', 'rb') as f:
+    capm = feather.read_feather(f)
 
-rvar_capm['permno'] = rvar_capm['permno'].astype(int)
-rvar_capm['jdate'] = pd.to_datetime(rvar_capm['date']) + MonthEnd(0)
-rvar_capm = rvar_capm[['permno', 'jdate', 'rvar_capm']]
-rvar_capm = rvar_capm.drop_duplicates(['permno', 'jdate'])
+capm['permno'] = capm['permno'].astype(int)
+capm['jdate'] = pd.to_datetime(capm['date']) + MonthEnd(0)
+capm = capm[['permno', 'jdate', 'beta', 'rvar_capm']]
+capm = capm.drop_duplicates(['permno', 'jdate'])
 
-chars_q = pd.merge(chars_q, rvar_capm, how='left', on=['permno', 'jdate'])
+chars_q = pd.merge(chars_q, capm, how='left', on=['permno', 'jdate'])
 
 with open('rvar_mean.feather', 'rb') as f:
     rvar_mean = feather.read_feather(f)
@@ -394,6 +382,7 @@ chars_q = chars_q.dropna(subset=['permno', 'jdate', 'ret', 'retx', 'retadj'])
 chars_q = chars_q[((chars_q['exchcd'] == 1) | (chars_q['exchcd'] == 2) | (chars_q['exchcd'] == 3)) &
                    ((chars_q['shrcd'] == 10) | (chars_q['shrcd'] == 11))]
 
+stage('write quarterly', rows=len(chars_q))
 # save data
 with open('chars_q_raw.feather', 'wb') as f:
     feather.write_feather(chars_q, f)
@@ -4,22 +4,24 @@
 import pandas as pd
 import numpy as np
 import datetime as dt
-import wrds
+from offline_wrds import connect
 from dateutil.relativedelta import *
 from pandas.tseries.offsets import *
 from pandasql import *
 import pickle as pkl
 import pyarrow.feather as feather
+from instrument import stage, count
 
 ###################
 # Connect to WRDS #
 ###################
-conn = wrds.Connection()
+conn = connect()
 
 #########################################################################
 # Merging IBES and CRSP by using ICLINK table. Merging last month price #
 #########################################################################
 
+stage('fetch ibes.statsum_epsus and crsp.msf')
 with open('iclink.feather', 'rb')as f:
     iclink = feather.read_feather(f)
 
@@ -50,6 +52,9 @@ crsp_msf['date'] = pd.to_datetime(crsp_msf['date'])
 crsp_msf['date'] = crsp_msf['date']+MonthEnd(0)
 crsp_msf['merge_date'] = crsp_msf['date']+MonthEnd(1)
 
+count(len(ibes))
+
+stage('merge and revisions', rows=len(ibes))
 ibes_iclink = pd.merge(ibes, iclink, how='left', on='ticker')
 ibes_crsp = pd.merge(ibes_iclink, crsp_msf, how='inner', on=['permno', 'merge_date'])
 ibes_crsp.sort_values(by=['ticker', 'fpedats', 'statpers'], inplace=True)
@@ -117,5 +122,6 @@ ibes_crsp = ibes_crsp.drop_duplicates(['ticker', 'statpers'])
 ibes_crsp = ibes_crsp[['ticker', 'statpers', 'fpedats', 'anndats_act', 'curr_act', 'permno', 're']]
 ibes_crsp.rename(columns={'statpers': 'date'}, inplace=True)
 
+stage('write')
 with open('myre.feather', 'wb') as f:
     feather.write_feather(ibes_crsp, f)
\ No newline at end of file
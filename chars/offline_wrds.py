@@ -0,0 +1,460 @@
+# Offline stand-in for the WRDS connection
+# All the scripts download CRSP, Compustat and IBES data from WRDS with conn.raw_sql, so they can not run without an
+# account and network access. Here we generate synthetic data with the same libraries, tables and columns as WRDS,
+# keep them in SQLite files (one file per library) and serve them through a Connection object with the same raw_sql
+# as wrds.Connection, so we can profile and check the whole pipeline on any machine.
+# The data is random, only the shape looks like the real data: firms list and delist during the sample, change their
+# exchange, have missing returns, zero volume days and missing accounting items.
+# Build the data once, scale 1 is about 0.9M rows of crsp.dsf, scale 100 is about the size of the full crsp.dsf:
+# python offline_wrds.py --scale 1 --path offline_wrds
+# Then run the scripts with the environment variable WRDS_OFFLINE pointing to the data, for example
+# WRDS_OFFLINE=offline_wrds CRSP_CACHE=offline_crsp_cache python beta.py
+
+import os
+import re
+import argparse
+import sqlite3
+import numpy as np
+import pandas as pd
+from pandas.tseries.offsets import *
+
+LIBRARIES = ['crsp', 'comp', 'ibes', 'ff']
+
+# columns of comp.funda, the ratio to total assets is the average across firms
+FUNDA_POSITIVE = {'sale': 1.0, 'revt': 1.0, 'cogs': 0.65, 'xsga': 0.2, 'dp': 0.04, 'xrd': 0.03, 'xad': 0.01,
+                  'txp': 0.005, 'txt': 0.02, 'txfed': 0.015, 'txfo': 0.005, 'xint': 0.015, 'capx': 0.05,
+                  'dvt': 0.01, 'ob': 0.002, 'gdwlia': 0.002, 'gdwlip': 0.002, 'gwo': 0.001, 'mib': 0.01,
+                  'ivao': 0.05, 'xpp': 0.01, 'xacc': 0.03, 'rect': 0.15, 'act': 0.45, 'che': 0.12, 'ppegt': 0.5,
+                  'invt': 0.12, 'aco': 0.03, 'intan': 0.08, 'ao': 0.05, 'ppent': 0.3, 'gdwl': 0.05, 'fatb': 0.1,
+                  'fatl': 0.05, 'lct': 0.25, 'dlc': 0.05, 'dltt': 0.2, 'dm': 0.05, 'dcvt': 0.01, 'cshrc': 0.001,
+                  'dcpstk': 0.01, 'pstk': 0.01, 'ap': 0.08, 'lco': 0.05, 'lo': 0.05, 'drc': 0.01, 'drlt': 0.005,
+                  'scstkc': 0.005, 'txditc': 0.03, 'pstkrv': 0.01, 'pstkl': 0.01, 'np': 0.02, 'txdc': 0.005,
+                  'dpc': 0.04}
+# items that can be negative, mean and std of the ratio to total assets
+FUNDA_SIGNED = {'ib': (0.04, 0.08), 'ebitda': (0.12, 0.08), 'ebit': (0.08, 0.08), 'nopi': (0.005, 0.01),
+                'spi': (-0.005, 0.02), 'pi': (0.06, 0.08), 'ni': (0.04, 0.08), 'oancf': (0.08, 0.08),
+                'oiadp': (0.08, 0.08), 'txdi': (0.0, 0.005)}
+FUNDQ_POSITIVE = {'saleq': 0.25, 'revtq': 0.25, 'cogsq': 0.16, 'xsgaq': 0.05, 'txtq': 0.005, 'atq': 1.0,
+                  'actq': 0.45, 'cheq': 0.12, 'lctq': 0.25, 'dlcq': 0.05, 'ppentq': 0.3, 'ppegtq': 0.5,
+                  'txpq': 0.005, 'drcq': 0.01, 'drltq': 0.005, 'xaccq': 0.03, 'pstkq': 0.01, 'pstkrq': 0.01,
+                  'gdwlq': 0.05, 'intanq': 0.08, 'mibq': 0.01, 'ivaoq': 0.05, 'txditcq': 0.03, 'npq': 0.02,
+                  'xrdq': 0.008, 'dpq': 0.01, 'xintq': 0.004, 'invtq': 0.12, 'dlttq': 0.2, 'rectq': 0.15,
+                  'acoq': 0.03, 'apq': 0.08, 'lcoq': 0.05, 'loq': 0.05, 'aoq': 0.05}
+FUNDQ_SIGNED = {'ibq': (0.01, 0.02), 'oiadpq': (0.02, 0.02), 'niq': (0.01, 0.02)}
+# year to date items of comp.fundq, and the quarterly item they add up
+FUNDQ_YTD = {'revty': 'revtq', 'cogsy': 'cogsq', 'saley': 'saleq', 'xrdy': 'xrdq', 'scstkcy': None, 'oancfy': None}
+# items which are missing much more often than the others in Compustat
+SPARSE = ['xrd', 'xad', 'ob', 'gdwlia', 'gdwlip', 'gwo', 'dm', 'dcvt', 'cshrc', 'dcpstk', 'fatb', 'fatl', 'drc',
+          'drlt', 'xpp', 'xacc', 'txfed', 'txfo', 'pstkrv', 'pstkl', 'np', 'xrdq', 'xrdy', 'gdwlq', 'drcq', 'drltq',
+          'xaccq', 'npq', 'ivao', 'ivaoq', 'mib', 'mibq']
+
+# date columns of all the tables, used to return datetime columns and do date arithmetic in SQLite
+DATE_COLUMNS = ['date', 'datadate', 'rdq', 'namedt', 'nameendt', 'nameenddt', 'linkdt', 'linkenddt', 'dlstdt',
+                'statpers', 'fpedats', 'anndats_act', 'sdates']
+
+
+class Connection:
+    """
+    Drop-in replacement of wrds.Connection reading the synthetic data made by generate().
+    SQL is run by SQLite, each library is an attached database so crsp.dsf, comp.funda... work as in WRDS.
+    Date literals like '01/01/1925' and the PostgreSQL difference of two date columns are translated.
+    """
+
+    def __init__(self, path=None, **kwargs):
+        """
+
+        :param path: directory of the SQLite files, default is the environment variable WRDS_OFFLINE
+        :param kwargs: arguments of wrds.Connection (username...), not used
+        """
+        self.path = path or os.environ.get('WRDS_OFFLINE', 'offline_wrds')
+        if not os.path.exists(os.path.join(self.path, 'crsp.sqlite')):
+            raise FileNotFoundError('no offline WRDS data in %s, run python offline_wrds.py first' % self.path)
+        self.connection = sqlite3.connect(':memory:')
+        for library in LIBRARIES:
+            self.connection.execute("attach database '%s' as %s"
+                                    % (os.path.join(self.path, library + '.sqlite'), library))
+
+    def raw_sql(self, sql, coerce_float=True, date_cols=None, index_col=None, params=None, chunksize=500000,
+                return_iter=False, **kwargs):
+        """
+        Same as wrds.Connection.raw_sql, all the date columns are returned as datetime.
+
+        :param sql: SQL written for WRDS
+        :param chunksize: number of rows of each chunk when return_iter is True
+        :param return_iter: return an iterator of dataframes instead of one dataframe
+        :return: dataframe
+        """
+        sql = re.sub(r"'(\d{2})/(\d{2})/(\d{4})'", r"'\3-\1-\2'", sql)
+        dates = '|'.join(DATE_COLUMNS)
+        sql = re.sub(r'\(\s*((?:\w+\.)?(?:%s))\s*-\s*((?:\w+\.)?(?:%s))\s*\)' % (dates, dates),
+                     r'(julianday(\1)-julianday(\2))', sql, flags=re.I)
+
+        def convert(df):
+            for col in df.columns:
+                if col.lower() in DATE_COLUMNS or (date_cols is not None and col in date_cols):
+                    df[col] = pd.to_datetime(df[col])
+            if index_col is not None:
+                df = df.set_index(index_col)
+            return df
+
+        if return_iter:
+            chunks = pd.read_sql_query(sql, self.connection, coerce_float=coerce_float, params=params,
+                                       chunksize=chunksize)
+            return (convert(df) for df in chunks)
+        return convert(pd.read_sql_query(sql, self.connection, coerce_float=coerce_float, params=params))
+
+    def list_libraries(self):
+        return LIBRARIES
+
+    def list_tables(self, library):
+        return [row[0] for row in
+                self.connection.execute("select name from %s.sqlite_master where type='table'" % library)]
+
+    def close(self):
+        self.connection.close()
+
+
+def connect():
+    """
+
+    :return: offline connection if the environment variable WRDS_OFFLINE is set, otherwise WRDS connection
+    """
+    if os.environ.get('WRDS_OFFLINE'):
+        return Connection(os.environ['WRDS_OFFLINE'])
+    import wrds
+    return wrds.Connection()
+
+
+def _ticker(i, first='A'):
+    # 4 letters ticker from a number
+    letters = [chr(ord('A') + (i // 26 ** k) % 26) for k in range(3)]
+    return first + ''.join(letters[::-1])
+
+
+def _iso(dates):
+    # dates are saved as text YYYY-MM-DD, like PostgreSQL prints them
+    return np.datetime_as_string(np.asarray(dates, dtype='datetime64[D]'), unit='D')
+
+
+def _save(df, db, table):
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            text = _iso(df[col].to_numpy())
+            df[col] = np.where(df[col].isna(), None, text)
+    df.to_sql(table, db, if_exists='append', index=False, chunksize=100000)
+
+
+def _firms(rng, firms, days):
+    """
+    Firm level attributes: listing, delisting, factor loadings, size, names and identifiers.
+
+    :return: dataframe with one row per permno
+    """
+    n_days = len(days)
+    # 40% of the firms are listed at the start of the sample, the others list during the sample
+    first = np.where(rng.random(firms) < 0.4, 0, rng.integers(0, n_days - 252, firms))
+    # life is exponential with mean 12 years, the firms alive at the end of the sample are not delisted
+    life = (rng.exponential(12, firms) * 252).astype(int) + 63
+    last = np.minimum(first + life, n_days)
+    firm = pd.DataFrame({'permno': 10000 + np.arange(firms), 'first': first, 'last': last,
+                         'delisted': first + life < n_days})
+    firm['permco'] = firm['permno'] + 50000
+    firm['gvkey'] = ['%06d' % (1000 + i) for i in range(firms)]
+    firm['ncusip'] = ['%06d10' % (100000 + i) for i in range(firms)]
+    firm['ticker'] = [_ticker(i) for i in range(firms)]
+    firm['comnam'] = ['FIRM %s INC' % t for t in firm['ticker']]
+    firm['beta'] = rng.normal(1, 0.4, firms)
+    firm['smb'] = rng.normal(0.5, 0.5, firms)
+    firm['hml'] = rng.normal(0.2, 0.5, firms)
+    firm['sigma'] = np.exp(rng.normal(np.log(0.02), 0.4, firms))
+    firm['p0'] = np.exp(rng.normal(np.log(20), 0.8, firms))
+    firm['shrout'] = np.round(np.exp(rng.normal(np.log(20000), 1.2, firms)))
+    firm['turnover'] = np.exp(rng.normal(np.log(0.004), 0.7, firms))
+    firm['zero_vol'] = rng.uniform(0, 0.1, firms) * (rng.random(firms) < 0.3)
+    firm['spread'] = np.exp(rng.normal(np.log(0.01), 0.5, firms))
+    firm['at'] = np.exp(rng.normal(np.log(500), 1.5, firms))
+    firm['sic'] = rng.choice(['1311', '2834', '2911', '3571', '3674', '4911', '5411', '6021', '6798', '7372'],
+                             firms)
+    firm['fyr'] = rng.choice([12, 3, 6, 9], firms, p=[0.7, 0.1, 0.1, 0.1])
+    firm['exchcd'] = rng.choice([1, 2, 3, 4], firms, p=[0.3, 0.1, 0.55, 0.05])
+    firm['shrcd'] = rng.choice([10, 11, 12, 31], firms, p=[0.3, 0.65, 0.03, 0.02])
+    firm['ibes'] = rng.random(firms) < 0.8
+    # IBES has its own tickers
+    firm['ibes_ticker'] = 'I' + firm['ticker'].str[1:]
+    return firm
+
+
+def _names(rng, firm, days):
+    """
+    crsp.msenames, crsp.dsenames and crsp.stocknames, 20% of the firms move to another exchange once.
+
+    :return: dataframe with one row per name record
+    """
+    names = firm[['permno', 'ticker', 'ncusip', 'comnam', 'sic', 'exchcd', 'shrcd']].copy()
+    names['namedt'] = days[firm['first']]
+    names['nameendt'] = days[firm['last'] - 1]
+    move = (rng.random(len(firm)) < 0.2) & (firm['last'] - firm['first'] > 504)
+    moved = names[move].copy()
+    split = days[((firm['first'] + firm['last']) // 2)[move]]
+    names.loc[move, 'nameendt'] = split - pd.Timedelta(days=1)
+    moved['namedt'] = split
+    moved['exchcd'] = np.where(moved['exchcd'] == 3, 1, 3)
+    names = pd.concat([names, moved]).sort_values(['permno', 'namedt']).reset_index(drop=True)
+    names['siccd'] = names['sic'].astype(int)
+    return names.drop(columns='sic')
+
+
+def _daily(rng, firm, days, factors, missing):
+    """
+    crsp.dsf of a batch of firms, returns follow the Fama French 3 factors model.
+
+    :return: dataframe sorted by permno and date
+    """
+    length = (firm['last'] - firm['first']).to_numpy()
+    row_firm = np.repeat(np.arange(len(firm)), length)
+    starts = np.cumsum(length) - length
+    day = np.arange(length.sum()) - np.repeat(starts, length) + np.repeat(firm['first'].to_numpy(), length)
+    f = factors.iloc[day]
+    at = lambda col: firm[col].to_numpy()[row_firm]
+    n = len(day)
+    ret = (f['rf'].to_numpy() + at('beta') * f['mktrf'].to_numpy() + at('smb') * f['smb'].to_numpy()
+           + at('hml') * f['hml'].to_numpy() + at('sigma') * rng.standard_t(5, n) / np.sqrt(5 / 3))
+    ret = np.maximum(ret, -0.9)
+    # price path of every firm, the cumulative sum starts again at the first day of each firm
+    log_ret = np.cumsum(np.log1p(ret))
+    log_ret -= np.repeat(log_ret[starts] - np.log1p(ret[starts]), length)
+    prc = at('p0') * np.exp(log_ret)
+    shrout = at('shrout')
+    vol = np.round(shrout * 1000 * at('turnover') * np.exp(rng.normal(0, 0.6, n)))
+    vol[rng.random(n) < at('zero_vol')] = 0
+    half = prc * at('spread') * np.exp(rng.normal(0, 0.3, n)) / 2
+    askhi = prc + half + np.abs(rng.normal(0, 0.01, n)) * prc
+    bidlo = prc - half - np.abs(rng.normal(0, 0.01, n)) * prc
+    # no trade days have the negative bid/ask average as price in CRSP
+    prc = np.where(vol == 0, -prc, prc)
+    # the first return of every firm is missing, like in CRSP
+    ret[starts] = np.nan
+    ret[rng.random(n) < missing / 10] = np.nan
+    vol[rng.random(n) < missing / 10] = np.nan
+    quote_missing = rng.random(n) < missing
+    askhi[quote_missing] = np.nan
+    bidlo[quote_missing] = np.nan
+    return pd.DataFrame({'permno': at('permno'), 'permco': at('permco'), 'date': days[day], 'ret': ret,
+                         'prc': np.round(prc, 4), 'vol': vol, 'shrout': shrout, 'askhi': np.round(askhi, 4),
+                         'bidlo': np.round(bidlo, 4), 'cfacpr': 1.0, 'cfacshr': 1.0})
+
+
+def _monthly(dsf):
+    """
+    crsp.msf from crsp.dsf, the date is the last trading day of the month.
+
+    :return: dataframe sorted by permno and date
+    """
+    dsf = dsf.assign(month=dsf['date'] + MonthEnd(0), log_ret=np.log1p(dsf['ret']))
+    group = dsf.groupby(['permno', 'month'], sort=True)
+    msf = group.agg(permco=('permco', 'last'), date=('date', 'last'), prc=('prc', 'last'), vol=('vol', 'sum'),
+                    shrout=('shrout', 'last'), log_ret=('log_ret', 'sum'), n=('ret', 'count')).reset_index()
+    msf['ret'] = np.where(msf['n'] > 0, np.expm1(msf['log_ret']), np.nan)
+    # quarterly dividend of 0.5% in the last month of each quarter
+    div = np.where(msf['month'].dt.month % 3 == 0, 0.005, 0)
+    msf['retx'] = (1 + msf['ret']) / (1 + div) - 1
+    # CRSP monthly volume is in hundreds of shares
+    msf['vol'] = np.round(msf['vol'] / 100)
+    msf['cfacpr'] = 1.0
+    msf['cfacshr'] = 1.0
+    return msf[['permno', 'permco', 'date', 'prc', 'ret', 'retx', 'vol', 'shrout', 'cfacpr', 'cfacshr']]
+
+
+def _items(rng, at, positive, signed, missing):
+    # accounting items as ratio to total assets, each firm keeps its own ratio with some noise every period
+    items = {}
+    for col, ratio in positive.items():
+        items[col] = at * ratio * np.exp(rng.normal(0, 0.3, len(at)))
+    for col, (mean, std) in signed.items():
+        items[col] = at * (mean + std * rng.normal(0, 1, len(at)))
+    items = pd.DataFrame(items)
+    for col in items.columns:
+        rate = min(missing * 5, 0.6) if col in SPARSE else missing
+        items.loc[rng.random(len(items)) < rate, col] = np.nan
+    return items
+
+
+def _compustat(rng, firm, days, msf, missing):
+    """
+    comp.funda and comp.fundq of a batch of firms, from the fiscal year of listing to the fiscal year of delisting.
+
+    :return: funda, fundq
+    """
+    annual = []
+    for row in firm.itertuples():
+        first, last = days[row.first], days[row.last - 1]
+        ends = pd.date_range(first - pd.DateOffset(months=12), last + pd.DateOffset(months=12), freq='ME')
+        ends = ends[ends.month == row.fyr]
+        annual.append(pd.DataFrame({'gvkey': row.gvkey, 'permno': row.permno, 'datadate': ends,
+                                    'cusip': row.ncusip + '0', 'conm': row.comnam, 'at0': row.at}))
+    funda = pd.concat(annual, ignore_index=True)
+    # total assets grow 6% a year with noise
+    growth = rng.normal(0.06, 0.15, len(funda))
+    funda['at'] = funda['at0'] * np.exp(funda.assign(g=growth).groupby('gvkey')['g'].cumsum())
+    funda['fyear'] = np.where(funda['datadate'].dt.month <= 5, funda['datadate'].dt.year - 1,
+                              funda['datadate'].dt.year)
+    funda = pd.concat([funda, _items(rng, funda['at'].to_numpy(), FUNDA_POSITIVE, FUNDA_SIGNED, missing)], axis=1)
+    # price and shares at the fiscal year end from crsp.msf
+    month_end = msf.assign(datadate=msf['date'] + MonthEnd(0))[['permno', 'datadate', 'prc', 'shrout']]
+    funda = pd.merge(funda, month_end, how='left', on=['permno', 'datadate'])
+    funda['prcc_f'] = funda['prc']
+    funda['csho'] = funda['shrout'] / 1000
+    funda['seq'] = funda['at'] * rng.uniform(0.2, 0.7, len(funda))
+    funda['ceq'] = funda['seq'] - funda['pstk'].fillna(0)
+    funda['lt'] = funda['at'] - funda['seq'] - funda['mib'].fillna(0)
+    funda['emp'] = funda['at'] / 200
+    funda['ajex'] = 1.0
+    funda['indfmt'], funda['datafmt'], funda['popsrc'], funda['consol'] = 'INDL', 'STD', 'D', 'C'
+
+    # 4 fiscal quarters in every fiscal year
+    fundq = funda[['gvkey', 'permno', 'datadate', 'fyear', 'cusip', 'conm', 'at']].loc[
+        np.repeat(funda.index, 4)].reset_index(drop=True)
+    fundq['fqtr'] = np.tile([1, 2, 3, 4], len(funda))
+    for q in [1, 2, 3]:
+        fundq.loc[fundq['fqtr'] == q, 'datadate'] = fundq.loc[fundq['fqtr'] == q, 'datadate'] - MonthEnd(3 * (4 - q))
+    fundq['fyearq'] = fundq['fyear']
+    at = (fundq['at'] * np.exp(rng.normal(0, 0.03, len(fundq)))).to_numpy()
+    fundq = pd.concat([fundq.drop(columns=['at', 'fyear']),
+                       _items(rng, at, FUNDQ_POSITIVE, FUNDQ_SIGNED, missing)], axis=1)
+    fundq['atq'] = at
+    for ytd, quarterly in FUNDQ_YTD.items():
+        flow = fundq[quarterly] if quarterly else fundq['atq'] * rng.normal(0.02, 0.02, len(fundq))
+        fundq[ytd] = flow.groupby([fundq['gvkey'], fundq['fyearq']]).cumsum()
+    fundq['rdq'] = fundq['datadate'] + pd.to_timedelta(rng.integers(20, 50, len(fundq)), unit='D')
+    fundq.loc[rng.random(len(fundq)) < missing, 'rdq'] = pd.NaT
+    fundq = pd.merge(fundq, month_end, how='left', on=['permno', 'datadate'])
+    fundq['prccq'] = fundq['prc']
+    fundq['cshoq'] = fundq['shrout'] / 1000
+    fundq['seqq'] = fundq['atq'] * rng.uniform(0.2, 0.7, len(fundq))
+    fundq['ceqq'] = fundq['seqq'] - fundq['pstkq'].fillna(0)
+    fundq['ltq'] = fundq['atq'] - fundq['seqq'] - fundq['mibq'].fillna(0)
+    fundq['epspxq'] = fundq['ibq'] / fundq['cshoq']
+    fundq['ajexq'] = 1.0
+    fundq['indfmt'], fundq['datafmt'], fundq['popsrc'], fundq['consol'] = 'INDL', 'STD', 'D', 'C'
+    return (funda.drop(columns=['permno', 'at0', 'prc', 'shrout']),
+            fundq.drop(columns=['permno', 'prc', 'shrout']))
+
+
+def _statsum(rng, firm, funda, missing):
+    """
+    ibes.statsum_epsus, monthly consensus of the annual EPS for the current (fpi 1) and the next (fpi 2) fiscal year.
+
+    :return: dataframe
+    """
+    eps = funda[['gvkey', 'datadate', 'ib', 'csho']].copy()
+    eps['actual'] = eps['ib'] / eps['csho']
+    eps = pd.merge(eps, firm.loc[firm['ibes'], ['gvkey', 'ibes_ticker']], how='inner', on='gvkey')
+    eps = eps[eps['actual'].notna()].rename(columns={'ibes_ticker': 'ticker'})
+    stat = []
+    for fpi, months in [('1', range(1, 12)), ('2', range(12, 24))]:
+        for m in months:
+            s = eps[['ticker', 'datadate', 'actual']].copy()
+            s['fpi'] = fpi
+            s['statpers'] = s['datadate'] - pd.DateOffset(months=m) - MonthEnd(1) + pd.Timedelta(days=15)
+            # forecast error shrinks as the fiscal year end gets closer
+            error = rng.normal(0, 0.02 * np.sqrt(m), len(s)) * np.abs(s['actual']).clip(lower=0.1)
+            s['meanest'] = s['actual'] + error
+            s['medest'] = s['meanest'] + rng.normal(0, 0.005, len(s))
+            stat.append(s)
+    stat = pd.concat(stat, ignore_index=True).rename(columns={'datadate': 'fpedats'})
+    stat['anndats_act'] = stat['fpedats'] + pd.to_timedelta(rng.integers(30, 90, len(stat)), unit='D')
+    stat['measure'], stat['curcode'], stat['curr_act'] = 'EPS', 'USD', 'USD'
+    stat.loc[rng.random(len(stat)) < missing, 'medest'] = np.nan
+    return stat[['ticker', 'statpers', 'measure', 'fpi', 'curcode', 'fpedats', 'meanest', 'medest',
+                 'anndats_act', 'curr_act']]
+
+
+def generate(path='offline_wrds', scale=1, firms=400, start='1995-01-01', end='2019-12-31', missing=0.05, seed=0,
+             batch=200):
+    """
+    Write synthetic CRSP, Compustat, IBES and Fama French tables to SQLite files, one file per library.
+
+    :param path: directory of the SQLite files
+    :param scale: multiply the number of firms
+    :param firms: number of permnos at scale 1
+    :param start: first trading day
+    :param end: last trading day
+    :param missing: share of missing values
+    :param seed: random seed, the same seed and parameters give the same data
+    :param batch: number of firms generated at the same time
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    for library in LIBRARIES:
+        if os.path.exists(os.path.join(path, library + '.sqlite')):
+            os.remove(os.path.join(path, library + '.sqlite'))
+    db = {library: sqlite3.connect(os.path.join(path, library + '.sqlite')) for library in LIBRARIES}
+
+    days = pd.bdate_range(start, end)
+    factors = pd.DataFrame({'date': days, 'rf': 0.0001, 'mktrf': rng.normal(0.0003, 0.01, len(days)),
+                            'smb': rng.normal(0, 0.005, len(days)), 'hml': rng.normal(0.0001, 0.005, len(days))})
+    _save(factors, db['ff'], 'factors_daily')
+    _save(pd.DataFrame({'date': days, 'sprtrn': factors['mktrf'] + factors['rf'] + rng.normal(0, 0.001, len(days))}),
+          db['crsp'], 'dsi')
+
+    firm = _firms(rng, firms * scale, days)
+    names = _names(rng, firm, days)
+    for table in ['msenames', 'dsenames']:
+        _save(names, db['crsp'], table)
+    _save(names.rename(columns={'nameendt': 'nameenddt'})[['permno', 'ticker', 'ncusip', 'comnam', 'namedt',
+                                                          'nameenddt']], db['crsp'], 'stocknames')
+
+    delisted = firm[firm['delisted']]
+    delist = pd.DataFrame({'permno': delisted['permno'], 'dlstdt': days[delisted['last'] - 1],
+                           'dlret': rng.normal(-0.05, 0.2, len(delisted))})
+    delist.loc[rng.random(len(delist)) < 0.3, 'dlret'] = np.nan
+    for table in ['msedelist', 'dsedelist']:
+        _save(delist, db['crsp'], table)
+
+    link = pd.DataFrame({'gvkey': firm['gvkey'], 'lpermno': firm['permno'],
+                         'linktype': rng.choice(['LU', 'LC'], len(firm)), 'linkprim': rng.choice(['P', 'C'], len(firm)),
+                         'linkdt': days[firm['first']],
+                         'linkenddt': np.where(firm['delisted'], days[firm['last'] - 1], pd.NaT)})
+    link['linkenddt'] = pd.to_datetime(link['linkenddt'])
+    _save(link, db['crsp'], 'ccmxpf_linktable')
+    company = firm[['gvkey', 'sic']].assign(naics='', cik=['%010d' % i for i in range(len(firm))])
+    _save(company, db['comp'], 'company')
+    ibes_id = firm.loc[firm['ibes'], ['ibes_ticker', 'ticker', 'ncusip', 'comnam']].rename(
+        columns={'ibes_ticker': 'ticker', 'ticker': 'oftic', 'ncusip': 'cusip', 'comnam': 'cname'})
+    ibes_id = ibes_id.assign(usfirm=1, sdates=days[firm.loc[firm['ibes'], 'first']])
+    _save(ibes_id, db['ibes'], 'id')
+
+    for i in range(0, len(firm), batch):
+        print('offline WRDS, firms %s to %s of %s' % (i, min(i + batch, len(firm)), len(firm)))
+        sub = firm.iloc[i:i + batch].reset_index(drop=True)
+        dsf = _daily(rng, sub, days, factors, missing)
+        msf = _monthly(dsf)
+        funda, fundq = _compustat(rng, sub, days, msf, missing)
+        _save(dsf, db['crsp'], 'dsf')
+        _save(msf, db['crsp'], 'msf')
+        _save(funda, db['comp'], 'funda')
+        _save(fundq, db['comp'], 'fundq')
+        _save(_statsum(rng, sub, funda, missing), db['ibes'], 'statsum_epsus')
+
+    for library, table, columns in [('crsp', 'dsf', 'permno, date'), ('crsp', 'msf', 'permno, date'),
+                                     ('crsp', 'dsenames', 'permno'), ('crsp', 'msenames', 'permno'),
+                                     ('comp', 'funda', 'gvkey'), ('comp', 'fundq', 'gvkey'),
+                                     ('comp', 'company', 'gvkey')]:
+        db[library].execute('create index %s_idx on %s (%s)' % (table, table, columns))
+    for library in LIBRARIES:
+        db[library].commit()
+        db[library].close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate synthetic WRDS data for offline runs')
+    parser.add_argument('--path', default='offline_wrds', help='directory of the SQLite files')
+    parser.add_argument('--scale', type=int, default=1, help='multiply the number of firms, 1, 10 or 100')
+    parser.add_argument('--firms', type=int, default=400, help='number of permnos at scale 1')
+    parser.add_argument('--start', default='1995-01-01', help='first trading day')
+    parser.add_argument('--end', default='2019-12-31', help='last trading day')
+    parser.add_argument('--missing', type=float, default=0.05, help='share of missing values')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    generate(args.path, args.scale, args.firms, args.start, args.end, args.missing, args.seed)
@@ -0,0 +1,249 @@
+# Group kernels for the firm panels of accounting_100_hxz.py
+# The annual, quarterly and monthly panels are sorted by permno and date, so every firm is a contiguous block of rows.
+# A groupby('permno') for every lagged or trailing column hashes the permno groups again and builds temporary columns
+# as tall as the panel. Here we find the first row of every firm once and work on numpy arrays of many columns at once,
+# a row only uses the rows of its own firm.
+# Panel keeps the firm boundaries of a panel for all its lags, leads and differences, e.g.
+# panel_q = Panel(data_rawq['permno'])
+# data_rawq[['atq_l4', 'ltq_l4']] = panel_q.lag(data_rawq, ['atq', 'ltq'], 4)
+# it has to be built again once the rows of the panel change (sort, filter, merge adding rows).
+# momentum compounds the monthly returns of many windows (mom12m, mom60m...) from one sum of the log returns.
+# group_stats computes the industry means and medians of many columns (bm_ind, md_roa...) without merging them back.
+
+import numpy as np
+import pandas as pd
+
+
+def firm_start(permno):
+    """
+
+    :param permno: permno of every row, sorted by permno
+    :return: position of the first row of the firm of every row
+    """
+    permno = np.asarray(permno)
+    n = len(permno)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    if (permno[1:] < permno[:-1]).any():
+        raise ValueError('the panel must be sorted by permno')
+    new_firm = np.concatenate(([True], permno[1:] != permno[:-1]))
+    return np.maximum.accumulate(np.where(new_firm, np.arange(n), 0))
+
+
+def trailing_sum(permno, x, k):
+    """
+    Sum of the last k rows of every row within its firm, x + x.shift(1) + ... + x.shift(k - 1) by permno: missing when
+    the firm has less than k rows so far or one of the k values is missing.
+    We add the k shifted slices of the whole block instead of differencing a cumulative sum, the sums of a few
+    quarters nearly cancel out often and the difference of two large cumulative sums would lose their precision.
+
+    :param permno: permno of every row, sorted by permno
+    :param x: float array, one column per series
+    :param k: number of rows in the window
+    :return: trailing sums, same shape as x
+    """
+    x = np.asarray(x, dtype=float)
+    res = x.copy()
+    for i in range(1, min(k, len(x))):
+        res[i:] += x[:-i]
+    res[np.arange(len(x)) - firm_start(permno) < k - 1] = np.nan
+    return res
+
+
+def trailing_std(permno, x, k, min_obs=2, skip=0):
+    """
+    Standard deviation (ddof 1) of the rows skip to skip + k - 1 before every row within its firm, skipping the missing
+    values, as the row-wise std of the lags skip to skip + k - 1 by permno: missing with less than min_obs values.
+    Two passes over the k shifted slices, the count and sum then the squared deviations from the mean, so that the
+    variance keeps its precision (the variance from running sums of x and x ** 2 does not for large values with small
+    changes). The slices are views and their masks are built in turn, so the memory is the count, sum, mean and
+    squares arrays as tall as x whatever k, instead of k lagged columns.
+
+    :param permno: permno of every row, sorted by permno
+    :param x: float array, one column per series
+    :param k: number of rows in the window
+    :param min_obs: minimum number of values in the window, 2 at least
+    :param skip: number of rows between every row and its window, 0 to include the row itself
+    :return: trailing standard deviations, same shape as x
+    """
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    before = np.arange(n) - firm_start(permno)
+    lags = range(skip, min(skip + k, n))
+
+    def valid(i):
+        # the rows i to n - 1 see the values i rows before, if they are in the same firm and not missing
+        return (before[i:] >= i).reshape((-1,) + (1,) * (x.ndim - 1)) & ~np.isnan(x[:n - i])
+
+    count = np.zeros(x.shape)
+    total = np.zeros(x.shape)
+    for i in lags:
+        keep = valid(i)
+        count[i:] += keep
+        total[i:] += np.where(keep, x[:n - i], 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        squares = np.zeros(x.shape)
+        for i in lags:
+            squares[i:] += np.where(valid(i), (x[:n - i] - mean[i:]) ** 2, 0)
+        res = np.sqrt(squares / (count - 1))
+    res[count < max(min_obs, 2)] = np.nan
+    return res
+
+
+def ttm(df, columns, k=4):
+    """
+    Trailing k rows sums of many columns in one pass, e.g. the trailing 4 quarters (ttm4) or 12 months (ttm12).
+
+    :param df: panel sorted by permno and date
+    :param columns: columns to sum
+    :param k: number of rows in the window
+    :return: dataframe with the trailing sums of the columns, same index as df
+    """
+    res = trailing_sum(df['permno'].to_numpy(), df[columns].to_numpy(dtype=float), k)
+    return pd.DataFrame(res, index=df.index, columns=columns)
+
+
+def compound(permno, ret, windows):
+    """
+    Compounded returns over windows of rows before every row within its firm, the product of (1 + ret.shift(i)) by
+    permno for i in range(start, end), minus 1, for many windows in one pass. log|1 + ret| is summed once within every
+    firm, the return of a window is the exp of the difference of two of these sums. The months with 1 + ret = 0 (or
+    below) are counted apart, so that a window with a -100% month is -1 and the sign is kept.
+    The rules for the missing months are those of the product:
+    - a window starting before the first row of the firm is missing
+    - a window with a missing return is missing (accounting_100_hxz.py sets the missing returns to 0 first)
+    - the windows are rows, a month without a row in the panel is not in any window
+
+    :param permno: permno of every row, sorted by permno
+    :param ret: return of every row
+    :param windows: list of (start, end), the window of the rows start to end - 1 before every row
+    :return: array with one column per window
+    """
+    ret = np.asarray(ret, dtype=float)
+    n = len(ret)
+    before = np.arange(n) - firm_start(permno)
+    growth = 1 + ret
+    # sums of every firm up to every row: log|1 + ret|, and the counts of the zero, negative and missing 1 + ret
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_growth = np.where(growth != 0, np.log(np.abs(growth)), 0)
+    log_growth[np.isnan(growth)] = 0
+    log_sum = pd.Series(log_growth).groupby(np.asarray(permno), sort=False).cumsum().to_numpy()
+    # (counts of all the rows before every row, the counts of a window are exact differences of them)
+    counts = np.concatenate((np.zeros((1, 3), dtype=np.int64),
+                             np.cumsum(np.column_stack((growth == 0, growth < 0, np.isnan(growth))), axis=0)))
+    res = np.full((n, len(windows)), np.nan)
+    for j, (start, end) in enumerate(windows):
+        # the window of row t is the rows t - end + 1 to t - start, its sums are the sums up to t - start minus the
+        # sums up to t - end (nothing if t - end is before the firm)
+        rows = np.flatnonzero(before >= end - 1)
+        last = rows - start
+        first = rows - end
+        inside = before[rows] >= end
+        window_log = log_sum[last] - np.where(inside, log_sum[np.maximum(first, 0)], 0)
+        window_counts = counts[last + 1] - counts[first + 1]
+        value = np.exp(window_log) * np.where(window_counts[:, 1] % 2 == 1, -1, 1)
+        value[window_counts[:, 0] > 0] = 0
+        value[window_counts[:, 2] > 0] = np.nan
+        res[rows, j] = value - 1
+    return res
+
+
+def momentum(df, windows):
+    """
+    Compounded returns of the column ret over windows of months, e.g. {'mom12m': (1, 12)} for the months 1 to 11 before.
+
+    :param df: monthly panel sorted by permno and date
+    :param windows: dict of name: (start, end), see compound
+    :return: dataframe with the compounded returns of the windows, same index as df
+    """
+    res = compound(df['permno'].to_numpy(), df['ret'].to_numpy(dtype=float), list(windows.values()))
+    return pd.DataFrame(res, index=df.index, columns=list(windows))
+
+
+def group_stats(df, specs):
+    """
+    Statistics of columns over groups of rows for every row, e.g. the mean of bm over the firms of the same industry at
+    every datadate, as groupby(keys)[column].stat() merged back on the keys but without the merges (every merge copies
+    the whole panel). The specs with the same keys share one grouping, and the ones with the same statistic too are
+    one transform.
+
+    :param df: panel
+    :param specs: dict of name: (column, keys, stat), stat is a groupby statistic ('mean', 'median', 'sum'...)
+    :return: dataframe with the statistics of the specs, same index as df, rows with a missing key get NaN as the merges
+    """
+    batches = {}
+    for name, (column, keys, stat) in specs.items():
+        batches.setdefault((tuple(keys), stat), []).append((name, column))
+    groups = {}
+    res = {}
+    for (keys, stat), items in batches.items():
+        if keys not in groups:
+            groups[keys] = df.groupby(list(keys), sort=False)
+        values = groups[keys][list(dict.fromkeys(column for name, column in items))].transform(stat)
+        for name, column in items:
+            res[name] = values[column]
+    return pd.DataFrame(res, index=df.index)[list(specs)]
+
+
+class Panel:
+    """
+    Firm boundaries of a panel sorted by permno, found once and used by all the lags, leads and differences of its
+    columns, as groupby('permno')[columns].shift(k) and .diff(k) do.
+    """
+
+    def __init__(self, permno):
+        """
+
+        :param permno: permno of every row, sorted by permno
+        """
+        start = firm_start(permno)
+        n = len(start)
+        row = np.arange(n)
+        # number of rows of the firm before and after every row
+        self.before = row - start
+        first = np.flatnonzero(self.before == 0)
+        self.after = np.repeat(np.append(first[1:], n)[:len(first)] - 1, np.diff(np.append(first, n))) - row
+
+    def shift(self, df, columns, k):
+        """
+
+        :param df: panel with the rows the boundaries were found for
+        :param columns: float column or list of float columns
+        :param k: number of rows, positive for lags and negative for leads
+        :return: the columns shifted by k rows within every firm, a series for one column and a dataframe (with the same
+                 column names) for a list
+        """
+        if len(df) != len(self.before):
+            raise ValueError('the panel has %d rows and its firm boundaries %d' % (len(df), len(self.before)))
+        x = df[[columns] if isinstance(columns, str) else columns].to_numpy(dtype=float)
+        res = np.full(x.shape, np.nan)
+        if k > 0:
+            res[k:] = x[:-k]
+            res[self.before < k] = np.nan
+        elif k < 0:
+            res[:k] = x[-k:]
+            res[self.after < -k] = np.nan
+        else:
+            res[:] = x
+        if isinstance(columns, str):
+            return pd.Series(res[:, 0], index=df.index, name=columns)
+        return pd.DataFrame(res, index=df.index, columns=columns)
+
+    def lag(self, df, columns, k=1):
+        """
+        Values k rows before within the firm, groupby('permno')[columns].shift(k).
+        """
+        return self.shift(df, columns, k)
+
+    def lead(self, df, columns, k=1):
+        """
+        Values k rows after within the firm, groupby('permno')[columns].shift(-k).
+        """
+        return self.shift(df, columns, -k)
+
+    def diff(self, df, columns, k=1):
+        """
+        Change from k rows before within the firm, groupby('permno')[columns].diff(k).
+        """
+        return self.shift(df, columns, 0) - self.shift(df, columns, k)
@@ -0,0 +1,798 @@
+# Rolling window engine for the daily characteristics
+# The daily scripts compute their characteristics over the last 3 months of daily data for every firm-month.
+# Filtering the whole dataframe for every firm and every month is quadratic in the number of rows, so here we sort
+# the data once by permno and date, find the first and last row of every window with offsets, and evaluate the
+# statistics over contiguous slices of numpy arrays (mostly through cumulative sums).
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+
+def month_index(permno, date):
+    """
+    Label the months of every firm directly from the sorted arrays: a new month starts when permno or the calendar
+    month changes, and the last trading day of a month for the firm is its month end row.
+
+    :param permno: permno of every row, sorted by permno and date
+    :param date: date of every row, sorted by permno and date
+    :return: month number of every row within its permno (0, 1, 2, ...), positions of the month end rows, and the
+             firm list with the number of months (month_num is the last month number) of every permno
+    """
+    permno = np.asarray(permno)
+    month = np.asarray(date).astype('datetime64[M]')
+    n = len(permno)
+    new_firm = np.concatenate(([True], permno[1:] != permno[:-1])) if n > 0 else np.array([], dtype=bool)
+    new_month = new_firm.copy()
+    new_month[1:] |= month[1:] != month[:-1]
+    month_total = np.cumsum(new_month) - 1
+    firm_start = np.flatnonzero(new_firm)
+    # month number within the firm = month number in the whole array - month number of the first row of the firm
+    # (a firm has at most a few hundred months, int32 keeps the column small)
+    month_count = (month_total - np.repeat(month_total[firm_start], np.diff(np.append(firm_start, n)))).astype(np.int32)
+    month_end = np.append(np.flatnonzero(new_month[1:]), n - 1) if n > 0 else np.array([], dtype=np.int64)
+    df_firm = pd.DataFrame({'count': np.arange(len(firm_start)), 'permno': permno[firm_start].astype(int),
+                            'month_num': month_count[np.append(firm_start[1:], n) - 1]})
+    return month_count, month_end, df_firm
+
+
+def month_windows(permno, month_count, window=3):
+    """
+
+    :param permno: permno of every row, sorted by permno and date
+    :param month_count: month number of every row within its permno (0, 1, 2, ...), sorted by permno and date
+    :param window: number of months in a window, 3 means month i - 2 to month i
+    :return: start and end (exclusive) row positions of the window ending at every month end row
+    """
+    permno = np.asarray(permno)
+    month_count = np.asarray(month_count).astype(np.int64)
+    n = len(permno)
+    if n == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty
+    # the last row of a month is the month end row
+    new_month = (permno[1:] != permno[:-1]) | (month_count[1:] != month_count[:-1])
+    end = np.append(np.flatnonzero(new_month), n - 1) + 1
+    # combine firm and month into one increasing key, months before the first month of a firm fall in the gap
+    # between two firms, so searchsorted stops at the first row of the firm
+    firm = np.concatenate(([0], np.cumsum(permno[1:] != permno[:-1])))
+    step = month_count.max() + window + 1
+    key = firm * step + month_count
+    start = np.searchsorted(key, key[end - 1] - (window - 1), side='left')
+    return start, end
+
+
+def day_windows(permno, days=63):
+    """
+
+    :param permno: permno of every row, sorted by permno and date
+    :param days: number of trading days in a window
+    :return: start and end (exclusive) row positions of the window of the last days trading days of the firm ending
+             at every row
+    """
+    permno = np.asarray(permno)
+    n = len(permno)
+    new_firm = np.concatenate(([True], permno[1:] != permno[:-1])) if n > 0 else np.array([], dtype=bool)
+    first = np.flatnonzero(new_firm)
+    firm_start = np.repeat(first, np.diff(np.append(first, n)))
+    end = np.arange(1, n + 1)
+    return np.maximum(end - days, firm_start), end
+
+
+def _prefix(x):
+    return np.concatenate(([0], np.cumsum(x)))
+
+
+def window_count(start, end, mask):
+    """
+
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param mask: boolean array, True for the rows to count
+    :return: number of True rows in every window
+    """
+    cum = _prefix(np.asarray(mask, dtype=np.int64))
+    return cum[end] - cum[start]
+
+
+def window_sum(start, end, x):
+    """
+    Sum over every window, NaN is skipped and inf is kept as pandas does.
+
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param x: float array
+    :return: sum of every window
+    """
+    x = np.asarray(x, dtype=float)
+    cum = _prefix(np.where(np.isfinite(x), x, 0))
+    res = cum[end] - cum[start]
+    pos_inf = window_count(start, end, x == np.inf) > 0
+    neg_inf = window_count(start, end, x == -np.inf) > 0
+    res = np.where(pos_inf, np.inf, res)
+    res = np.where(neg_inf, -np.inf, res)
+    res = np.where(pos_inf & neg_inf, np.nan, res)
+    return res
+
+
+def window_mean(start, end, x):
+    """
+    Mean over every window, NaN is skipped and inf is kept as pandas does.
+
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param x: float array
+    :return: mean of every window
+    """
+    x = np.asarray(x, dtype=float)
+    count = window_count(start, end, ~np.isnan(x))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, window_sum(start, end, x) / count, np.nan)
+
+
+def window_var(start, end, x, ddof=1):
+    """
+    Variance over every window, NaN is skipped and windows with inf get NaN as pandas does.
+    We shift x by its mean before the cumulative sums to keep the precision of sum(x^2) - sum(x)^2/n.
+
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param x: float array
+    :param ddof: delta degrees of freedom
+    :return: variance of every window
+    """
+    x = np.asarray(x, dtype=float)
+    finite = np.isfinite(x)
+    shift = x[finite].mean() if finite.any() else 0
+    y = np.where(finite, x - shift, 0)
+    count = window_count(start, end, finite)
+    s1 = _prefix(y)
+    s2 = _prefix(y * y)
+    s1 = s1[end] - s1[start]
+    s2 = s2[end] - s2[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        res = (s2 - s1 * s1 / count) / (count - ddof)
+    res = np.where(count > ddof, np.maximum(res, 0), np.nan)
+    res = np.where(window_count(start, end, np.isinf(x)) > 0, np.nan, res)
+    return res
+
+
+def window_max(start, end, x):
+    """
+    Maximum over every window, NaN is skipped as pandas does.
+    We build a sparse table level by level (level j holds the max of x[i:i + 2^j]), and every window is the max of
+    two overlapping power of two blocks, so the whole panel takes O(n log(window length)) without a python loop.
+
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param x: float array
+    :return: max of every window
+    """
+    x = np.asarray(x, dtype=float)
+    length = end - start
+    res = np.full(len(end), np.nan)
+    if len(end) == 0 or length.max() <= 0:
+        return res
+    # floor(log2(length)) without rounding problems
+    level = np.frexp(np.maximum(length, 1))[1] - 1
+    table = x
+    j = 0
+    while True:
+        sel = (level == j) & (length > 0)
+        res[sel] = np.fmax(table[start[sel]], table[end[sel] - (1 << j)])
+        if (1 << (j + 1)) > length.max():
+            break
+        table = np.fmax(table[:-(1 << j)], table[(1 << j):])
+        j += 1
+    return res
+
+
+def window_top(start, end, x, k, batch=100000):
+    """
+    The k largest values of every window in descending order, NaN is skipped and fills the missing places.
+
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param x: float array
+    :param k: number of largest values
+    :param batch: number of windows gathered at once, to bound the memory
+    :return: array with k columns of every window
+    """
+    x = np.asarray(x, dtype=float)
+    res = np.full((len(end), k), np.nan)
+    if len(end) == 0:
+        return res
+    width = (end - start).max()
+    for b in range(0, len(end), batch):
+        s = start[b:b + batch]
+        e = end[b:b + batch]
+        idx = s[:, None] + np.arange(width)
+        values = np.where(idx < e[:, None], x[np.minimum(idx, len(x) - 1)], np.nan)
+        # sort in descending order, NaN goes to the end
+        values = -np.sort(-values, axis=1)
+        res[b:b + batch, :min(k, width)] = values[:, :k]
+    return res
+
+
+def _window_moments(start, end, x, y):
+    # window means of x and y and demeaned sums of x^2, xy and y^2 from running sums, windows with NaN get NaN
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    missing = window_count(start, end, np.isnan(x) | np.isnan(y)) > 0
+    # shift by the overall means to keep the precision of the running sums
+    x_shift = np.nanmean(x) if (~np.isnan(x)).any() else 0
+    y_shift = np.nanmean(y) if (~np.isnan(y)).any() else 0
+    x = np.where(np.isnan(x), 0, x - x_shift)
+    y = np.where(np.isnan(y), 0, y - y_shift)
+    sums = []
+    for v in (x, y, x * x, x * y, y * y):
+        cum = _prefix(v)
+        sums.append(np.where(missing, np.nan, cum[end] - cum[start]))
+    sx, sy, sxx, sxy, syy = sums
+    n = end - start
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx = sx / n
+        my = sy / n
+        sxx = sxx - sx * mx
+        sxy = sxy - sx * my
+        syy = syy - sy * my
+    return n, mx + x_shift, my + y_shift, sxx, sxy, syy
+
+
+def window_beta(start, end, x, y):
+    """
+    Slope of regressing y on an intercept and x in every window, from the running sums of x, y, xy and x^2,
+    so every window costs the same whatever its length.
+
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param x: independent variable
+    :param y: dependent variable
+    :return: beta of every window
+    """
+    n, mx, my, sxx, sxy, syy = _window_moments(start, end, x, y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sxy / sxx
+
+
+def window_apply(func, start, end, *arrays):
+    """
+    Apply a function to the slices of every window, for the statistics that cannot be done with cumulative sums.
+
+    :param func: function taking the slices of arrays and returning a number
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param arrays: arrays to slice
+    :return: result of every window
+    """
+    res = np.full(len(end), np.nan)
+    for k, (s, e) in enumerate(zip(start, end)):
+        res[k] = func(*[a[s:e] for a in arrays])
+    return res
+
+
+def _solve(A, b):
+    # solve a stack of normal equations, fall back to the pseudo inverse if some X'X is singular
+    try:
+        return np.linalg.solve(A, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        return np.einsum('wij,wj->wi', np.linalg.pinv(A), b)
+
+
+def window_ols(start, end, y, *x):
+    """
+    Regress y on an intercept and x in every window at once.
+    We accumulate the running cross products X'X and X'y, take their differences at the window offsets, and solve
+    all the (k+1) x (k+1) normal equations with one stacked np.linalg.solve. The residual variance comes from the
+    sums of squares, residuals are never built, so every window costs O(k^2) whatever its length.
+
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param y: dependent variable
+    :param x: independent variables
+    :return: coefficients (intercept first), variance of residual and R^2 of every window
+    """
+    y = np.asarray(y, dtype=float)
+    x = [np.asarray(v, dtype=float) for v in x]
+    k = len(x) + 1
+    missing = np.isnan(y)
+    for v in x:
+        missing = missing | np.isnan(v)
+    missing = window_count(start, end, missing) > 0
+    # shift every variable by its overall mean to keep the precision of the running sums, the slopes do not change
+    shift = [np.nanmean(v) if (~np.isnan(v)).any() else 0 for v in x + [y]]
+    cols = [np.ones(len(y))] + [np.where(np.isnan(v), 0, v - c) for v, c in zip(x + [y], shift)]
+    ZZ = np.empty((len(end), k + 1, k + 1))
+    for a in range(k + 1):
+        for b in range(a, k + 1):
+            cum = _prefix(cols[a] * cols[b])
+            ZZ[:, a, b] = ZZ[:, b, a] = cum[end] - cum[start]
+    XX = ZZ[:, :k, :k]
+    Xy = ZZ[:, :k, k]
+    yy = ZZ[:, k, k]
+    n = end - start
+    ok = ~missing & (n > k)
+    coef = np.full((len(end), k), np.nan)
+    coef[ok] = _solve(XX[ok], Xy[ok])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ssr = np.maximum(yy - np.einsum('wi,wi->w', coef, Xy), 0)
+        sst = yy - Xy[:, 0] ** 2 / n
+        rvar = ssr / (n - 1)
+        r2 = 1 - ssr / sst
+    # shift the intercept back
+    coef[:, 0] = coef[:, 0] + shift[-1] - coef[:, 1:].dot(np.array(shift[:-1]))
+    return coef, rvar, r2
+
+
+def window_res_var(start, end, y, *x):
+    """
+    Variance of the residuals of regressing y on an intercept and x in every window.
+
+    :param start: start row positions of the windows
+    :param end: end row positions (exclusive) of the windows
+    :param y: dependent variable
+    :param x: independent variables
+    :return: variance of residual of every window
+    """
+    return window_ols(start, end, y, *x)[1]
+
+
+def rolling_chars(df, name, stat, columns, window=3, min_obs=21, min_vol=21, horizons=None):
+    """
+    Evaluate a characteristic over the window ending at every month end row.
+    The results are numpy arrays filled in bulk, we do not write them back to df, the caller builds its dataframe once.
+
+    :param df: stock dataframe with permno, date, vol and month_count
+    :param name: name of the characteristic, or a list of names if stat returns several characteristics
+    :param stat: function stat(start, end, *arrays) returning the characteristic of every window
+    :param columns: columns passed to stat as float arrays
+    :param window: number of months in a window
+    :param min_obs: we drop the window if observations in it are less than min_obs
+    :param min_vol: we drop the window if non-missing vol in it are less than min_vol
+    :param horizons: list of window specs (suffix, window, min_obs, min_vol) computed together, see window_specs,
+                     default is the single window given by window, min_obs and min_vol without suffix
+    :return: positions of the month end rows in df, and a dict with the array of every characteristic at these rows
+    """
+    return rolling_many(df, [(name, stat, columns)], window, min_obs, min_vol, horizons)
+
+
+def rolling_many(df, stats, window=3, min_obs=21, min_vol=21, horizons=None, daily=False):
+    """
+    Evaluate several characteristics over the same windows, the windows and the float arrays are built only once.
+    With several horizons, the windows of all the horizons end at the same month end rows, so they are stacked and
+    every stat is called once on all of them: its cumulative sums over the daily data are built once and every extra
+    horizon only costs the lookups at its window offsets.
+
+    :param df: stock dataframe with permno, date, vol and month_count
+    :param stats: list of (name, stat, columns) as in rolling_chars
+    :param window: number of months in a window
+    :param min_obs: we drop the window if observations in it are less than min_obs
+    :param min_vol: we drop the window if non-missing vol in it are less than min_vol
+    :param horizons: list of window specs (suffix, window, min_obs, min_vol), see window_specs, the characteristics
+                     of every horizon are named name + suffix
+    :param daily: windows of the last window trading days ending at every row (see day_windows) instead of the last
+                  window months ending at every month end row, the stats are the same
+    :return: positions of the month end rows (every row with daily) in df, and a dict with the array of every
+             characteristic at these rows
+    """
+    horizons = [('', window, min_obs, min_vol)] if horizons is None else horizons
+    permno = df['permno'].to_numpy()
+    date = df['date'].to_numpy()
+    # sort by permno and date only if df is not sorted yet
+    sorted_rows = (permno[1:] > permno[:-1]) | ((permno[1:] == permno[:-1]) & (date[1:] >= date[:-1]))
+    order = None if sorted_rows.all() else np.lexsort((date, permno))
+    sort = (lambda a: a) if order is None else (lambda a: a[order])
+    permno = sort(permno)
+    month_count = sort(df['month_count'].to_numpy())
+    vol_count = _prefix(sort(df['vol'].notna().to_numpy()).astype(np.int64))
+    # the windows of all the horizons end at the same month end rows (every row with daily)
+    starts = []
+    keeps = []
+    for suffix, months, lo_obs, lo_vol in horizons:
+        start, end = day_windows(permno, months) if daily else month_windows(permno, month_count, months)
+        starts.append(start)
+        keeps.append((end - start >= lo_obs) & (vol_count[end] - vol_count[start] >= lo_vol))
+    # the kept windows of all the horizons, one horizon after the other
+    start_all = np.concatenate([start[keep] for start, keep in zip(starts, keeps)])
+    end_all = np.concatenate([end[keep] for keep in keeps])
+    bounds = np.cumsum([0] + [keep.sum() for keep in keeps])
+    arrays = {}
+    result = {}
+    for name, stat, columns in stats:
+        for col in columns:
+            if col not in arrays:
+                arrays[col] = sort(df[col].to_numpy(dtype=float))
+        names = [name] if isinstance(name, str) else name
+        values = stat(start_all, end_all, *[arrays[col] for col in columns])
+        values = [values] if isinstance(name, str) else values
+        for col, value in zip(names, values):
+            for h, (horizon, keep) in enumerate(zip(horizons, keeps)):
+                result[col + horizon[0]] = np.full(len(end), np.nan)
+                result[col + horizon[0]][keep] = value[bounds[h]:bounds[h + 1]]
+    rows = sort(np.arange(len(df)))[end - 1]
+    return rows, result
+
+
+def window_specs(text, per_month=7):
+    """
+    Parse window specs from the command line, e.g. '1,6,12' or '1:15:15,12'. Every spec is the number of months
+    in the window, then optionally the minimum number of observations and the minimum number of non-missing vol,
+    both per_month times the number of months by default (21 for 3 months, as in the daily scripts).
+
+    :param text: comma separated specs, empty for none
+    :param per_month: default minimum number of days per month in the window
+    :return: list of (suffix, window, min_obs, min_vol), the suffix is _<months>m
+    """
+    horizons = []
+    for spec in (text or '').split(','):
+        if spec.strip() == '':
+            continue
+        parts = [int(v) for v in spec.split(':')]
+        months = parts[0]
+        min_obs = parts[1] if len(parts) > 1 else per_month * months
+        min_vol = parts[2] if len(parts) > 2 else min_obs
+        horizons.append(('_%sm' % months, months, min_obs, min_vol))
+    return horizons
+
+
+# Characteristics of a window, shared by the single characteristic files and daily_chars.py
+# Every function takes the start and end rows of the windows and the columns of the daily data, and returns the
+# characteristic of every window
+
+def capm(start, end, exret, mktrf):
+    # beta, alpha, variance of residual and R^2 of CAPM
+    coef, rvar, r2 = window_ols(start, end, exret, mktrf)
+    return coef[:, 1], coef[:, 0], rvar, r2
+
+
+def rvar_mean(start, end, ret):
+    # variance of return, a missing return counts as 0
+    return window_var(start, end, np.where(np.isnan(ret), 0, ret))
+
+
+def baspread(start, end, askhi, bidlo):
+    # spread of the month end day divided by the average midpoint of the window
+    mid = window_mean(start, end, (askhi + bidlo) / 2)
+    return (askhi[end - 1] - bidlo[end - 1]) / mid
+
+
+def ill(start, end, retadj, prc, vol):
+    # average of absolute return over dollar volume
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return window_mean(start, end, abs(retadj) / (abs(prc) * vol))  ##### Fixed bug on 2025.02.21 #####
+
+
+def maxret(start, end, ret):
+    # maximum daily return and average of the 5 largest daily returns
+    return window_max(start, end, ret), np.nanmean(window_top(start, end, ret, 5), axis=1)
+
+
+def std_dolvol(start, end, vol, prc):
+    # std of log dollar volume, the days without volume are missing
+    with np.errstate(divide='ignore'):
+        dolvol = np.log(abs(vol * prc))
+    return np.sqrt(window_var(start, end, np.where(np.isinf(dolvol), np.nan, dolvol)))
+
+
+def std_turn(start, end, vol, shrout):
+    # std of share turnover, shrout in shares
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt(window_var(start, end, vol / shrout))
+
+
+def zerotrade(start, end, vol, shrout):
+    # number of zero trading days, standardized to 63 days, with the turnover to break the ties
+    countzero = window_count(start, end, vol == 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        turn = vol / shrout
+        turn = window_sum(start, end, np.where(turn == 0, np.inf, turn))
+        return (countzero + (1 / turn) / 11000) * (21 * 3) / (end - start)  ##### Fixed bug on 2025.02.23 #####
+
+
+def row_ranges(permno, n):
+    """
+    Cut the rows sorted by permno into about n contiguous ranges with the same number of rows, a firm is never cut.
+
+    :param permno: permno of every row, sorted by permno and date
+    :param n: number of ranges
+    :return: list of (start, end) row positions, end is exclusive
+    """
+    permno = np.asarray(permno)
+    if len(permno) == 0:
+        return []
+    first = np.flatnonzero(np.concatenate(([True], permno[1:] != permno[:-1])))
+    cut = first[np.minimum(np.searchsorted(first, np.linspace(0, len(permno), n + 1)[1:-1]), len(first) - 1)]
+    bounds = np.unique(np.concatenate(([0], cut, [len(permno)])))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# shared memory blocks attached by the current process, name -> array
+_shared = {}
+
+
+def _share(arrays):
+    # copy arrays into new shared memory blocks, return the blocks and how to attach to them
+    blocks = {}
+    spec = {}
+    for col, arr in arrays.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+        blocks[col] = shm
+        spec[col] = (shm.name, arr.dtype.str, arr.shape)
+    return blocks, spec
+
+
+def _attach(inputs, outputs, rows):
+    # pool initializer, keep the blocks in _shared so the arrays stay valid
+    for kind, spec in (('inputs', inputs), ('outputs', outputs), ('rows', rows)):
+        _shared[kind] = {}
+        for col, (name, dtype, shape) in spec.items():
+            shm = shared_memory.SharedMemory(name=name)
+            _shared.setdefault('blocks', []).append(shm)
+            _shared[kind][col] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _run_range(func, start, end, firm_list, out_dir=None, checkpoint=None):
+    # build the dataframe of rows start to end from the shared inputs and write the results to the shared outputs,
+    # or to the files of out_dir, and to a chunk file of the checkpoint
+    df = pd.DataFrame({col: arr[start:end] for col, arr in _shared['inputs'].items()})
+    rows, result = func(df, firm_list)
+    if out_dir is not None:
+        _write_range(out_dir, start, df.iloc[rows], result)
+        return end - start
+    rows = start + rows
+    if 'rows' in _shared['rows']:
+        # the outputs only have the output rows, find the output position of every result row
+        out_rows = _shared['rows']['rows']
+        pos = np.minimum(np.searchsorted(out_rows, rows), len(out_rows) - 1)
+        found = out_rows[pos] == rows
+        rows, result = pos[found], {col: value[found] for col, value in result.items()}
+    for col, arr in _shared['outputs'].items():
+        arr[rows] = result[col]
+    if checkpoint:
+        path = _chunk(checkpoint, start)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, rows=rows, **{col: result[col] for col in _shared['outputs']})
+        os.replace(path + '.tmp', path)
+    return end - start
+
+
+def _chunk(checkpoint, start):
+    # chunk file of the range of rows starting at start
+    return os.path.join(checkpoint, 'chunk-%012d.npz' % start)
+
+
+def _fingerprint(arrays, tag):
+    # digest of the input arrays and of the run options, a checkpoint is only used by the run with the same digest
+    digest = hashlib.blake2b(digest_size=16)
+    for col in sorted(arrays):
+        arr = np.ascontiguousarray(arrays[col])
+        digest.update(('%s %s %s' % (col, arr.dtype.str, arr.shape)).encode())
+        digest.update(arr.view(np.uint8))
+    digest.update(repr(tag).encode())
+    return digest.hexdigest()
+
+
+def _read_manifest(checkpoint, fingerprint):
+    # manifest of the checkpoint if it was written by a run on the same data, otherwise start a new checkpoint
+    path = os.path.join(checkpoint, '_manifest.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get('fingerprint') == fingerprint:
+            return manifest
+        _clear_checkpoint(checkpoint)
+    elif os.path.isdir(checkpoint) and os.listdir(checkpoint):
+        # not a checkpoint, it may be any directory of the user
+        raise ValueError('%s is not empty and has no _manifest.json, it is not a checkpoint: choose another '
+                         '--checkpoint directory or remove it' % checkpoint)
+    os.makedirs(checkpoint, exist_ok=True)
+    return None
+
+
+def _clear_checkpoint(checkpoint):
+    # remove the files of a checkpoint written by another run (chunk files, manifest and the Parquet files of its year
+    # partitions), the other files of the directory are kept
+    for name in os.listdir(checkpoint):
+        path = os.path.join(checkpoint, name)
+        if (name.startswith('chunk-') and name.endswith(('.npz', '.npz.tmp'))) or \
+                name in ('_manifest.json', '_manifest.json.tmp'):
+            os.remove(path)
+        elif name.startswith('year=') and os.path.isdir(path):
+            for part in os.listdir(path):
+                if part.startswith('part-') and part.endswith(('.parquet', '.parquet.tmp')):
+                    os.remove(os.path.join(path, part))
+            if not os.listdir(path):
+                os.rmdir(path)
+
+
+def _write_manifest(checkpoint, manifest):
+    path = os.path.join(checkpoint, '_manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def _write_range(out_dir, start, df, result):
+    # one Parquet file per year and range of rows, named by the first row of the range, in out_dir/year=YYYY/
+    table = pd.DataFrame({'permno': df['permno'].to_numpy(), 'date': df['date'].to_numpy()})
+    for col, value in result.items():
+        table[col] = value
+    year = table['date'].dt.year.to_numpy()
+    for y in np.unique(year):
+        path = os.path.join(out_dir, 'year=%s' % y, 'part-%012d.parquet' % start)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table[year == y].reset_index(drop=True).to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+
+def run_shared(df, df_firm, func, columns, names, processes, tasks=4, rows=None, out_dir=None, checkpoint=None,
+               tag=None):
+    """
+    Run a get_* function of a daily script over all the firms with a pool of processes.
+    The columns are copied once into shared memory, every task is a contiguous range of rows (whole firms) that the
+    worker reads from the shared arrays by offset, and the results are written into preallocated shared output
+    arrays, so no dataframe is pickled and nothing is concatenated. The ranges have about the same number of daily
+    rows (see row_ranges), so that no process waits for a range full of long-lived firms.
+
+    :param df: stock dataframe sorted by permno and date
+    :param df_firm: firm list with one row per permno in the same order as df
+    :param func: get_* function taking a stock dataframe and its firm list, and returning rolling_chars results
+    :param columns: columns used by func, besides permno, date, vol and month_count
+    :param names: names of the characteristic columns returned by func
+    :param processes: number of processes
+    :param tasks: number of tasks per process, small tasks keep all the processes busy until the end
+    :param rows: sorted positions of the rows kept in the output, e.g. the month end rows from month_index, the
+                 output arrays then only have these rows instead of every daily row, default is all the rows
+    :param out_dir: directory of Parquet files partitioned by year, every task writes the rows returned by func to its
+                    own files there instead of the shared outputs, so the results are never all in memory
+    :param checkpoint: directory where every finished range of rows is written to a chunk file (its Parquet files
+                       with out_dir, which can be the checkpoint itself) and recorded in _manifest.json. A run on the
+                       same data and with the same tag skips the ranges of the manifest and reads their chunk files,
+                       any other run starts a new checkpoint (it only removes the chunk files, the manifest and the
+                       Parquet files of the checkpoint, a directory with other files and no manifest is refused).
+                       None for no checkpoint
+    :param tag: options of the run that change the results besides the data and names, e.g. the window length
+    :return: dataframe with permno, date and the characteristics of every row (of rows), None with out_dir
+    """
+    columns = ['permno', 'date', 'vol', 'month_count'] + [col for col in columns if col not in
+                                                          ['permno', 'date', 'vol', 'month_count']]
+    permno = df['permno'].to_numpy()
+    ranges = row_ranges(permno, processes * tasks)
+    ranges = sorted(ranges, key=lambda r: r[0] - r[1])  # largest first
+    firm_start = np.flatnonzero(np.concatenate(([True], permno[1:] != permno[:-1])))
+    done = set()
+    if checkpoint:
+        arrays = {col: df[col].to_numpy() for col in columns}
+        if rows is not None:
+            arrays['out_rows'] = np.asarray(rows, dtype=np.int64)
+        fingerprint = _fingerprint(arrays, (list(names), tag))
+        del arrays
+        manifest = _read_manifest(checkpoint, fingerprint)
+        if manifest is None:
+            manifest = {'fingerprint': fingerprint, 'ranges': [[int(s), int(e)] for s, e in ranges], 'done': []}
+            _write_manifest(checkpoint, manifest)
+        # the ranges of the first run, the number of processes may have changed
+        ranges = [tuple(r) for r in manifest['ranges']]
+        done = set(tuple(r) for r in manifest['done'])
+        print('checkpoint %s: %s of %s ranges done' % (checkpoint, len(done), len(ranges)))
+
+        def record(r):
+            manifest['done'].append(list(r))
+            _write_manifest(checkpoint, manifest)
+    in_blocks, in_spec = _share({col: df[col].to_numpy() for col in columns})
+    n = len(df) if rows is None else len(rows)
+    out_blocks, out_spec = _share({} if out_dir else {name: np.full(n, np.nan) for name in names})
+    row_blocks, row_spec = _share({} if rows is None else {'rows': np.asarray(rows, dtype=np.int64)})
+    try:
+        if not out_dir:
+            # the ranges done by an earlier run come from their chunk files
+            for start, end in done:
+                with np.load(_chunk(checkpoint, start)) as chunk:
+                    for name in names:
+                        np.ndarray(n, dtype=float, buffer=out_blocks[name].buf)[chunk['rows']] = chunk[name]
+        # the chunks of out_dir are its Parquet files, the workers only write a chunk file of the shared outputs
+        chunks = None if out_dir else checkpoint
+        with mp.Pool(processes, initializer=_attach, initargs=(in_spec, out_spec, row_spec)) as pool:
+            results = []
+            for start, end in ranges:
+                if (start, end) in done:
+                    continue
+                firms = df_firm.iloc[np.searchsorted(firm_start, start):np.searchsorted(firm_start, end)]
+                # the manifest is written as soon as a range is finished, whatever the order
+                callback = (lambda res, r=(start, end): record(r)) if checkpoint else None
+                results.append(pool.apply_async(_run_range, (func, start, end, firms, out_dir, chunks),
+                                                callback=callback))
+            finished = sum(end - start for start, end in done)
+            for res in results:
+                finished += res.get()
+                print('finished', '%.2f%%' % (finished / len(df) * 100))
+        if out_dir:
+            return None
+        take = (lambda a: a) if rows is None else (lambda a: a[rows])
+        result = pd.DataFrame({'permno': take(df['permno'].to_numpy()), 'date': take(df['date'].to_numpy())})
+        for name in names:
+            result[name] = np.ndarray(n, dtype=float, buffer=out_blocks[name].buf).copy()
+    finally:
+        for shm in list(in_blocks.values()) + list(out_blocks.values()) + list(row_blocks.values()):
+            shm.close()
+            shm.unlink()
+    return result
+
+
+def daily_args():
+    """
+    Command line options of the daily characteristic scripts, e.g. python beta.py --processes 8 --update
+
+    :return: parsed options
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help='number of worker processes, all the CPUs by default')
+    parser.add_argument('--update', action='store_true',
+                        help='only compute the new months and append them to the existing output file')
+    parser.add_argument('--windows', default='',
+                        help='daily_chars.py only: extra windows computed in the same pass, months[:min_obs[:min_vol]] '
+                             'separated by commas, e.g. 1,6,12 adds the columns name_1m, name_6m and name_12m')
+    parser.add_argument('--daily', action='store_true',
+                        help='daily_chars.py only: compute the characteristics at every trading day over the last '
+                             '--days trading days, and write them to Parquet files partitioned by year. The month_end '
+                             'rows of this panel are not the values of the month end files, which use windows of 3 '
+                             'calendar months (the month end files are not a subsample of the daily panel)')
+    parser.add_argument('--days', type=int, default=63, help='number of trading days of the --daily windows')
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    parser.add_argument('--checkpoint', default=os.path.join('checkpoint', script),
+                        help='directory of the chunk files of the finished ranges of firms, a run on the same data '
+                             'skips them (checkpoint/<script> by default, empty for no checkpoint)')
+    parser.add_argument('--all-securities', dest='universe', action='store_false',
+                        help='compute the characteristics of all the securities of crsp.dsf, not only the universe of '
+                             'the final panel (EXCHCD and SHRCD in crsp_cache.py)')
+    return parser.parse_known_args()[0]
+
+
+def update_from(path, update, window=3, buffer=12):
+    """
+    Where an incremental run (--update) starts. The months before the last month in the output file are final, the
+    last month is computed again because it may have been computed before the end of the month. The windows of the
+    new months need the daily data of the window - 1 months before them, we load buffer more months for the firms
+    with months without trading in the window (a gap longer than buffer months gives a shorter window).
+
+    :param path: output file of the script
+    :param update: --update option, if False or if there is no output file yet, everything is computed
+    :param window: number of months in a window
+    :param buffer: number of extra months of daily data loaded
+    :return: rows of the output file to keep, first date of the months to compute and first date of daily data to
+             load, all None when everything is computed
+    """
+    if not update or not os.path.exists(path):
+        return None, None, None
+    old = pd.read_feather(path)
+    if len(old) == 0:
+        return None, None, None
+    last = pd.Timestamp(old['date'].max()).to_period('M')
+    first_date = last.start_time
+    old = old[old['date'] < first_date].reset_index(drop=True)
+    start = (last - (window - 1) - buffer).start_time
+    print('update %s from %s, loading daily data from %s' % (path, first_date.date(), start.date()))
+    return old, first_date, start
+
+
+def append_update(old, new, first_date):
+    """
+    Append the months computed by an incremental run to the rows kept from the output file.
+
+    :param old: rows kept from the output file, from update_from
+    :param new: output of the run, with permno and date
+    :param first_date: first date of the months to compute, from update_from
+    :return: new if this is not an incremental run, otherwise old and the new months sorted by permno and date
+    """
+    if old is None:
+        return new
+    new = new[new['date'] >= first_date]
+    return pd.concat([old, new], ignore_index=True).sort_values(['permno', 'date']).reset_index(drop=True)
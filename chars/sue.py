@@ -4,21 +4,23 @@
 import pandas as pd
 import numpy as np
 import datetime as dt
-import wrds
+from offline_wrds import connect
 from dateutil.relativedelta import *
 from pandas.tseries.offsets import *
 from pandasql import *
 import pickle as pkl
 import pyarrow.feather as feather
+from instrument import stage, count
 
 ###################
 # Connect to WRDS #
 ###################
-conn = wrds.Connection()
+conn = connect()
 
 ###################
 # Compustat Block #
 ###################
+stage('fetch comp.fundq and ccm link')
 comp = conn.raw_sql("""
                         select gvkey, datadate, fyearq, fqtr, epspxq, ajexq
                         from comp.fundq
@@ -46,6 +48,9 @@ ccm['linkenddt'] = pd.to_datetime(ccm['linkenddt'])
 # if linkenddt is missing then set to today date
 ccm['linkenddt'] = ccm['linkenddt'].fillna(pd.to_datetime('today'))
 
+count(len(comp))
+
+stage('sue', rows=len(comp))
 ccm1 = pd.merge(comp, ccm, how='left', on=['gvkey'])
 
 # set link date bounds
@@ -94,6 +99,7 @@ ccm2['sue_std'] = np.select(condlist, choicelist, default=np.nan)
 
 ccm2['sue'] = (ccm2['eps'] - ccm2['e4'])/ccm2['sue_std']
 
+stage('populate to monthly', rows=len(ccm2))
 # populate the quarterly sue to monthly
 crsp_msf = conn.raw_sql("""
                         select distinct date
@@ -115,5 +121,6 @@ df = df.drop_duplicates(['permno', 'date'])
 df['datadate'] = pd.to_datetime(df['datadate'])
 df = df[['gvkey', 'permno', 'datadate', 'date', 'sue']]
 
+stage('write')
 with open('sue.feather', 'wb') as f:
     feather.write_feather(df, f)
\ No newline at end of file